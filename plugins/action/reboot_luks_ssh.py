@@ -23,20 +23,78 @@
 # https://github.com/ansible/ansible/blob/v2.16.3/lib/ansible/plugins/action/reboot.py
 # taken at 2024-02-21.
 
-from datetime import datetime, timedelta, timezone
-from random import random
+import contextlib
+from datetime import datetime, timezone
+import os
+import shlex
 import subprocess
 import time
 
 from ansible.errors import AnsibleActionFail
 from ansible.errors import AnsibleConnectionFailure
 from ansible.module_utils._text import to_text
+from ansible.module_utils.basic import missing_required_lib
 from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.action.reboot import (
     ActionModule as RebootActionModule,
     TimedOutException,
 )
 from ansible.utils.display import Display
+from ansible_collections.riskident.luks.plugins.module_utils.boot_profile import (
+    SAMPLE_DROPBEAR,
+    SAMPLE_SSHD,
+    BootProfileCache,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.luks_volumes import (
+    VolumePromptResponder,
+    parse_luks_volumes,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.phase_timer import PhaseTimer
+from ansible_collections.riskident.luks.plugins.module_utils.retry_scheduler import (
+    DEFAULT_FAST_INTERVAL,
+    DEFAULT_FAST_WINDOW,
+    DEFAULT_MAX_INTERVAL,
+    RetryScheduler,
+    validate_retry_intervals,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.run_id import default_run_id
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_agent_lease import SSHAgentKeyLease
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_CONFIG,
+    REASON_EXIT_STATUS,
+    REASON_STOP_KEYWORD,
+    LuksSSHError,
+    classify_error,
+    classify_openssh_output,
+    is_permanent,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_output import (
+    StopKeywordMatcher,
+    run_ssh_process,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_paramiko import (
+    HAS_PARAMIKO,
+    PARAMIKO_IMPORT_ERROR,
+    ParamikoUnlockClient,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_probe import (
+    HOST_UNREACHABLE,
+    HOST_UP,
+    HOST_WAITING,
+    SSHProbeTimeout,
+    classify_host_state,
+    parse_ssh_config,
+    probe_host_state,
+    probe_ssh_banner,
+    ssh_config_proxied,
+    wait_for_ssh_banner,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.unlock_metrics import (
+    ERROR_BOOT_TIME_UNCHANGED,
+    UnlockMetrics,
+    result_outcome,
+    validate_labels,
+)
 
 display = Display()
 
@@ -62,6 +120,7 @@ class ActionModule(RebootActionModule):
         'luks_ssh_executable',
         'luks_ssh_connect_timeout',
         'luks_ssh_timeout',
+        'luks_ssh_reconnect_timeout',
         'luks_ssh_options',
         'post_unlock_delay',
         'luks_ssh_keygen_executable',
@@ -69,6 +128,31 @@ class ActionModule(RebootActionModule):
         'luks_ssh_add_timeout',
         'luks_stop_retry_on_output',
         'luks_manual_unlock_on_fail',
+        'luks_ssh_probe',
+        'luks_ssh_probe_interval',
+        'luks_ssh_backend',
+        'luks_boot_profile_cache',
+        'luks_boot_profile_margin',
+        'luks_sshd_probe',
+        'luks_sshd_probe_host_key',
+        'luks_ssh_keyscan_executable',
+        'luks_ssh_attempt_timeout',
+        'reboot_method',
+        'kexec_kernel',
+        'kexec_initrd',
+        'luks_volumes',
+        'luks_unlock_waiting',
+        'luks_metrics_file',
+        'luks_metrics_textfile',
+        'luks_metrics_labels',
+        'luks_ssh_preflight',
+        'luks_auto_unlock_timeout',
+        'luks_initramfs_preflight',
+        'luks_initramfs_preflight_network',
+        'luks_initramfs_image',
+        'luks_retry_fast_interval',
+        'luks_retry_fast_window',
+        'luks_retry_max_interval',
     ))
 
     # These delays actually speed up the process, as w/o them the script will:
@@ -78,6 +162,10 @@ class ActionModule(RebootActionModule):
     #
     # With the delay the script will: reboot machine, sleep 10s, try unlock via
     # SSH, sleep 5s, try ping via SSH, success! Totaling around 20s.
+    #
+    # The post-reboot delay is only used when luks_ssh_probe is disabled.
+    # The probe instead waits for Dropbear's SSH banner, which is both faster
+    # and more reliable than a fixed sleep.
     DEFAULT_POST_REBOOT_DELAY = 10  # reboot module has 0 as default
     DEFAULT_POST_UNLOCK_DELAY = 5
 
@@ -97,8 +185,51 @@ class ActionModule(RebootActionModule):
     ]
     DEFAULT_LUKS_SSH_RECONNECT_TIMEOUT = 3600
     DEFAULT_LUKS_MANUAL_UNLOCK_ON_FAIL = True
+    DEFAULT_LUKS_SSH_PROBE = True
+    DEFAULT_LUKS_SSH_PROBE_INTERVAL = 0.5
+    DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT = 2
+    DEFAULT_LUKS_SSH_BACKEND = "openssh"
+    DEFAULT_LUKS_BOOT_PROFILE_MARGIN = 2
+    DEFAULT_LUKS_SSHD_PROBE = True
+    DEFAULT_LUKS_SSHD_PROBE_HOST_KEY = False
+    DEFAULT_LUKS_SSH_KEYSCAN_EXECUTABLE = "ssh-keyscan"
+    LUKS_SSH_BACKENDS = ("openssh", "paramiko")
+    DEFAULT_REBOOT_METHOD = "reboot"
+    REBOOT_METHODS = ("reboot", "kexec")
+    DEFAULT_KEXEC_KERNEL = '/boot/vmlinuz-"$(uname -r)"'
+    DEFAULT_KEXEC_INITRD = '/boot/initrd.img-"$(uname -r)"'
+    DEFAULT_LUKS_UNLOCK_WAITING = "never"
+    LUKS_UNLOCK_WAITING_MODES = ("never", "auto", "only")
+    DEFAULT_LUKS_SSH_PREFLIGHT = True
+    DEFAULT_LUKS_SSH_PREFLIGHT_TIMEOUT = 10
+    DEFAULT_LUKS_AUTO_UNLOCK_TIMEOUT = 0
+    DEFAULT_LUKS_INITRAMFS_PREFLIGHT = False
+    DEFAULT_LUKS_INITRAMFS_PREFLIGHT_NETWORK = False
+    DEFAULT_LUKS_RETRY_FAST_INTERVAL = DEFAULT_FAST_INTERVAL
+    DEFAULT_LUKS_RETRY_FAST_WINDOW = DEFAULT_FAST_WINDOW
+    DEFAULT_LUKS_RETRY_MAX_INTERVAL = DEFAULT_MAX_INTERVAL
+
+    # SSH options that make the connection not go directly to the target,
+    # in which case the TCP probe would not reach Dropbear.
+    LUKS_SSH_PROXY_OPTIONS = ("proxyjump", "proxycommand")
 
     _has_added_key_to_ssh_agent = False
+    _ssh_agent_lease = None
+    _paramiko_client = None
+    _phase_timer = None
+    _retry_schedulers = None
+    _boot_profile = None
+    _boot_profile_host = None
+    _luks_ssh_banner = None
+    # Addresses to probe, keyed by "luks" and "sshd", as resolved by
+    # resolve_probe_addrs. None if reached through a proxy.
+    _probe_addrs = None
+    _luks_ssh_server_confirmed = False
+    _auto_unlocked = False
+    _luks_ssh_host_keys = None
+    _luks_volume_responder = None
+    _metrics = None
+    _metrics_start = None
 
     def _try_get_connection_option(self, option):
         try:
@@ -124,6 +255,17 @@ class ActionModule(RebootActionModule):
                         "parse %s" % name, orig_exc=e)
         return None
 
+    def _get_task_arg_float(self, *names: str):
+        for name in names:
+            value = self._task.args.get(name)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError as e:
+                    raise AnsibleActionFail(
+                        "parse %s" % name, orig_exc=e)
+        return None
+
     @property
     def connection_timeout(self):
         return self._try_get_connection_option('connection_timeout')
@@ -193,14 +335,270 @@ class ActionModule(RebootActionModule):
         # https://github.com/ansible/ansible/blob/v2.12.6/lib/ansible/plugins/action/__init__.py#L879
         return self._play_context.remote_addr
 
+    @property
+    def remote_port(self):
+        return self._try_get_connection_option('port') or self._play_context.port or 22
+
+    @property
+    def phase_timer(self):
+        if self._phase_timer is None:
+            self._phase_timer = PhaseTimer()
+        return self._phase_timer
+
+    @property
+    def retry_schedulers(self):
+        if self._retry_schedulers is None:
+            self._retry_schedulers = []
+        return self._retry_schedulers
+
     @property
     def post_unlock_delay(self):
-        return self._get_task_arg("post_unlock_delay") or self.DEFAULT_POST_UNLOCK_DELAY
+        value = self._get_task_arg_int("post_unlock_delay")
+        if value is not None:
+            # An explicit 0 disables the delay
+            return max(0, value)
+        profile_delay = self.get_boot_profile_delay(SAMPLE_SSHD)
+        if profile_delay is not None:
+            return profile_delay
+        # Only fall back to the fixed delay when not probing for sshd
+        if self.luks_sshd_probe:
+            return 0
+        return self.DEFAULT_POST_UNLOCK_DELAY
+
+    @property
+    def luks_sshd_probe(self):
+        value = self._task.args.get('luks_sshd_probe')
+        if value is not None:
+            return boolean(value)
+        for option in ('ssh_args', 'ssh_common_args', 'ssh_extra_args'):
+            args = self._try_get_connection_option(option) or ''
+            if any(proxy in args.casefold() for proxy in self.LUKS_SSH_PROXY_OPTIONS):
+                # The probe would not reach sshd through the proxy
+                return False
+        if self._probe_addrs is not None and self._probe_addrs.get('sshd') is None:
+            # Proxied by the SSH config
+            return False
+        return self.DEFAULT_LUKS_SSHD_PROBE
+
+    @property
+    def luks_sshd_probe_host_key(self):
+        value = self._task.args.get('luks_sshd_probe_host_key')
+        if value is None:
+            return self.DEFAULT_LUKS_SSHD_PROBE_HOST_KEY
+        return boolean(value)
+
+    @property
+    def luks_ssh_keyscan_executable(self):
+        return self._get_task_arg("luks_ssh_keyscan_executable") or self.DEFAULT_LUKS_SSH_KEYSCAN_EXECUTABLE
 
     @property
     def luks_stop_retry_on_output(self):
         return self._get_task_arg("luks_stop_retry_on_output") or self.DEFAULT_LUKS_STOP_RETRY_ON_OUTPUT
 
+    @property
+    def reboot_method(self):
+        return self._get_task_arg("reboot_method") or self.DEFAULT_REBOOT_METHOD
+
+    @property
+    def kexec_kernel(self):
+        return self._get_task_arg("kexec_kernel") or self.DEFAULT_KEXEC_KERNEL
+
+    @property
+    def kexec_initrd(self):
+        return self._get_task_arg("kexec_initrd") or self.DEFAULT_KEXEC_INITRD
+
+    @property
+    def luks_unlock_waiting(self):
+        return self._get_task_arg("luks_unlock_waiting") or self.DEFAULT_LUKS_UNLOCK_WAITING
+
+    @property
+    def luks_auto_unlock_timeout(self):
+        return self._get_task_arg_int("luks_auto_unlock_timeout") or self.DEFAULT_LUKS_AUTO_UNLOCK_TIMEOUT
+
+    @property
+    def luks_ssh_attempt_timeout(self):
+        return self._get_task_arg_int("luks_ssh_attempt_timeout")
+
+    @property
+    def luks_volumes(self):
+        volumes = self._get_task_arg("luks_volumes")
+        if not volumes:
+            return None
+        try:
+            return parse_luks_volumes(volumes, self.luks_password)
+        except ValueError as e:
+            raise AnsibleActionFail(to_text(e))
+
+    def get_luks_volume_responder(self):
+        # Created once per task, so the unlocked volumes are remembered
+        # between retries
+        if self._luks_volume_responder is None:
+            luks_volumes = self.luks_volumes
+            if luks_volumes is None:
+                return None
+            luks_password = self.luks_password
+            self._luks_volume_responder = VolumePromptResponder(
+                luks_volumes, str(luks_password) if luks_password else None)
+        self._luks_volume_responder.new_session()
+        return self._luks_volume_responder
+
+    def get_luks_stdin_data(self, responder):
+        # With luks_volumes, the passphrases are only written when prompted
+        if responder is not None:
+            return ""
+        return str(self.luks_password)
+
+    @property
+    def luks_metrics_file(self):
+        return self._get_task_arg("luks_metrics_file")
+
+    @property
+    def luks_metrics_textfile(self):
+        return self._get_task_arg("luks_metrics_textfile")
+
+    @property
+    def luks_metrics_labels(self):
+        return self._get_task_arg("luks_metrics_labels") or {}
+
+    def validate_luks_metrics(self):
+        if self.luks_metrics_textfile and not self.luks_metrics_file:
+            # The summary is rendered from the events of all hosts
+            raise AnsibleActionFail("luks_metrics_textfile requires luks_metrics_file")
+        try:
+            validate_labels(self.luks_metrics_labels)
+        except ValueError as e:
+            raise AnsibleActionFail("luks_metrics_labels: %s" % e)
+
+    def setup_metrics(self, host: str):
+        path = self.luks_metrics_file
+        if not path:
+            return
+        self._metrics = UnlockMetrics(path, default_run_id(), host, self.luks_metrics_labels)
+        self._metrics_start = time.monotonic()
+
+    def write_metrics(self, write):
+        # Metrics must never fail the reboot
+        try:
+            write()
+        except (OSError, ValueError) as e:
+            display.warning("{action}: Failed writing metrics, error: {error}".format(
+                action=self._task.action, error=e))
+
+    @contextlib.contextmanager
+    def metrics_attempt(self, phase: str, attempt: int, error_classes: dict = None):
+        """Records the attempt that runs in the with block, if enabled.
+
+        The error_classes map exception types to the error class to record,
+        for those that classify_error cannot tell apart."""
+        if self._metrics is None:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        except StopRetryLoop as e:
+            self.write_metrics(lambda: self._metrics.attempt(phase, attempt, time.monotonic() - start, e.exception))
+            raise
+        except Exception as e:
+            error = (error_classes or {}).get(type(e), e)
+            self.write_metrics(lambda: self._metrics.attempt(phase, attempt, time.monotonic() - start, error))
+            raise
+        self.write_metrics(lambda: self._metrics.attempt(phase, attempt, time.monotonic() - start))
+
+    def record_metrics_result(self, result: dict):
+        if self._metrics is None:
+            return
+        outcome = result_outcome(result)
+        duration = time.monotonic() - self._metrics_start
+        self.write_metrics(lambda: self._metrics.phases(self.phase_timer.as_dict()))
+        self.write_metrics(lambda: self._metrics.result(outcome, duration, bool(result.get('rebooted'))))
+        textfile = self.luks_metrics_textfile
+        if textfile:
+            self.write_metrics(lambda: self._metrics.write_textfile(textfile))
+
+    @property
+    def luks_ssh_preflight(self):
+        # Cannot use "or" here to see if it's unset, as the data type is bool
+        value = self._task.args.get('luks_ssh_preflight')
+        if value is None:
+            return self.DEFAULT_LUKS_SSH_PREFLIGHT
+        return boolean(value)
+
+    @property
+    def luks_initramfs_preflight(self):
+        # Cannot use "or" here to see if it's unset, as the data type is bool
+        value = self._task.args.get('luks_initramfs_preflight')
+        if value is None:
+            return self.DEFAULT_LUKS_INITRAMFS_PREFLIGHT
+        return boolean(value)
+
+    @property
+    def luks_initramfs_preflight_network(self):
+        # Cannot use "or" here to see if it's unset, as the data type is bool
+        value = self._task.args.get('luks_initramfs_preflight_network')
+        if value is None:
+            return self.DEFAULT_LUKS_INITRAMFS_PREFLIGHT_NETWORK
+        return boolean(value)
+
+    @property
+    def luks_retry_fast_interval(self):
+        return self._get_task_arg_float("luks_retry_fast_interval") or self.DEFAULT_LUKS_RETRY_FAST_INTERVAL
+
+    @property
+    def luks_retry_fast_window(self):
+        # Cannot use "or" here, as 0 disables the fast polling
+        value = self._get_task_arg_float("luks_retry_fast_window")
+        if value is None:
+            return self.DEFAULT_LUKS_RETRY_FAST_WINDOW
+        return value
+
+    @property
+    def luks_retry_max_interval(self):
+        return self._get_task_arg_float("luks_retry_max_interval") or self.DEFAULT_LUKS_RETRY_MAX_INTERVAL
+
+    def get_retry_scheduler(self, name: str, timeout: float):
+        """Returns the scheduler of the sleeps between the attempts of a
+        retry loop. Override to change how the loops poll."""
+        return RetryScheduler(
+            name, timeout,
+            fast_interval=self.luks_retry_fast_interval,
+            fast_window=self.luks_retry_fast_window,
+            max_interval=self.luks_retry_max_interval)
+
+    def get_luks_ssh_attempt_timeout(self, scheduler: RetryScheduler):
+        """Returns the timeout of a single SSH unlock attempt, which never
+        runs past the deadline of the unlock retry loop, even if
+        luks_ssh_attempt_timeout is not set. E.g a session with luks_volumes
+        keeps STDIN open, and would otherwise hang for good if the prompt is
+        not recognized."""
+        remaining = scheduler.remaining()
+        if self.luks_ssh_attempt_timeout is None:
+            return remaining
+        return min(self.luks_ssh_attempt_timeout, remaining)
+
+    @property
+    def luks_initramfs_image(self):
+        return self._get_task_arg("luks_initramfs_image")
+
+    def get_initramfs_image(self):
+        """Returns the initramfs image that the reboot boots into, or None
+        for the default of the initramfs_inspect module."""
+        image = self.luks_initramfs_image
+        if image is None and self.reboot_method == "kexec":
+            # Evaluated by the remote shell, the same way as for kexec
+            result = self._low_level_execute_command("printf '%s\\n' {initrd}".format(initrd=self.kexec_initrd))
+            if result['rc'] != 0:
+                raise AnsibleActionFail("Failed evaluating kexec_initrd: {error}".format(
+                    error=(result['stderr'] or result['stdout']).strip()))
+            image = result['stdout'].strip()
+        return image
+
+    def get_stop_keyword_matcher(self, client_output=True):
+        # New matcher per attempt, as it keeps the last incomplete line.
+        # The paramiko backend only gets the output of the remote session,
+        # without messages of the SSH client.
+        return StopKeywordMatcher(self.luks_stop_retry_on_output, client_output=client_output)
+
     @property
     def luks_manual_unlock_on_fail(self):
         # Cannot use "or" here to see if it's unset, as the data type is bool
@@ -209,7 +607,195 @@ class ActionModule(RebootActionModule):
             return self.DEFAULT_LUKS_MANUAL_UNLOCK_ON_FAIL
         return boolean(value)
 
-    def get_luks_ssh_args(self):
+    @property
+    def luks_ssh_probe(self):
+        value = self._task.args.get('luks_ssh_probe')
+        if value is not None:
+            return boolean(value)
+        for opt in self.luks_ssh_options:
+            if opt.strip().casefold().startswith(self.LUKS_SSH_PROXY_OPTIONS):
+                # The probe would not reach Dropbear through the proxy
+                return False
+        if self._probe_addrs is not None and self._probe_addrs.get('luks') is None:
+            # Proxied by the SSH config
+            return False
+        return self.DEFAULT_LUKS_SSH_PROBE
+
+    @property
+    def luks_ssh_probe_addr(self):
+        return (self._probe_addrs or {}).get('luks') or self.remote_addr
+
+    @property
+    def sshd_probe_addr(self):
+        return (self._probe_addrs or {}).get('sshd') or self.remote_addr
+
+    def get_sshd_config_args(self):
+        # Same SSH config as Ansible's ssh connection sees
+        args = [self._try_get_connection_option('ssh_executable') or self.DEFAULT_LUKS_SSH_EXECUTABLE, '-G']
+        for option in ('ssh_args', 'ssh_common_args', 'ssh_extra_args'):
+            args.extend(shlex.split(self._try_get_connection_option(option) or ''))
+        args.extend(['-p', str(self.remote_port), self.remote_addr])
+        return args
+
+    def resolve_ssh_config_addr(self, args):
+        """Returns the HostName that "ssh -G" resolves to, or None if the SSH
+        client connects through a proxy. Falls back to remote_addr if the
+        SSH config cannot be read."""
+        try:
+            result = subprocess.run(
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                timeout=self.DEFAULT_LUKS_SSH_PREFLIGHT_TIMEOUT,
+                check=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            display.vvv("{action}: Failed reading SSH config via {executable} -G, probing {addr}: {error}".format(
+                action=self._task.action, executable=args[0], addr=self.remote_addr, error=e))
+            return self.remote_addr
+        return self.get_ssh_config_probe_addr(result.stdout, self.remote_addr)
+
+    @staticmethod
+    def get_ssh_config_probe_addr(output: str, remote_addr: str):
+        config = parse_ssh_config(output)
+        if ssh_config_proxied(config):
+            return None
+        return config.get('hostname') or remote_addr
+
+    def resolve_probe_addrs(self):
+        """Resolves the addresses to probe through the SSH config, e.g for a
+        Host alias with a HostName. Ports that the SSH config reaches through
+        a ProxyJump or ProxyCommand are not probed, as the probe would only
+        time out."""
+        probe_addrs = {}
+        if self.luks_ssh_probe:
+            probe_addrs['luks'] = self.resolve_ssh_config_addr(self.get_luks_ssh_config_args())
+        if self.luks_sshd_probe:
+            probe_addrs['sshd'] = self.resolve_ssh_config_addr(self.get_sshd_config_args())
+        self._probe_addrs = probe_addrs
+        for name, addr in probe_addrs.items():
+            if addr is None:
+                display.vvv("{action}: SSH config connects to the {name} port through a proxy, not probing it".format(
+                    action=self._task.action, name=name))
+            elif addr != self.remote_addr:
+                display.vvv("{action}: SSH config resolves {remote_addr} to {addr}, probing the {name} port there".format(
+                    action=self._task.action, remote_addr=self.remote_addr, addr=addr, name=name))
+
+    @property
+    def luks_ssh_probe_interval(self):
+        return self._get_task_arg_float("luks_ssh_probe_interval") or self.DEFAULT_LUKS_SSH_PROBE_INTERVAL
+
+    @property
+    def luks_ssh_backend(self):
+        return self._get_task_arg("luks_ssh_backend") or self.DEFAULT_LUKS_SSH_BACKEND
+
+    @property
+    def post_reboot_delay(self):
+        if self._get_task_arg('post_reboot_delay', 'post_reboot_delay_sec') is None:
+            profile_delay = self.get_boot_profile_delay(SAMPLE_DROPBEAR)
+            if profile_delay is not None:
+                return profile_delay
+        # Only fall back to the fixed delay when not probing for Dropbear
+        default = 0 if self.luks_ssh_probe else self.DEFAULT_POST_REBOOT_DELAY
+        return self._check_delay('post_reboot_delay', default)
+
+    @property
+    def luks_boot_profile_cache(self):
+        path = self._get_task_arg('luks_boot_profile_cache')
+        if not path:
+            return None
+        return BootProfileCache(path)
+
+    @property
+    def luks_boot_profile_margin(self):
+        value = self._get_task_arg_float('luks_boot_profile_margin')
+        if value is None:
+            return self.DEFAULT_LUKS_BOOT_PROFILE_MARGIN
+        return value
+
+    def load_boot_profile(self, task_vars):
+        cache = self.luks_boot_profile_cache
+        if cache is None:
+            return
+        self._boot_profile_host = task_vars.get('inventory_hostname') or self.remote_addr
+        try:
+            self._boot_profile = cache.get(self._boot_profile_host)
+        except (OSError, ValueError) as e:
+            display.warning("{action}: Failed reading boot profile cache, using default delays, error: {error}".format(
+                action=self._task.action, error=e))
+            return
+        if self._boot_profile is not None:
+            display.vvv("{action}: loaded boot profile: {profile}".format(
+                action=self._task.action, profile=self._boot_profile.data))
+
+    def get_boot_profile_delay(self, sample: str):
+        if self._boot_profile is None:
+            return None
+        return self._boot_profile.expected_delay(sample, self.luks_boot_profile_margin)
+
+    def save_boot_profile(self):
+        cache = self.luks_boot_profile_cache
+        if cache is None or self._boot_profile_host is None:
+            return
+        samples = {
+            SAMPLE_SSHD: self.phase_timer.total('post_unlock_delay', 'sshd', 'validate'),
+        }
+        # Only known when the probe saw Dropbear coming up
+        if 'dropbear' in self.phase_timer.phases:
+            samples[SAMPLE_DROPBEAR] = self.phase_timer.total(
+                'post_reboot_delay', 'shutdown', 'dropbear')
+        try:
+            cache.record(self._boot_profile_host, samples)
+        except (OSError, ValueError) as e:
+            display.warning("{action}: Failed writing boot profile cache, error: {error}".format(
+                action=self._task.action, error=e))
+
+    def get_shutdown_command(self, task_vars, distribution):
+        if self.reboot_method == "kexec":
+            return "kexec"
+        return super(ActionModule, self).get_shutdown_command(task_vars, distribution)
+
+    def get_shutdown_command_args(self, distribution):
+        if self.reboot_method == "kexec":
+            # Loads the running kernel and initramfs, and lets systemd jump
+            # into them after a clean shutdown, skipping the firmware.
+            # Without --no-block the connection would be closed before
+            # the command returns.
+            return "-l {kernel} --initrd={initrd} --reuse-cmdline && systemctl --no-block kexec".format(
+                kernel=self.kexec_kernel, initrd=self.kexec_initrd)
+        return super(ActionModule, self).get_shutdown_command_args(distribution)
+
+    def validate_reboot_method(self):
+        reboot_method = self.reboot_method
+        if reboot_method not in self.REBOOT_METHODS:
+            raise AnsibleActionFail("reboot_method must be one of: %s" % ", ".join(self.REBOOT_METHODS))
+        if reboot_method == "kexec" and self._task.args.get("reboot_command") is not None:
+            raise AnsibleActionFail("reboot_command cannot be used together with reboot_method=kexec")
+
+    def validate_luks_unlock_waiting(self):
+        luks_unlock_waiting = self.luks_unlock_waiting
+        if luks_unlock_waiting not in self.LUKS_UNLOCK_WAITING_MODES:
+            raise AnsibleActionFail("luks_unlock_waiting must be one of: %s" % ", ".join(self.LUKS_UNLOCK_WAITING_MODES))
+        if luks_unlock_waiting != "never" and not self.luks_ssh_probe:
+            # Waiting hosts are found by probing Dropbear's port
+            raise AnsibleActionFail("luks_unlock_waiting requires luks_ssh_probe")
+
+    def validate_luks_auto_unlock(self):
+        if self.luks_auto_unlock_timeout < 0:
+            raise AnsibleActionFail("luks_auto_unlock_timeout must not be negative")
+        if self.luks_auto_unlock_timeout and not self.luks_sshd_probe:
+            # The auto unlock is noticed by probing the regular SSH port
+            raise AnsibleActionFail("luks_auto_unlock_timeout requires luks_sshd_probe")
+
+    def validate_luks_retry(self):
+        try:
+            validate_retry_intervals(
+                self.luks_retry_fast_interval, self.luks_retry_fast_window, self.luks_retry_max_interval)
+        except ValueError as e:
+            raise AnsibleActionFail(to_text(e))
+
+    def get_luks_ssh_args(self, remote_addr=None):
         args = [
             self.luks_ssh_executable,
             '-p', str(self.luks_ssh_port),
@@ -237,44 +823,391 @@ class ActionModule(RebootActionModule):
             args.append('-o')
             args.append('ConnectTimeout=%d' % luks_ssh_connect_timeout)
 
-        args.append(self.remote_addr)
+        args.append(remote_addr or self.remote_addr)
         display.vvv("{action}: SSH connection args for LUKS: {args}".format(
             action=self._task.action, args=args))
         return args
 
-    def run_luks_ssh_prompt(self, distribution, action_kwargs=None):
+    def run_luks_ssh_prompt(self, distribution, scheduler: RetryScheduler, action_kwargs=None):
+        """Runs one SSH unlock attempt of the unlock retry loop, whose
+        scheduler limits how long the attempt may take."""
+        attempt = self.phase_timer.attempt('unlock')
+        with self.metrics_attempt('unlock', attempt):
+            if self.luks_ssh_backend == "paramiko":
+                return self.run_luks_paramiko_prompt(distribution, scheduler, action_kwargs)
+            return self.run_luks_openssh_prompt(distribution, scheduler, action_kwargs)
+
+    def get_paramiko_client(self):
+        # Created once per task, so the key and config are reused on retries
+        if self._paramiko_client is None:
+            private_key_file = None
+            if not self.luks_ssh_private_key:
+                private_key_file = self.luks_ssh_private_key_file
+            self._paramiko_client = ParamikoUnlockClient(
+                self.remote_addr, self.luks_ssh_port, self.luks_ssh_user,
+                private_key=self.luks_ssh_private_key,
+                private_key_file=private_key_file,
+                connect_timeout=self.luks_ssh_connect_timeout,
+                ssh_options=self.luks_ssh_options)
+        return self._paramiko_client
+
+    def run_luks_paramiko_prompt(self, distribution, scheduler: RetryScheduler, action_kwargs=None):
+        try:
+            display.vvv("{action}: Attempting LUKS SSH unlock via paramiko".format(
+                action=self._task.action))
+            responder = self.get_luks_volume_responder()
+            output = self.get_paramiko_client().run(
+                self.get_luks_stdin_data(responder),
+                matcher=self.get_stop_keyword_matcher(client_output=False),
+                timeout=self.get_luks_ssh_attempt_timeout(scheduler),
+                responder=responder)
+            display.display("{action}: LUKS SSH unlock successful, output:\n\t{output}".format(
+                action=self._task.action, output=output.replace("\n", "\n\t")))
+        except LuksSSHError as e:
+            if e.reason == REASON_CONFIG:
+                # E.g an invalid private key, which retrying won't fix
+                raise StopRetryLoop(e)
+            self.stop_on_permanent_ssh_error(e)
+            if e.reason == REASON_STOP_KEYWORD:
+                display.vvv("{action}: LUKS unlock disk-encryption via SSH prompt failed, known stop keywords founds, output:\n\t{output}".format(
+                    action=self._task.action, output=e.output))
+                raise StopRetryLoop(e)
+            if e.reason != REASON_EXIT_STATUS:
+                display.warning("{action}: LUKS SSH connection fail (non-fatal, will attempt multiple times), reason: {error}".format(
+                    action=self._task.action, error=e))
+                raise
+
+            display.warning("{action}: LUKS unlock disk-encryption via SSH prompt failed, output:\n\t{output}".format(
+                action=self._task.action, output=e.output))
+            raise
+
+    def run_luks_openssh_prompt(self, distribution, scheduler: RetryScheduler, action_kwargs=None):
         args = self.get_luks_ssh_args()
         try:
             display.vvv("{action}: Attempting LUKS SSH unlock via SSH exec".format(
                 action=self._task.action))
-            result = subprocess.run(
+            # The output is checked for stop keywords while it arrives, so a
+            # session that keeps running after e.g "bad password" is killed
+            # right away instead of waiting for it to time out.
+            responder = self.get_luks_volume_responder()
+            output = run_ssh_process(
                 args,
-                stdout=subprocess.PIPE,  # capture STDOUT
-                stderr=subprocess.STDOUT,  # redirect STDERR to STDOUT
-                text=True,  # string input & output instead of bytes
-                input=str(self.luks_password),
-                check=True)  # raise error on non-0 exit code
+                self.get_luks_stdin_data(responder),
+                self.get_stop_keyword_matcher(),
+                timeout=self.get_luks_ssh_attempt_timeout(scheduler),
+                responder=responder)
             display.display("{action}: LUKS SSH unlock successful, output:\n\t{output}".format(
-                action=self._task.action, output=result.stdout.replace("\n", "\n\t")))
+                action=self._task.action, output=output.replace("\n", "\n\t")))
+        except LuksSSHError as e:
+            if e.reason == REASON_STOP_KEYWORD:
+                display.vvv("{action}: LUKS unlock disk-encryption via SSH prompt failed, known stop keywords founds, output:\n\t{output}".format(
+                    action=self._task.action, output=e.output))
+            else:
+                # E.g a prompt for a volume without passphrase
+                display.vvv("{action}: LUKS unlock disk-encryption via SSH prompt failed, reason: {error}".format(
+                    action=self._task.action, error=e))
+            raise StopRetryLoop(e)
+        except subprocess.TimeoutExpired as e:
+            display.warning("{action}: LUKS SSH session timed out after {timeout} seconds (non-fatal, will attempt multiple times), output:\n\t{output}".format(
+                action=self._task.action, timeout=e.timeout, output=str(e.output).replace("\n", "\n\t")))
+            raise
         except subprocess.CalledProcessError as e:
             output = str(e.output)
             if e.returncode == 255:
-                # SSH connection error; the machine is probably still booting.
-                # Could also be any other SSH client errors, but we cannot
-                # know that.
-                display.warning("{action}: LUKS SSH connection fail (non-fatal, will attempt multiple times), output:\n\t{output}".format(
-                    action=self._task.action, output=output.replace("\n", "\n\t")))
+                # SSH client error, told apart by its output. E.g a refused
+                # connection means the machine is probably still booting,
+                # while a rejected key won't get better by retrying.
+                reason, message = classify_openssh_output(output)
+                error = LuksSSHError(reason, message, output)
+                self.stop_on_permanent_ssh_error(error)
+                display.warning("{action}: LUKS SSH connection fail (non-fatal, will attempt multiple times), reason: {reason}, output:\n\t{output}".format(
+                    action=self._task.action, reason=reason, output=output.replace("\n", "\n\t")))
+                raise error from e
             else:
-                for substr in self.luks_stop_retry_on_output:
-                    if substr.casefold() in output.casefold():
-                        display.vvv("{action}: LUKS unlock disk-encryption via SSH prompt failed, known stop keywords founds, output:\n\t{output}".format(
-                            action=self._task.action, output=output))
-                        raise StopRetryLoop(e)
-
                 display.warning("{action}: LUKS unlock disk-encryption via SSH prompt failed, output:\n\t{output}".format(
                     action=self._task.action, output=output))
             raise
 
+    def is_luks_ssh_server_confirmed(self):
+        """Returns true if SSH errors come from the LUKS SSH server
+        (Dropbear), and not from the regular SSH server that may still be
+        shutting down on the same port."""
+        if self.luks_ssh_port != self.remote_port:
+            return True
+        return self._luks_ssh_server_confirmed
+
+    def stop_on_permanent_ssh_error(self, error: LuksSSHError):
+        """Raises StopRetryLoop if retrying won't fix the SSH error, such as
+        a rejected key or an unknown hostname."""
+        if not is_permanent(error.reason):
+            return
+        if not self.is_luks_ssh_server_confirmed():
+            display.vvv("{action}: LUKS SSH error might come from the regular SSH server on the same port, will retry: {error}".format(
+                action=self._task.action, error=error))
+            return
+        raise StopRetryLoop(error)
+
+    def check_luks_ssh_private_key_file(self):
+        if self.luks_ssh_private_key:
+            return
+        private_key_file = self.luks_ssh_private_key_file
+        if not private_key_file:
+            # Keys from the ssh-agent or ~/.ssh/config
+            return
+        path = os.path.expanduser(private_key_file)
+        try:
+            st = os.stat(path)
+            with open(path, "rb"):
+                pass
+        except OSError as e:
+            raise AnsibleActionFail("Cannot read luks_ssh_private_key_file: {error}".format(error=e))
+        # Same check as the OpenSSH client, which ignores such keys
+        if self.luks_ssh_backend == "openssh" and st.st_uid == os.getuid() and st.st_mode & 0o077:
+            raise AnsibleActionFail(
+                "luks_ssh_private_key_file {path} is accessible by others (mode {mode:o}), so the SSH client would ignore it".format(
+                    path=private_key_file, mode=st.st_mode & 0o777))
+
+    def get_luks_ssh_config_args(self, remote_addr=None):
+        # "ssh -G" only evaluates the options and SSH config, without
+        # connecting
+        args = self.get_luks_ssh_args(remote_addr)
+        return [args[0], '-G'] + args[1:]
+
+    def check_luks_ssh_config_output(self, rc: int, output: str):
+        if rc != 0:
+            reason, message = classify_openssh_output(output)
+            raise AnsibleActionFail("LUKS SSH options were rejected by {executable} ({reason}): {message}".format(
+                executable=self.luks_ssh_executable, reason=reason, message=message))
+
+    def preflight_luks_ssh(self):
+        """Checks the LUKS SSH key and options before rebooting, so mistakes
+        fail the task while the host is still up, instead of after it is
+        waiting in the initramfs."""
+        if not self.luks_ssh_preflight:
+            return
+        self.check_luks_ssh_private_key_file()
+        if self.luks_ssh_backend == "paramiko":
+            try:
+                # Loads the key and SSH config
+                self.get_paramiko_client()
+            except LuksSSHError as e:
+                raise AnsibleActionFail("LUKS SSH preflight check failed: {error}".format(error=e))
+            return
+
+        args = self.get_luks_ssh_config_args()
+        try:
+            result = subprocess.run(
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=self.DEFAULT_LUKS_SSH_PREFLIGHT_TIMEOUT,
+                check=False)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise AnsibleActionFail("Cannot run luks_ssh_executable: {error}".format(error=e))
+        self.check_luks_ssh_config_output(result.returncode, to_text(result.stdout))
+
+    def get_luks_ssh_public_key(self):
+        """Returns the public key of the LUKS SSH private key, or None if
+        there is no key set, such as when using the keys of the ssh-agent."""
+        private_key = self.luks_ssh_private_key
+        private_key_file = self.luks_ssh_private_key_file
+        try:
+            if private_key:
+                private_key = str(private_key)
+                if self._ssh_agent_lease is not None:
+                    # Derived at most once for all forks
+                    return self._ssh_agent_lease.public_key(
+                        lambda: self.private_key_to_public_key(private_key)).strip()
+                return self.private_key_to_public_key(private_key).strip()
+            if not private_key_file:
+                return None
+            private_key_file = os.path.expanduser(private_key_file)
+            try:
+                with open(private_key_file + ".pub", encoding="utf-8") as f:
+                    return f.readline().strip()
+            except OSError:
+                pass
+            with open(private_key_file, encoding="utf-8") as f:
+                return self.private_key_to_public_key(f.read()).strip()
+        except (OSError, RuntimeError) as e:
+            display.vvv("{action}: cannot get the public key of the LUKS SSH key: {error}".format(
+                action=self._task.action, error=e))
+            return None
+
+    def preflight_initramfs(self, task_vars):
+        """Checks that the initramfs image of the next boot has Dropbear with
+        the LUKS SSH key, port, and network config, before rebooting into
+        it."""
+        module_args = {
+            'dropbear_port': self.luks_ssh_port,
+            'network': self.luks_initramfs_preflight_network,
+        }
+        image = self.get_initramfs_image()
+        if image is not None:
+            module_args['image'] = image
+        public_key = self.get_luks_ssh_public_key()
+        if public_key:
+            module_args['authorized_keys'] = [public_key]
+        display.vvv("{action}: inspecting initramfs before rebooting".format(action=self._task.action))
+        inspect_result = self._execute_module(
+            module_name='riskident.luks.initramfs_inspect',
+            module_args=module_args,
+            task_vars=task_vars)
+        if inspect_result.get('failed'):
+            raise AnsibleActionFail("Refusing to reboot, {msg}".format(
+                msg=inspect_result.get('msg', 'initramfs inspection failed')))
+        display.vvv("{action}: initramfs {image} looks fine, read in {elapsed} seconds".format(
+            action=self._task.action, image=inspect_result.get('image'), elapsed=inspect_result.get('elapsed')))
+
+    def get_luks_ssh_banner(self):
+        # Used before rebooting, to not mistake a still running sshd on the
+        # same port as Dropbear for the LUKS boot.
+        try:
+            return probe_ssh_banner(
+                self.luks_ssh_probe_addr, self.luks_ssh_port, self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+        except OSError:
+            return None
+
+    def get_sshd_banner(self):
+        # Used before rebooting, to notice when the host is back up after
+        # it unlocked by itself
+        try:
+            return probe_ssh_banner(
+                self.sshd_probe_addr, self.remote_port, self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+        except OSError:
+            return None
+
+    def wait_for_auto_unlock(self, previous_banner):
+        """Waits for the host to unlock by itself, e.g with Clevis and Tang,
+        by waiting for its regular SSH server to come back after the reboot.
+
+        Returns false if it did not within luks_auto_unlock_timeout, in
+        which case the host is unlocked via SSH instead."""
+        timeout = self.luks_auto_unlock_timeout
+        if previous_banner is None:
+            display.warning("{action}: SSH server did not answer before the reboot, so cannot tell if the host unlocks by itself. Unlocking via SSH".format(
+                action=self._task.action))
+            return False
+        display.vvv("{action}: post-reboot: waiting up to {timeout} seconds for the host to unlock by itself".format(
+            action=self._task.action, timeout=timeout))
+        same_port = self.remote_port == self.luks_ssh_port
+        deadline = time.monotonic() + timeout
+        attempts = 0
+        while True:
+            try:
+                probe = wait_for_ssh_banner(
+                    self.sshd_probe_addr, self.remote_port,
+                    timeout=deadline - time.monotonic(),
+                    interval=self.luks_ssh_probe_interval,
+                    probe_timeout=self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT,
+                    previous_banner=previous_banner)
+            except SSHProbeTimeout as e:
+                attempts += e.attempts
+                display.vvv("{action}: post-reboot: host did not unlock by itself within {timeout} seconds, unlocking via SSH".format(
+                    action=self._task.action, timeout=timeout))
+                self.phase_timer.mark('auto_unlock', attempts=attempts)
+                return False
+            attempts += probe.attempts
+            if not same_port or classify_host_state(probe.banner, None, True) == HOST_UP:
+                break
+            # Dropbear answered on the shared port, so the host is waiting.
+            # Wait for its banner to go away.
+            previous_banner = probe.banner
+
+        display.vvv("{action}: post-reboot: host unlocked by itself after {attempts} probes, banner: {banner}".format(
+            action=self._task.action, attempts=attempts, banner=probe.banner))
+        self.phase_timer.mark('auto_unlock', attempts=attempts)
+        return True
+
+    def wait_for_luks_ssh(self, previous_banner):
+        display.vvv("{action}: post-reboot: waiting for LUKS SSH server (Dropbear) on port {port}".format(
+            action=self._task.action, port=self.luks_ssh_port))
+        try:
+            probe = wait_for_ssh_banner(
+                self.luks_ssh_probe_addr, self.luks_ssh_port,
+                timeout=self.luks_ssh_timeout,
+                interval=self.luks_ssh_probe_interval,
+                probe_timeout=self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT,
+                previous_banner=previous_banner,
+                watch_down_port=self.remote_port)
+            display.vvv("{action}: post-reboot: LUKS SSH server is ready after {attempts} probes, banner: {banner}".format(
+                action=self._task.action, attempts=probe.attempts, banner=probe.banner))
+            if probe.down_at is not None:
+                self.phase_timer.mark('shutdown', at=probe.down_at)
+            self.phase_timer.mark('dropbear', attempts=probe.attempts)
+            self._luks_ssh_banner = probe.banner
+            self._luks_ssh_server_confirmed = True
+            if self.luks_sshd_probe and self.luks_sshd_probe_host_key:
+                self._luks_ssh_host_keys = self.get_ssh_host_keys(self.luks_ssh_probe_addr, self.luks_ssh_port)
+        except SSHProbeTimeout as e:
+            # Not fatal, as the SSH client might still be able to connect,
+            # e.g via a ProxyJump configured in ~/.ssh/config
+            display.warning("{action}: {error}. Falling back to SSH unlock retry loop".format(
+                action=self._task.action, error=e))
+
+    def get_ssh_host_keys(self, addr: str, port: int):
+        args = [
+            self.luks_ssh_keyscan_executable,
+            "-p", str(port),
+            "-T", str(self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT),
+            addr,
+        ]
+        try:
+            result = subprocess.run(
+                args,
+                stdout=subprocess.PIPE,  # capture STDOUT
+                stderr=subprocess.DEVNULL,  # ignore the "# host:port SSH-2.0-..." comments
+                text=True,  # string input & output instead of bytes
+                check=True)  # raise error on non-0 exit code
+        except (subprocess.CalledProcessError, OSError) as e:
+            display.vvv("{action}: Failed scanning SSH host keys on port {port}: {error}".format(
+                action=self._task.action, port=port, error=e))
+            return set()
+        # Only keep the "type key" part of each "host type key" line
+        return {line.split(None, 1)[1] for line in result.stdout.splitlines()
+                if line and not line.startswith("#") and " " in line}
+
+    def wait_for_sshd(self):
+        remote_port = self.remote_port
+        display.vvv("{action}: post-unlock: waiting for SSH server (sshd) on port {port}".format(
+            action=self._task.action, port=remote_port))
+        # When sshd and Dropbear share the same port, then Dropbear may still
+        # be answering right after the unlock
+        previous_banner = None
+        if remote_port == self.luks_ssh_port:
+            previous_banner = self._luks_ssh_banner
+        check_host_key = self.luks_sshd_probe_host_key and bool(self._luks_ssh_host_keys)
+
+        deadline = time.monotonic() + self.luks_ssh_timeout
+        attempts = 0
+        while True:
+            try:
+                probe = wait_for_ssh_banner(
+                    self.sshd_probe_addr, remote_port,
+                    timeout=deadline - time.monotonic(),
+                    interval=self.luks_ssh_probe_interval,
+                    probe_timeout=self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT,
+                    previous_banner=previous_banner)
+            except SSHProbeTimeout as e:
+                # Not fatal, validate_reboot will keep retrying by itself
+                display.warning("{action}: {error}. Falling back to reconnect retry loop".format(
+                    action=self._task.action, error=e))
+                return
+            attempts += probe.attempts
+            if not check_host_key:
+                break
+            host_keys = self.get_ssh_host_keys(self.sshd_probe_addr, remote_port)
+            if host_keys and not host_keys & self._luks_ssh_host_keys:
+                break
+            display.vvv("{action}: post-unlock: SSH server on port {port} still has Dropbear's host key".format(
+                action=self._task.action, port=remote_port))
+            time.sleep(self.luks_ssh_probe_interval)
+
+        display.vvv("{action}: post-unlock: SSH server is ready after {attempts} probes, banner: {banner}".format(
+            action=self._task.action, attempts=attempts, banner=probe.banner))
+        self.phase_timer.mark('sshd', attempts=attempts)
+
     def unlock_luks(self, distribution, previous_boot_time, task_vars):
         display.vvv(
             "{action}: post-reboot: starting LUKS unlock retry loop".format(action=self._task.action))
@@ -284,7 +1217,8 @@ class ActionModule(RebootActionModule):
                 action=self.run_luks_ssh_prompt,
                 action_desc="post-reboot unlock LUKS full-disk encryption",
                 distribution=distribution,
-                reboot_timeout=self.luks_ssh_timeout)
+                reboot_timeout=self.luks_ssh_timeout,
+                pass_scheduler=True)
             return {}
 
         except Exception as unlock_error:
@@ -294,10 +1228,18 @@ class ActionModule(RebootActionModule):
                 'unlocked': False,
                 'msg': to_text(unlock_error),
             }
+            permanent = isinstance(unlock_error, LuksSSHError) and is_permanent(unlock_error.reason)
+            if permanent:
+                fail_result['msg'] = "LUKS SSH unlock failed, and retrying won't help: {error}".format(error=unlock_error)
             if not self.luks_manual_unlock_on_fail:
                 display.vvv("{action}: LUKS unlock failed. Not asking for manual unlock because luks_manual_unlock_on_fail was false".format(
                     action=self._task.action))
                 return fail_result
+            if permanent:
+                # E.g a rejected key, which needs fixing before the next try
+                display.vvv("{action}: LUKS unlock failed. Not asking for manual unlock because of a permanent SSH error".format(
+                    action=self._task.action))
+                return fail_result
 
             timeout = self.luks_ssh_reconnect_timeout
             hostname = self._get_remote_addr(task_vars)
@@ -305,12 +1247,17 @@ class ActionModule(RebootActionModule):
                 action=self._task.action, ansible_host=hostname, timeout=timeout))
 
             try:
-                self.do_until_success_or_timeout(
-                    action=self.check_boot_time,
-                    action_desc="post-reboot reconnect",
-                    reboot_timeout=timeout,
-                    distribution=distribution,
-                    action_kwargs={'previous_boot_time': previous_boot_time})
+                if distribution is None:
+                    # Not rebooted (luks_unlock_waiting), so there is no
+                    # boot time to compare with. Wait until the host answers.
+                    self.wait_for_distribution(task_vars, timeout)
+                else:
+                    self.do_until_success_or_timeout(
+                        action=self.check_boot_time,
+                        action_desc="post-reboot reconnect",
+                        reboot_timeout=timeout,
+                        distribution=distribution,
+                        action_kwargs={'previous_boot_time': previous_boot_time})
                 return {}
 
             except Exception:
@@ -325,10 +1272,99 @@ class ActionModule(RebootActionModule):
     def set_result_elapsed(self, result: dict, start: datetime):
         elapsed = datetime.now(timezone.utc) - start
         result['elapsed'] = elapsed.seconds
+        result['phases'] = self.phase_timer.as_dict()
+        if self._luks_volume_responder is not None:
+            result['volumes'] = self._luks_volume_responder.results()
+        if self.luks_auto_unlock_timeout:
+            result['auto_unlocked'] = self._auto_unlocked
+        retries = [scheduler.as_dict() for scheduler in self.retry_schedulers if scheduler.retries]
+        if retries:
+            result['retries'] = retries
+
+    def check_boot_time(self, distribution, previous_boot_time):
+        attempt = self.phase_timer.attempt('validate')
+        # The parent raises ValueError when the boot time is unchanged
+        with self.metrics_attempt('validate', attempt, {ValueError: ERROR_BOOT_TIME_UNCHANGED}):
+            return super(ActionModule, self).check_boot_time(distribution, previous_boot_time)
+
+    def get_host_state(self):
+        host_state = probe_host_state(
+            self.luks_ssh_probe_addr, self.remote_port, self.luks_ssh_port,
+            self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+        display.vvv("{action}: host state before rebooting: {state}".format(
+            action=self._task.action, state=host_state))
+        return host_state
+
+    def wait_for_distribution(self, task_vars, timeout):
+        # The setup module can only run once the host has booted
+        found = {}
+
+        def update_distribution(distribution):
+            found.update(self.get_distribution(task_vars))
+
+        self.do_until_success_or_timeout(
+            action=update_distribution,
+            action_desc="post-unlock distribution check",
+            reboot_timeout=timeout,
+            distribution=None)
+        return found
+
+    def run_unlock_only(self, task_vars):
+        """Unlocks a host that is already waiting in the initramfs, e.g after
+        a power outage, without rebooting it."""
+        start = datetime.now(timezone.utc)
+        original_connection_timeout = self.connection_timeout
+        display.vvv("{action}: host is waiting to be unlocked, skipping the reboot".format(
+            action=self._task.action))
+        self.phase_timer.mark('dropbear', attempts=1)
+        self._luks_ssh_server_confirmed = True
+
+        # Nothing to compare the boot time with, so any boot time is valid
+        unlock_result = self.unlock_luks(None, None, task_vars)
+        self.phase_timer.mark('unlock')
+        if unlock_result.get('failed'):
+            unlock_result['rebooted'] = False
+            self.set_result_elapsed(unlock_result, start)
+            return unlock_result
+
+        post_unlock_delay = self.post_unlock_delay
+        if post_unlock_delay > 0:
+            display.vvv("{action}: waiting an additional {delay} seconds (post_unlock_delay)".format(
+                action=self._task.action, delay=post_unlock_delay))
+            time.sleep(post_unlock_delay)
+            self.phase_timer.mark('post_unlock_delay')
+
+        if self.luks_sshd_probe:
+            self.wait_for_sshd()
+
+        try:
+            distribution = self.wait_for_distribution(task_vars, self.luks_ssh_timeout)
+        except TimedOutException as e:
+            result = {'failed': True, 'msg': to_text(e)}
+        else:
+            result = self.validate_reboot(distribution, original_connection_timeout, action_kwargs={
+                                          'previous_boot_time': None})
+        self.phase_timer.mark('validate')
+        self.set_result_elapsed(result, start)
+        result['changed'] = True
+        result['rebooted'] = False
+        result['unlocked'] = True
+        return result
 
     def run_reboot(self, distribution, previous_boot_time, task_vars):
         original_connection_timeout = self.connection_timeout
+        luks_ssh_probe = self.luks_ssh_probe
+        previous_luks_ssh_banner = None
+        if luks_ssh_probe:
+            previous_luks_ssh_banner = self.get_luks_ssh_banner()
+        luks_auto_unlock_timeout = self.luks_auto_unlock_timeout
+        previous_sshd_banner = None
+        if luks_auto_unlock_timeout:
+            previous_sshd_banner = self.get_sshd_banner()
+
+        self.phase_timer.mark('pre_reboot')
         reboot_result = self.perform_reboot(task_vars, distribution)
+        self.phase_timer.mark('reboot')
 
         if reboot_result.get('failed'):
             self.set_result_elapsed(reboot_result, reboot_result['start'])
@@ -339,28 +1375,58 @@ class ActionModule(RebootActionModule):
             display.vvv("{action}: waiting an additional {delay} seconds (post_reboot_delay)".format(
                 action=self._task.action, delay=post_reboot_delay))
             time.sleep(post_reboot_delay)
+            self.phase_timer.mark('post_reboot_delay')
 
-        unlock_result = self.unlock_luks(
-            distribution, previous_boot_time, task_vars)
-        if unlock_result.get('failed'):
-            self.set_result_elapsed(unlock_result, reboot_result['start'])
-            return unlock_result
+        if luks_auto_unlock_timeout:
+            self._auto_unlocked = self.wait_for_auto_unlock(previous_sshd_banner)
 
-        post_unlock_delay = self.post_unlock_delay
-        if post_unlock_delay > 0:
-            display.vvv("{action}: waiting an additional {delay} seconds (post_unlock_delay)".format(
-                action=self._task.action, delay=post_unlock_delay))
-            time.sleep(post_unlock_delay)
+        if not self._auto_unlocked:
+            if luks_ssh_probe:
+                self.wait_for_luks_ssh(previous_luks_ssh_banner)
+
+            unlock_result = self.unlock_luks(
+                distribution, previous_boot_time, task_vars)
+            self.phase_timer.mark('unlock')
+            if unlock_result.get('failed'):
+                self.set_result_elapsed(unlock_result, reboot_result['start'])
+                return unlock_result
+
+            post_unlock_delay = self.post_unlock_delay
+            if post_unlock_delay > 0:
+                display.vvv("{action}: waiting an additional {delay} seconds (post_unlock_delay)".format(
+                    action=self._task.action, delay=post_unlock_delay))
+                time.sleep(post_unlock_delay)
+                self.phase_timer.mark('post_unlock_delay')
+
+            if self.luks_sshd_probe:
+                self.wait_for_sshd()
 
         result = self.validate_reboot(distribution, original_connection_timeout, action_kwargs={
                                       'previous_boot_time': previous_boot_time})
+        self.phase_timer.mark('validate')
         self.set_result_elapsed(result, reboot_result['start'])
         result['unlocked'] = True
+        if not result.get('failed'):
+            self.save_boot_profile()
         return result
 
     def validate_args(self):
-        if not self.luks_password:
+        # Not required when all luks_volumes have their own password
+        if not self.luks_volumes and not self.luks_password:
             raise AnsibleActionFail("luks_password is required")
+        self.validate_reboot_method()
+        self.validate_luks_unlock_waiting()
+        self.validate_luks_auto_unlock()
+        self.validate_luks_retry()
+        self.validate_luks_metrics()
+        luks_ssh_backend = self.luks_ssh_backend
+        if luks_ssh_backend not in self.LUKS_SSH_BACKENDS:
+            raise AnsibleActionFail("luks_ssh_backend must be one of: %s" % ", ".join(self.LUKS_SSH_BACKENDS))
+        if luks_ssh_backend == "paramiko" and not HAS_PARAMIKO:
+            display.vvv("{action}: failed to import paramiko:\n{error}".format(
+                action=self._task.action, error=PARAMIKO_IMPORT_ERROR))
+            raise AnsibleActionFail(
+                missing_required_lib("paramiko", reason="for luks_ssh_backend=paramiko"))
 
     def setup_ssh_private_key_file(self):
         if self.luks_ssh_private_key_file:
@@ -369,8 +1435,17 @@ class ActionModule(RebootActionModule):
         private_key = self.luks_ssh_private_key
         if not private_key:
             return
+        if self.luks_ssh_backend == "paramiko":
+            # The key is kept in memory, so no ssh-agent is needed
+            return
 
-        self.add_private_key_to_ssh_agent(private_key)
+        # The lease is held by the whole run, so the key is only added once,
+        # and only removed once the run is over, instead of by the last fork
+        # of each batch of hosts.
+        self._ssh_agent_lease = SSHAgentKeyLease(
+            str(private_key), self.luks_ssh_add_timeout, default_run_id(), os.getppid())
+        self._ssh_agent_lease.acquire(
+            lambda: self.add_private_key_to_ssh_agent(private_key))
         self._has_added_key_to_ssh_agent = True
 
     def add_private_key_to_ssh_agent(self, private_key: str):
@@ -394,14 +1469,14 @@ class ActionModule(RebootActionModule):
                 output=e.output)) from e
 
     def remove_public_key_from_ssh_agent(self, public_key: str):
+        # Called by the lease's watcher process once the run is over, where
+        # Ansible's Display cannot be used
         args = [
             self.luks_ssh_add_executable,
             "-d",
             "-",  # read from STDIN
         ]
         try:
-            display.vvv("{action}: Removing private key from ssh-agent via ssh-add".format(
-                action=self._task.action))
             subprocess.run(
                 args,
                 stdout=subprocess.PIPE,  # capture STDOUT
@@ -417,6 +1492,7 @@ class ActionModule(RebootActionModule):
         args = [
             self.luks_ssh_keygen_executable,
             "-y",  # read private OpenSSH file, print OpenSSH public key
+            "-P", "",  # fail on a passphrase instead of asking for it
             "-f", "/dev/stdin",  # read from STDIN (not Windows compatible!)
         ]
         try:
@@ -434,19 +1510,31 @@ class ActionModule(RebootActionModule):
             raise RuntimeError("Failed converting SSH private key to public key, output:\n{output}".format(
                 output=e.output)) from e
 
-    def ri_do_until_success_or_timeout(self, action, reboot_timeout, action_desc, distribution, action_kwargs=None):
+    def do_until_success_or_timeout(self, action, reboot_timeout, action_desc, distribution, action_kwargs=None):
+        # Also used by the parent's reconnect and validation loops, so they
+        # poll with the same scheduler as the unlock loop
+        return self.ri_do_until_success_or_timeout(
+            action, reboot_timeout, action_desc, distribution, action_kwargs=action_kwargs)
+
+    def ri_do_until_success_or_timeout(self, action, reboot_timeout, action_desc, distribution, action_kwargs=None,
+                                       pass_scheduler=False):
         # RiskIdent: This function is taken directly from the ansible.builtin.reboot code
         # Changed sections are marked with a "# RiskIdent:" line comment
 
-        max_end_time = datetime.now(timezone.utc) + timedelta(seconds=reboot_timeout)
+        # RiskIdent: The sleeps are decided by a RetryScheduler, which also
+        # owns the deadline, instead of a fixed exponential backoff
+        scheduler = self.get_retry_scheduler(action_desc, reboot_timeout)
+        self.retry_schedulers.append(scheduler)
         if action_kwargs is None:
             action_kwargs = {}
+        # RiskIdent: With pass_scheduler, the action gets the scheduler as
+        # its "scheduler" argument, e.g to not run past the loop's deadline
+        if pass_scheduler:
+            action_kwargs = dict(action_kwargs, scheduler=scheduler)
 
-        fail_count = 0
-        max_fail_sleep = 12
         last_error_msg = ''
 
-        while datetime.now(timezone.utc) < max_end_time:
+        while not scheduler.expired():
             try:
                 action(distribution=distribution, **action_kwargs)
                 if action_desc:
@@ -462,12 +1550,9 @@ class ActionModule(RebootActionModule):
                         self._connection.reset()
                     except AnsibleConnectionFailure:
                         pass
-                # Use exponential backoff with a max timeout, plus a little bit of randomness
-                random_int = random.randint(0, 1000) / 1000
-                fail_sleep = 2 ** fail_count + random_int
-                if fail_sleep > max_fail_sleep:
-
-                    fail_sleep = max_fail_sleep + random_int
+                # RiskIdent: Fast polling at first, then exponential backoff,
+                # never sleeping past the deadline
+                fail_sleep = scheduler.next_sleep(classify_error(e)[0])
                 if action_desc:
                     try:
                         error = to_text(e).splitlines()[-1]
@@ -478,7 +1563,6 @@ class ActionModule(RebootActionModule):
 
                     display.debug(msg)
                     display.vvv(msg)
-                fail_count += 1
                 time.sleep(fail_sleep)
 
         if last_error_msg:
@@ -491,9 +1575,11 @@ class ActionModule(RebootActionModule):
     def cleanup(self, force=False):
         if self._has_added_key_to_ssh_agent:
             try:
-                public_key = self.private_key_to_public_key(
-                    str(self.luks_ssh_private_key))
-                self.remove_public_key_from_ssh_agent(public_key)
+                display.vvv("{action}: Releasing the ssh-agent key, it is removed once the run is over".format(
+                    action=self._task.action))
+                self._ssh_agent_lease.release(
+                    self.remove_public_key_from_ssh_agent,
+                    lambda: self.private_key_to_public_key(str(self.luks_ssh_private_key)))
                 self._has_added_key_to_ssh_agent = False
             except Exception as e:
                 display.warning("{action}: Failed cleaning up SSH key from SSH-agent, error:\n{error}".format(
@@ -517,6 +1603,8 @@ class ActionModule(RebootActionModule):
         if task_vars is None:
             task_vars = {}
 
+        self._phase_timer = PhaseTimer()
+        self._retry_schedulers = []
         self.deprecated_args()
 
         result = super(RebootActionModule, self).run(tmp, task_vars)
@@ -524,8 +1612,10 @@ class ActionModule(RebootActionModule):
             return result
 
         try:
+            self.resolve_probe_addrs()
             self.validate_args()
             self.setup_ssh_private_key_file()
+            self.preflight_luks_ssh()
         except AnsibleActionFail as e:
             result['failed'] = True
             result['reboot'] = False
@@ -536,9 +1626,36 @@ class ActionModule(RebootActionModule):
         if task_vars is None:
             task_vars = {}
 
+        # Same host name as in the boot profile cache
+        self.setup_metrics(task_vars.get('inventory_hostname') or self.remote_addr)
+        result = self.run_reboot_or_unlock(result, task_vars)
+        self.record_metrics_result(result)
+        return result
+
+    def run_reboot_or_unlock(self, result: dict, task_vars):
+        luks_unlock_waiting = self.luks_unlock_waiting
+        if luks_unlock_waiting != "never":
+            host_state = self.get_host_state()
+            if host_state == HOST_WAITING:
+                return self.run_unlock_only(task_vars)
+            if luks_unlock_waiting == "only":
+                result['changed'] = False
+                result['elapsed'] = 0
+                result['rebooted'] = False
+                result['unlocked'] = False
+                if host_state == HOST_UNREACHABLE:
+                    result['failed'] = True
+                    result['msg'] = "Neither the SSH server nor the LUKS SSH server (Dropbear) answered"
+                else:
+                    result['msg'] = "Host is not waiting to be unlocked, skipped it"
+                return result
+
         distribution = self.get_distribution(task_vars)
+        self.load_boot_profile(task_vars)
 
         try:
+            if self.luks_initramfs_preflight:
+                self.preflight_initramfs(task_vars)
             previous_boot_time = self.get_system_boot_time(distribution)
         except Exception as e:
             result['failed'] = True
@@ -0,0 +1,773 @@
+#!/usr/bin/python
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Reboots and unlocks many hosts from a single task, using one asyncio event
+# loop on the control-node instead of one Ansible fork per host.
+
+import asyncio
+from datetime import datetime, timezone
+import shlex
+import subprocess
+import time
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils._text import to_text
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action.reboot import ActionModule as RebootActionModule
+from ansible.utils.display import Display
+from ansible_collections.riskident.luks.plugins.action.reboot_luks_ssh import (
+    ActionModule as RebootLuksSSHActionModule,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.luks_volumes import (
+    VolumePromptResponder,
+    parse_luks_volumes,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.phase_timer import PhaseTimer
+from ansible_collections.riskident.luks.plugins.module_utils.retry_scheduler import RetryScheduler
+from ansible_collections.riskident.luks.plugins.module_utils.run_id import default_run_id
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_EXIT_STATUS,
+    REASON_STOP_KEYWORD,
+    REASON_TIMEOUT,
+    LuksSSHError,
+    classify_error,
+    classify_openssh_output,
+    is_permanent,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_output import UnlockSession
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_probe import (
+    HOST_UNREACHABLE,
+    HOST_UP,
+    HOST_WAITING,
+    SSHProbeTimeout,
+    async_probe_host_state,
+    async_probe_ssh_banner,
+    async_wait_for_ssh_banner,
+    classify_host_state,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.unlock_metrics import (
+    ERROR_BOOT_TIME_UNCHANGED,
+    UnlockMetrics,
+    result_outcome,
+)
+
+display = Display()
+
+
+class BatchHostFailed(Exception):
+    pass
+
+
+class BatchHostPermanentError(BatchHostFailed):
+    """A failure that retrying won't fix, such as a rejected SSH key, so no
+    manual unlock is waited for."""
+
+
+class BatchHost:
+    """Connection details of one host, taken from its hostvars."""
+
+    def __init__(self, name: str, host_vars):
+        self.name = name
+        self.addr = host_vars.get('ansible_host') or name
+        self.port = int(host_vars.get('ansible_port') or 22)
+        self.user = host_vars.get('ansible_user')
+        self.private_key_file = host_vars.get('ansible_ssh_private_key_file')
+        self.connection = host_vars.get('ansible_connection')
+        self.ssh_executable = host_vars.get('ansible_ssh_executable')
+        # Same as the ssh_args, ssh_common_args and ssh_extra_args of the ssh
+        # connection plugin, e.g for a ProxyJump
+        self.ssh_args = []
+        for var in ('ansible_ssh_args', 'ansible_ssh_common_args', 'ansible_ssh_extra_args'):
+            self.ssh_args.extend(shlex.split(str(host_vars.get(var) or '')))
+        # None when not set for the host, to use the play's become settings
+        self.become = host_vars.get('ansible_become')
+        self.become_method = host_vars.get('ansible_become_method')
+        self.become_user = host_vars.get('ansible_become_user')
+        self.become_password = host_vars.get('ansible_become_password') or host_vars.get('ansible_become_pass')
+        # Addresses to probe, as resolved by the SSH config, or None if the
+        # port is not probed
+        self.luks_probe_addr = self.addr
+        self.sshd_probe_addr = self.addr
+
+
+class ActionModule(RebootLuksSSHActionModule):
+    _VALID_ARGS = frozenset((
+        *RebootLuksSSHActionModule._VALID_ARGS,
+
+        'hosts',
+        'max_in_flight',
+        'max_failures',
+        'luks_password_var',
+    ))
+
+    DEFAULT_MAX_IN_FLIGHT = 10
+    DEFAULT_MAX_FAILURES = 0
+    DEFAULT_BATCH_REBOOT_COMMAND = 'shutdown -r now "Reboot initiated by Ansible"'
+    DEFAULT_BATCH_CONNECT_TIMEOUT = 10
+
+    _metrics_run_id = None
+
+    @property
+    def max_in_flight(self):
+        return self._get_task_arg_int('max_in_flight') or self.DEFAULT_MAX_IN_FLIGHT
+
+    @property
+    def max_failures(self):
+        # Cannot use "or" here to see if it's unset, as 0 is a valid value
+        value = self._get_task_arg_int('max_failures')
+        if value is None:
+            return self.DEFAULT_MAX_FAILURES
+        return value
+
+    @property
+    def luks_password_var(self):
+        return self._get_task_arg('luks_password_var')
+
+    @property
+    def batch_connect_timeout(self):
+        return self.luks_ssh_connect_timeout or self.DEFAULT_BATCH_CONNECT_TIMEOUT
+
+    @property
+    def batch_reboot_command(self):
+        if self.reboot_method == "kexec":
+            return "{command} {args}".format(
+                command=self.get_shutdown_command(None, None),
+                args=self.get_shutdown_command_args(None))
+        return self._get_task_arg('reboot_command') or self.DEFAULT_BATCH_REBOOT_COMMAND
+
+    @property
+    def batch_boot_time_command(self):
+        return self._get_task_arg('boot_time_command') or self.DEFAULT_BOOT_TIME_COMMAND
+
+    @property
+    def reboot_timeout(self):
+        return self._get_task_arg_int('reboot_timeout', 'reboot_timeout_sec') or self.DEFAULT_REBOOT_TIMEOUT
+
+    def validate_args(self):
+        # The luks_volumes are parsed per host, with the host's password
+        if not self.luks_password and not self.luks_password_var and not self._get_task_arg('luks_volumes'):
+            raise AnsibleActionFail("luks_password or luks_password_var is required")
+        self.validate_reboot_method()
+        self.validate_luks_unlock_waiting()
+        self.validate_luks_auto_unlock()
+        self.validate_luks_retry()
+        self.validate_luks_metrics()
+        if self.luks_ssh_backend != "openssh":
+            raise AnsibleActionFail("luks_ssh_backend must be openssh when rebooting in batch")
+        if self.luks_initramfs_preflight:
+            # Runs a module, but the hosts are reached without Ansible's
+            # connection plugins
+            raise AnsibleActionFail("luks_initramfs_preflight is not supported when rebooting in batch, run the initramfs_inspect module before instead")
+        if self.max_in_flight < 1:
+            raise AnsibleActionFail("max_in_flight must be at least 1")
+
+    def get_batch_hosts(self, task_vars):
+        hosts = self._get_task_arg('hosts')
+        if hosts is None:
+            hosts = task_vars.get('ansible_play_batch', [])
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        return list(hosts)
+
+    def get_host_password(self, host: BatchHost, host_vars):
+        """Returns the host's password, or None if only the luks_volumes
+        have passwords. Raises BatchHostFailed if the host has no password,
+        as cryptroot-unlock would count each attempt as a wrong one."""
+        luks_password_var = self.luks_password_var
+        if luks_password_var:
+            password = host_vars.get(luks_password_var)
+            if password:
+                return str(password)
+        if self.luks_password:
+            return str(self.luks_password)
+        if self._get_task_arg('luks_volumes'):
+            # Each volume without a password fails in get_host_volume_responder
+            return None
+        raise BatchHostFailed("host variable {var} is not set, and luks_password is not set".format(
+            var=luks_password_var))
+
+    def check_batch_hosts(self, hosts, hostvars):
+        unknown = [name for name in hosts if name not in hostvars]
+        if unknown:
+            raise AnsibleActionFail("hosts not in the inventory: {hosts}".format(hosts=", ".join(unknown)))
+
+    def get_host_volume_responder(self, host: BatchHost, password: str):
+        luks_volumes = self._get_task_arg('luks_volumes')
+        if not luks_volumes:
+            return None
+        try:
+            # Volumes without a password use the host's password
+            return VolumePromptResponder(parse_luks_volumes(luks_volumes, password), password)
+        except ValueError as e:
+            raise BatchHostFailed(to_text(e))
+
+    def get_host_metrics(self, host: BatchHost):
+        path = self.luks_metrics_file
+        if not path:
+            return None
+        # All hosts share the labels, as they are task args
+        return UnlockMetrics(path, self._metrics_run_id, host.name, self.luks_metrics_labels)
+
+    def record_attempt(self, metrics, phase: str, attempt: int, start: float, error=None, exit_code: int = None):
+        if metrics is not None:
+            self.write_metrics(lambda: metrics.attempt(phase, attempt, time.monotonic() - start, error, exit_code))
+
+    def get_host_ssh_args(self, host: BatchHost, command: str = None):
+        """Returns the SSH client args to run command on the host, or to
+        print its SSH config with "ssh -G" if command is None.
+
+        Uses the host's ansible_ssh_executable, or else luks_ssh_executable,
+        and the host's ansible_ssh_args, ansible_ssh_common_args and
+        ansible_ssh_extra_args. Settings that are not host variables, such as
+        the [ssh_connection] section of ansible.cfg, are not used."""
+        args = [host.ssh_executable or self.luks_ssh_executable]
+        if command is None:
+            args.append('-G')
+        args.extend(host.ssh_args)
+        args.extend([
+            '-p', str(host.port),
+            '-o', 'BatchMode=yes',
+            '-o', 'ConnectTimeout=%d' % self.batch_connect_timeout,
+        ])
+        if host.private_key_file:
+            args.extend(['-i', host.private_key_file])
+        if host.user:
+            args.extend(['-o', 'User=%s' % host.user])
+        args.append(host.addr)
+        if command is not None:
+            args.append(self.get_host_become_command(host, command))
+        return args
+
+    def get_host_become(self, host: BatchHost):
+        """Returns (become, become_user, become_password) of the host, with
+        the play's settings as fallback. Raises BatchHostFailed for become
+        methods other than sudo, as there is no TTY to run e.g su."""
+        become = host.become
+        if become is None:
+            become = self._play_context.become
+        if not boolean(become, strict=False):
+            return False, None, None
+        method = host.become_method or self._play_context.become_method or 'sudo'
+        if method != 'sudo':
+            raise BatchHostFailed("become_method {method} is not supported when rebooting in batch, only sudo".format(
+                method=method))
+        user = host.become_user or self._play_context.become_user or 'root'
+        password = host.become_password or self._play_context.become_pass
+        return True, str(user), str(password) if password else None
+
+    def get_host_become_command(self, host: BatchHost, command: str):
+        become, user, password = self.get_host_become(host)
+        if not become:
+            return command
+        # Without a password, sudo must not ask for one, as there is no TTY
+        sudo = 'sudo -S -p ""' if password else 'sudo -n'
+        return '{sudo} -u {user} sh -c {command}'.format(
+            sudo=sudo, user=shlex.quote(user), command=shlex.quote(command))
+
+    async def run_host_command(self, host: BatchHost, command: str, timeout: float):
+        """Runs command on the host, as the become user if become is
+        enabled, and returns (returncode, output)."""
+        _, _, password = self.get_host_become(host)
+        return await self.run_process(
+            self.get_host_ssh_args(host, command),
+            input_data=password + '\n' if password else None,
+            timeout=timeout)
+
+    async def resolve_host_ssh_config_addr(self, host: BatchHost, args):
+        try:
+            rc, output = await self.run_process(args, timeout=self.DEFAULT_LUKS_SSH_PREFLIGHT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            rc, output = None, to_text(e)
+        if rc != 0:
+            display.vvv("{action}: {host}: Failed reading SSH config via {executable} -G, probing {addr}: {output}".format(
+                action=self._task.action, host=host.name, executable=args[0], addr=host.addr, output=output.strip()))
+            return host.addr
+        return self.get_ssh_config_probe_addr(output, host.addr)
+
+    async def resolve_host_probe_addrs(self, host: BatchHost):
+        """Same as resolve_probe_addrs, but for one host of the batch."""
+        host.luks_probe_addr = None
+        host.sshd_probe_addr = None
+        if self.luks_ssh_probe:
+            host.luks_probe_addr = await self.resolve_host_ssh_config_addr(
+                host, self.get_luks_ssh_config_args(remote_addr=host.addr))
+        if self.luks_sshd_probe:
+            host.sshd_probe_addr = await self.resolve_host_ssh_config_addr(host, self.get_host_ssh_args(host))
+        for name, addr in (('luks', host.luks_probe_addr), ('sshd', host.sshd_probe_addr)):
+            if addr is None:
+                display.vvv("{action}: {host}: not probing the {name} port".format(
+                    action=self._task.action, host=host.name, name=name))
+
+    async def run_process(self, args, input_data: str = None, timeout: float = None):
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,  # capture STDOUT
+            stderr=subprocess.STDOUT)  # redirect STDERR to STDOUT
+        try:
+            stdout, _ = await asyncio.wait_for(
+                proc.communicate(input_data.encode() if input_data is not None else None),
+                timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+        return proc.returncode, stdout.decode(errors='replace')
+
+    async def run_unlock_process(self, args, password: str, responder=None, timeout: float = None):
+        """Same as run_process, but checks the output of the remote session
+        for stop keywords as it arrives.
+
+        If responder (a VolumePromptResponder) is set, then the password is
+        not written upfront, and the responder's answers to the output are
+        written instead. The session is killed after timeout seconds.
+
+        Stop keywords are handled by an UnlockSession, the same as in
+        run_ssh_process. If the session exits with 0 or 255 (an error of
+        the SSH client), then the keyword is not returned.
+
+        Returns (returncode, output, keyword), where keyword is the found
+        stop keyword or None. The returncode is None on timeout, or if the
+        session was killed after a stop keyword."""
+        session = UnlockSession(self.get_stop_keyword_matcher(), responder, timeout, client_error_status=255)
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,  # capture STDOUT
+            stderr=subprocess.STDOUT)  # redirect STDERR to STDOUT
+        try:
+            try:
+                if responder is None:
+                    proc.stdin.write(password.encode())
+                    await proc.stdin.drain()
+                    proc.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # Exited before reading STDIN, e.g on connection errors
+                pass
+            rc = None
+            while not session.expired():
+                try:
+                    chunk = await asyncio.wait_for(proc.stdout.read(4096), session.time_left())
+                except asyncio.TimeoutError:
+                    break
+                reply = session.feed(chunk)
+                if session.keyword is not None and not proc.stdin.is_closing():
+                    proc.stdin.close()
+                if reply:
+                    try:
+                        proc.stdin.write(reply.encode())
+                        await proc.stdin.drain()
+                    except (BrokenPipeError, ConnectionResetError):
+                        # Exited while answering, the exit code tells why
+                        pass
+                if not chunk:
+                    remaining = session.time_left()
+                    try:
+                        rc = await asyncio.wait_for(proc.wait(), max(0, remaining) if remaining is not None else None)
+                    except asyncio.TimeoutError:
+                        pass
+                    break
+            return rc, session.output, session.finish(rc)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            if not proc.stdin.is_closing():
+                proc.stdin.close()
+
+    async def preflight_host(self, host: BatchHost):
+        rc, output = await self.run_process(
+            self.get_luks_ssh_config_args(remote_addr=host.addr),
+            timeout=self.DEFAULT_LUKS_SSH_PREFLIGHT_TIMEOUT)
+        try:
+            self.check_luks_ssh_config_output(rc, output)
+        except AnsibleActionFail as e:
+            raise BatchHostFailed(to_text(e))
+
+    async def get_host_boot_time(self, host: BatchHost):
+        rc, output = await self.run_host_command(
+            host, self.batch_boot_time_command, timeout=self.batch_connect_timeout * 2)
+        if rc != 0:
+            raise BatchHostFailed("failed to get host boot time info, rc: {rc}, output: {output}".format(
+                rc=rc, output=output.strip()))
+        return output.strip()
+
+    async def wait_for_host_boot(self, host: BatchHost, previous_boot_time: str, timeout: float, timer: PhaseTimer,
+                                 metrics: UnlockMetrics = None, retries: list = None):
+        deadline = time.monotonic() + timeout
+        if host.sshd_probe_addr is not None:
+            try:
+                await async_wait_for_ssh_banner(host.sshd_probe_addr, host.port, timeout=timeout)
+            except SSHProbeTimeout as e:
+                raise BatchHostFailed(to_text(e))
+        scheduler = self.get_host_retry_scheduler("last boot time check", deadline - time.monotonic(), retries)
+        while not scheduler.expired():
+            attempt = timer.attempt('validate')
+            attempt_start = time.monotonic()
+            try:
+                boot_time = await self.get_host_boot_time(host)
+                if boot_time and boot_time != previous_boot_time:
+                    self.record_attempt(metrics, 'validate', attempt, attempt_start)
+                    return
+                self.record_attempt(metrics, 'validate', attempt, attempt_start, ERROR_BOOT_TIME_UNCHANGED)
+                error = ERROR_BOOT_TIME_UNCHANGED
+            except (BatchHostFailed, asyncio.TimeoutError) as e:
+                self.record_attempt(metrics, 'validate', attempt, attempt_start, e)
+                error = classify_error(e)[0]
+            await asyncio.sleep(scheduler.next_sleep(error))
+        raise BatchHostFailed("Timed out waiting for last boot time check (timeout={timeout})".format(
+            timeout=timeout))
+
+    def get_host_retry_scheduler(self, name: str, timeout: float, retries: list = None) -> RetryScheduler:
+        # The schedulers are per host, as all hosts share this action
+        scheduler = self.get_retry_scheduler(name, timeout)
+        if retries is not None:
+            retries.append(scheduler)
+        return scheduler
+
+    async def unlock_host(self, host: BatchHost, password: str, timer: PhaseTimer, responder=None,
+                          metrics: UnlockMetrics = None, dropbear_answered: bool = False, retries: list = None):
+        scheduler = self.get_host_retry_scheduler(
+            "post-reboot unlock LUKS full-disk encryption", self.luks_ssh_timeout, retries)
+        args = self.get_luks_ssh_args(remote_addr=host.addr)
+        last_output = ''
+        while not scheduler.expired():
+            attempt = timer.attempt('unlock')
+            attempt_start = time.monotonic()
+            if responder is not None:
+                responder.new_session()
+            try:
+                rc, output, keyword = await self.run_unlock_process(
+                    args, password, responder, self.get_luks_ssh_attempt_timeout(scheduler))
+            except LuksSSHError as e:
+                # E.g a prompt for a volume without passphrase
+                self.record_attempt(metrics, 'unlock', attempt, attempt_start, e)
+                raise BatchHostFailed("LUKS unlock disk-encryption via SSH prompt failed: {error}".format(error=e))
+            if keyword is not None:
+                self.record_attempt(metrics, 'unlock', attempt, attempt_start, REASON_STOP_KEYWORD, rc)
+                raise BatchHostFailed("LUKS unlock disk-encryption via SSH prompt failed, found stop keyword {keyword!r}, output: {output}".format(
+                    keyword=keyword, output=output))
+            if rc == 0:
+                self.record_attempt(metrics, 'unlock', attempt, attempt_start)
+                display.display("{action}: {host}: LUKS SSH unlock successful, output:\n\t{output}".format(
+                    action=self._task.action, host=host.name, output=output.replace("\n", "\n\t")))
+                return
+            if rc is None:
+                error = REASON_TIMEOUT
+            elif rc == 255:
+                error, message = classify_openssh_output(output)
+                # On the same port as sshd, the error may come from the old
+                # sshd until the probe saw Dropbear
+                if is_permanent(error) and (dropbear_answered or host.port != self.luks_ssh_port):
+                    self.record_attempt(metrics, 'unlock', attempt, attempt_start, error, rc)
+                    raise BatchHostPermanentError("LUKS SSH unlock failed, and retrying won't help: {error}: {message}".format(
+                        error=error, message=message))
+            else:
+                error = REASON_EXIT_STATUS
+            self.record_attempt(metrics, 'unlock', attempt, attempt_start, error, rc)
+            last_output = output
+            display.vvv("{action}: {host}: LUKS SSH unlock failed (rc={rc}), will retry, output:\n\t{output}".format(
+                action=self._task.action, host=host.name, rc=rc, output=output.replace("\n", "\n\t")))
+            await asyncio.sleep(scheduler.next_sleep(error))
+        raise BatchHostFailed("Timed out waiting for post-reboot unlock LUKS full-disk encryption (timeout={timeout}), last output: {output}".format(
+            timeout=self.luks_ssh_timeout, output=last_output))
+
+    async def wait_for_host_auto_unlock(self, host: BatchHost, previous_banner: str, timer: PhaseTimer):
+        """Waits for the host to unlock by itself, by waiting for its regular
+        SSH server to come back. Returns false if it did not in time."""
+        if previous_banner is None:
+            display.warning("{action}: {host}: SSH server did not answer before the reboot, so cannot tell if the host unlocks by itself. Unlocking via SSH".format(
+                action=self._task.action, host=host.name))
+            return False
+        same_port = host.port == self.luks_ssh_port
+        deadline = time.monotonic() + self.luks_auto_unlock_timeout
+        attempts = 0
+        while True:
+            try:
+                probe = await async_wait_for_ssh_banner(
+                    host.sshd_probe_addr, host.port,
+                    timeout=deadline - time.monotonic(),
+                    interval=self.luks_ssh_probe_interval,
+                    probe_timeout=self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT,
+                    previous_banner=previous_banner)
+            except SSHProbeTimeout as e:
+                display.vvv("{action}: {host}: host did not unlock by itself, unlocking via SSH".format(
+                    action=self._task.action, host=host.name))
+                timer.mark('auto_unlock', attempts=attempts + e.attempts)
+                return False
+            attempts += probe.attempts
+            if not same_port or classify_host_state(probe.banner, None, True) == HOST_UP:
+                break
+            # Dropbear answered on the shared port, wait for it to go away
+            previous_banner = probe.banner
+        display.vvv("{action}: {host}: host unlocked by itself".format(action=self._task.action, host=host.name))
+        timer.mark('auto_unlock', attempts=attempts)
+        return True
+
+    async def reboot_and_wait_for_dropbear(self, host: BatchHost, result: dict, timer: PhaseTimer):
+        """Reboots the host and waits for Dropbear to answer, or for the host
+        to unlock by itself if luks_auto_unlock_timeout is set.
+
+        Returns (time of the reboot command, boot time from before the
+        reboot, whether the probe saw Dropbear answer, whether the host
+        unlocked by itself)."""
+        previous_boot_time = await self.get_host_boot_time(host)
+        previous_banner = None
+        if host.luks_probe_addr is not None:
+            try:
+                previous_banner = await async_probe_ssh_banner(
+                    host.luks_probe_addr, self.luks_ssh_port, self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+            except OSError:
+                pass
+        previous_sshd_banner = None
+        if self.luks_auto_unlock_timeout and host.sshd_probe_addr is not None:
+            try:
+                previous_sshd_banner = await async_probe_ssh_banner(
+                    host.sshd_probe_addr, host.port, self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+            except OSError:
+                pass
+
+        timer.mark('pre_reboot')
+        display.vvv("{action}: {host}: rebooting server...".format(action=self._task.action, host=host.name))
+        rc, output = await self.run_host_command(
+            host, self.batch_reboot_command, timeout=self.batch_connect_timeout * 2)
+        timer.mark('reboot')
+        # 255 means the connection was closed by the shutdown, carry on
+        if rc not in (0, 255):
+            raise BatchHostFailed("Reboot command failed. Error was: '{output}'".format(output=output.strip()))
+        rebooted_at = datetime.now(timezone.utc)
+        result['rebooted'] = True
+        result['changed'] = True
+
+        post_reboot_delay = self.post_reboot_delay
+        if post_reboot_delay > 0:
+            await asyncio.sleep(post_reboot_delay)
+            timer.mark('post_reboot_delay')
+
+        if self.luks_auto_unlock_timeout:
+            if await self.wait_for_host_auto_unlock(host, previous_sshd_banner, timer):
+                return rebooted_at, previous_boot_time, False, True
+
+        dropbear_answered = False
+        if host.luks_probe_addr is not None:
+            try:
+                probe = await async_wait_for_ssh_banner(
+                    host.luks_probe_addr, self.luks_ssh_port,
+                    timeout=self.luks_ssh_timeout,
+                    interval=self.luks_ssh_probe_interval,
+                    probe_timeout=self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT,
+                    previous_banner=previous_banner,
+                    watch_down_port=host.port)
+                if probe.down_at is not None:
+                    timer.mark('shutdown', at=probe.down_at)
+                timer.mark('dropbear', attempts=probe.attempts)
+                dropbear_answered = True
+            except SSHProbeTimeout as e:
+                display.warning("{action}: {host}: {error}. Falling back to SSH unlock retry loop".format(
+                    action=self._task.action, host=host.name, error=e))
+        return rebooted_at, previous_boot_time, dropbear_answered, False
+
+    async def reboot_host(self, host: BatchHost, host_vars):
+        result = {'changed': False, 'elapsed': 0, 'rebooted': False, 'unlocked': False}
+        start = datetime.now(timezone.utc)
+        timer = PhaseTimer()
+        metrics_start = time.monotonic()
+        metrics = self.get_host_metrics(host)
+        responder = None
+        auto_unlocked = False
+        retries = []
+        try:
+            if host.connection == 'local':
+                raise BatchHostFailed('Running {0} with local connection would reboot the control node.'.format(
+                    self._task.action))
+
+            password = self.get_host_password(host, host_vars)
+            await self.resolve_host_probe_addrs(host)
+            if self.luks_ssh_preflight:
+                await self.preflight_host(host)
+            responder = self.get_host_volume_responder(host, password)
+            host_state = None
+            if self.luks_unlock_waiting != "never":
+                host_state = await async_probe_host_state(
+                    host.luks_probe_addr or host.addr, host.port, self.luks_ssh_port, self.DEFAULT_LUKS_SSH_PROBE_CONNECT_TIMEOUT)
+                display.vvv("{action}: {host}: host state before rebooting: {state}".format(
+                    action=self._task.action, host=host.name, state=host_state))
+            if host_state == HOST_WAITING:
+                display.vvv("{action}: {host}: host is waiting to be unlocked, skipping the reboot".format(
+                    action=self._task.action, host=host.name))
+                timer.mark('dropbear', attempts=1)
+                # Nothing to compare the boot time with, so any boot time is valid
+                previous_boot_time = None
+                dropbear_answered = True
+                result['changed'] = True
+            elif self.luks_unlock_waiting == "only":
+                if host_state == HOST_UNREACHABLE:
+                    raise BatchHostFailed("Neither the SSH server nor the LUKS SSH server (Dropbear) answered")
+                result['msg'] = "Host is not waiting to be unlocked, skipped it"
+                self.record_host_metrics(metrics, result, timer, metrics_start)
+                return result
+            else:
+                start, previous_boot_time, dropbear_answered, auto_unlocked = await self.reboot_and_wait_for_dropbear(
+                    host, result, timer)
+
+            if not auto_unlocked:
+                try:
+                    await self.unlock_host(host, password, timer, responder, metrics, dropbear_answered,
+                                           retries=retries)
+                except BatchHostFailed as unlock_error:
+                    if not self.luks_manual_unlock_on_fail or isinstance(unlock_error, BatchHostPermanentError):
+                        raise
+                    timeout = self.luks_ssh_reconnect_timeout
+                    display.warning("{action}: LUKS unlock failed. Please unlock the host manually: {ansible_host} (timeout: {timeout} seconds)".format(
+                        action=self._task.action, ansible_host=host.addr, timeout=timeout))
+                    try:
+                        await self.wait_for_host_boot(host, previous_boot_time, timeout, timer, metrics,
+                                                      retries=retries)
+                    except BatchHostFailed:
+                        display.error("{action}: Timed out waiting for you to unlock host manually: {ansible_host} (timeout: {timeout} seconds)".format(
+                            action=self._task.action, ansible_host=host.addr, timeout=timeout))
+                        raise unlock_error
+                timer.mark('unlock')
+
+                post_unlock_delay = self._get_task_arg_int('post_unlock_delay')
+                if post_unlock_delay:
+                    await asyncio.sleep(post_unlock_delay)
+                    timer.mark('post_unlock_delay')
+            result['unlocked'] = True
+
+            await self.wait_for_host_boot(host, previous_boot_time, self.reboot_timeout, timer, metrics,
+                                          retries=retries)
+            timer.mark('validate')
+        except (BatchHostFailed, asyncio.TimeoutError, OSError) as e:
+            result['failed'] = True
+            result['msg'] = to_text(e) or 'Timed out'
+        except Exception as e:
+            # Must not abort the other hosts of the batch
+            result['failed'] = True
+            result['msg'] = "Unexpected error: {type}: {error}".format(type=type(e).__name__, error=to_text(e))
+        self.set_result_elapsed(result, start)
+        result['phases'] = timer.as_dict()
+        if self.luks_auto_unlock_timeout:
+            result['auto_unlocked'] = auto_unlocked
+        if responder is not None:
+            result['volumes'] = responder.results()
+        retries = [scheduler.as_dict() for scheduler in retries if scheduler.retries]
+        if retries:
+            result['retries'] = retries
+        self.record_host_metrics(metrics, result, timer, metrics_start)
+        return result
+
+    def record_host_metrics(self, metrics, result: dict, timer: PhaseTimer, start: float):
+        if metrics is None:
+            return
+        outcome = result_outcome(result)
+        duration = time.monotonic() - start
+        self.write_metrics(lambda: metrics.phases(timer.as_dict()))
+        self.write_metrics(lambda: metrics.result(outcome, duration, result['rebooted']))
+
+    async def run_batch(self, hosts, hostvars):
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        max_failures = self.max_failures
+        results = {}
+        failed_hosts = []
+
+        async def run_host(name: str):
+            async with semaphore:
+                try:
+                    host = BatchHost(name, hostvars[name])
+                    if len(failed_hosts) > max_failures:
+                        results[name] = {
+                            'changed': False, 'elapsed': 0, 'rebooted': False, 'unlocked': False,
+                            'skipped': True,
+                            'msg': 'Skipped as {count} hosts failed, which is more than max_failures={max_failures}'.format(
+                                count=len(failed_hosts), max_failures=max_failures),
+                        }
+                        self.record_host_metrics(self.get_host_metrics(host), results[name], PhaseTimer(), time.monotonic())
+                        return
+                    result = await self.reboot_host(host, hostvars[name])
+                except Exception as e:
+                    # Must not abort the other hosts of the batch
+                    result = {
+                        'changed': False, 'elapsed': 0, 'rebooted': False, 'unlocked': False,
+                        'failed': True,
+                        'msg': "Unexpected error: {type}: {error}".format(type=type(e).__name__, error=to_text(e)),
+                    }
+                if result.get('failed'):
+                    failed_hosts.append(name)
+                    display.warning("{action}: {host}: {msg}".format(
+                        action=self._task.action, host=name, msg=result['msg']))
+                elif not result['unlocked']:
+                    display.display("{action}: {host}: {msg}".format(
+                        action=self._task.action, host=name, msg=result['msg']))
+                elif not result['rebooted']:
+                    display.display("{action}: {host}: unlocked in {elapsed} seconds".format(
+                        action=self._task.action, host=name, elapsed=result['elapsed']))
+                else:
+                    display.display("{action}: {host}: rebooted and unlocked in {elapsed} seconds".format(
+                        action=self._task.action, host=name, elapsed=result['elapsed']))
+                results[name] = result
+
+        await asyncio.gather(*(run_host(name) for name in hosts))
+        return results, failed_hosts
+
+    def run(self, tmp=None, task_vars=None):
+        self._supports_check_mode = True
+
+        if task_vars is None:
+            task_vars = {}
+
+        hosts = self.get_batch_hosts(task_vars)
+
+        if self._play_context.check_mode:
+            return {
+                'changed': True,
+                'hosts': {name: {'changed': True, 'elapsed': 0, 'rebooted': True, 'unlocked': True} for name in hosts},
+            }
+
+        result = super(RebootActionModule, self).run(tmp, task_vars)
+        if result.get('skipped') or result.get('failed'):
+            return result
+
+        try:
+            self.validate_args()
+            self.check_batch_hosts(hosts, task_vars.get('hostvars', {}))
+            self.setup_ssh_private_key_file()
+            if self.luks_ssh_preflight:
+                # The SSH options are checked for each host, before rebooting it
+                self.check_luks_ssh_private_key_file()
+        except AnsibleActionFail as e:
+            result['failed'] = True
+            result['msg'] = to_text(e)
+            return result
+
+        self._metrics_run_id = default_run_id()
+        host_results, failed_hosts = asyncio.run(
+            self.run_batch(hosts, task_vars.get('hostvars', {})))
+        textfile = self.luks_metrics_textfile
+        if textfile:
+            # Once for all hosts, instead of after each host
+            metrics = UnlockMetrics(self.luks_metrics_file, self._metrics_run_id, None)
+            self.write_metrics(lambda: metrics.write_textfile(textfile))
+
+        result['hosts'] = host_results
+        result['changed'] = any(r.get('changed') for r in host_results.values())
+        if failed_hosts:
+            result['failed'] = True
+            result['msg'] = "{count} of {total} hosts failed: {hosts}".format(
+                count=len(failed_hosts), total=len(hosts), hosts=", ".join(failed_hosts))
+        return result
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Controller-side cache of how long each host takes to boot, used to tune
+# the delays of later reboots of the same host.
+#
+# The cache is a JSON file shared by all Ansible forks, so all access is
+# done while holding an exclusive lock on the file.
+
+from datetime import datetime, timezone
+import fcntl
+import json
+import os
+
+BOOT_PROFILE_VERSION = 1
+
+# Time from the reboot command until Dropbear answers
+SAMPLE_DROPBEAR = "dropbear"
+# Time from a successful unlock until the host is reachable via Ansible again
+SAMPLE_SSHD = "sshd"
+
+
+class BootProfileCache:
+    def __init__(self, path: str, max_samples: int = 10):
+        self.path = os.path.expanduser(path)
+        self.max_samples = max_samples
+
+    def _open_locked(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a+", encoding="utf-8")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        return f
+
+    @staticmethod
+    def _read(f):
+        content = f.read()
+        if not content.strip():
+            return {"version": BOOT_PROFILE_VERSION, "hosts": {}}
+        data = json.loads(content)
+        if data.get("version") != BOOT_PROFILE_VERSION:
+            # Unknown format, start over instead of failing the reboot
+            return {"version": BOOT_PROFILE_VERSION, "hosts": {}}
+        return data
+
+    def get(self, host: str):
+        """Returns the profile of the host, or None if nothing is recorded."""
+        if not os.path.exists(self.path):
+            return None
+        with self._open_locked() as f:
+            profile = self._read(f)["hosts"].get(host)
+        if profile is None:
+            return None
+        return BootProfile(profile)
+
+    def record(self, host: str, samples: dict):
+        """Adds samples (seconds, keyed by SAMPLE_* name) to the host's profile."""
+        with self._open_locked() as f:
+            data = self._read(f)
+            profile = data["hosts"].setdefault(host, {})
+            for name, value in samples.items():
+                if value is None:
+                    continue
+                values = profile.setdefault(name, [])
+                values.append(round(value, 3))
+                del values[:-self.max_samples]
+            profile["updated"] = datetime.now(timezone.utc).isoformat()
+            f.seek(0)
+            f.truncate()
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+class BootProfile:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def samples(self, name: str):
+        return list(self.data.get(name) or [])
+
+    def expected_delay(self, name: str, margin: float):
+        """Returns how long it is safe to wait before the host is expected to
+        be ready, which is the fastest recorded sample minus the margin.
+        Returns None if there are no samples."""
+        samples = self.samples(name)
+        if not samples:
+            return None
+        return round(max(0.0, min(samples) - margin), 3)
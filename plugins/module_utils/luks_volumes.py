@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Answers cryptroot-unlock's prompts when several LUKS volumes are unlocked
+# in the initramfs.
+#
+# cryptroot-unlock asks for one volume at a time, in the order the initramfs
+# unlocks them, with a "Please unlock disk NAME:" prompt. Keeping STDIN open
+# and answering each prompt with that volume's passphrase unlocks all of them
+# in a single SSH session.
+
+import re
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_CONFIG,
+    LuksSSHError,
+)
+
+# E.g "Please unlock disk sda3_crypt: " or
+# "Please unlock disk sda3_crypt (/dev/sda3): "
+# and "cryptsetup: sda3_crypt: set up successfully"
+_EVENT_PATTERN = re.compile(
+    r"Please unlock disk (?P<prompt>[^\s:()]+)[^:\n]*:"
+    r"|cryptsetup: (?P<unlocked>[^\s:]+):? set up successfully")
+
+# Unmatched output kept between chunks, enough for a split prompt
+_MAX_BUFFER = 1024
+
+
+def parse_luks_volumes(volumes, default_password=None):
+    """Validates the luks_volumes arg, a list of {name, password} dicts.
+
+    Returns a list of (name, password) tuples, where a missing password is
+    replaced by default_password. Raises ValueError on invalid input."""
+    if not isinstance(volumes, (list, tuple)):
+        raise ValueError("luks_volumes must be a list")
+    parsed = []
+    for volume in volumes:
+        if isinstance(volume, str):
+            volume = {'name': volume}
+        if not isinstance(volume, dict) or not volume.get('name'):
+            raise ValueError("each item in luks_volumes must have a name")
+        unknown = set(volume) - {'name', 'password'}
+        if unknown:
+            raise ValueError("unsupported keys in luks_volumes item %s: %s" % (
+                volume['name'], ", ".join(sorted(unknown))))
+        password = volume.get('password') or default_password
+        if not password:
+            raise ValueError("luks_volumes item %s has no password, and luks_password is not set" % volume['name'])
+        parsed.append((str(volume['name']), str(password)))
+    return parsed
+
+
+class VolumePromptResponder:
+    """Tracks cryptroot-unlock's output for volume prompts, and returns the
+    passphrase to write for each.
+
+    Create one per host and call new_session() before each SSH session. The
+    volumes that got unlocked are remembered between sessions, as a retry
+    only gets prompted for the volumes that are still locked.
+    """
+
+    def __init__(self, volumes, default_password=None):
+        # List of (name, password), in the order they were given
+        self.volumes = list(volumes)
+        self._passwords = dict(self.volumes)
+        self.default_password = default_password
+        self.prompted = {}
+        self.unlocked = set()
+        self._buffer = ""
+
+    def new_session(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> str:
+        """Returns what to write to the session's STDIN, which is empty
+        unless the text completes a prompt.
+
+        Raises LuksSSHError with REASON_CONFIG when prompted for a volume
+        that has no passphrase."""
+        self._buffer += text
+        reply = ""
+        end = 0
+        for match in _EVENT_PATTERN.finditer(self._buffer):
+            end = match.end()
+            name = match.group('prompt')
+            if name is None:
+                self.unlocked.add(match.group('unlocked'))
+                continue
+            self.prompted[name] = self.prompted.get(name, 0) + 1
+            password = self._passwords.get(name, self.default_password)
+            if password is None:
+                raise LuksSSHError(
+                    REASON_CONFIG, "prompted for LUKS volume %r, which is not in luks_volumes" % name)
+            reply += password + "\n"
+        self._buffer = self._buffer[end:][-_MAX_BUFFER:]
+        return reply
+
+    def results(self):
+        """Returns a list of {name, prompts, unlocked} of all given volumes,
+        followed by other volumes that were prompted for."""
+        names = [name for name, _ in self.volumes]
+        names.extend(sorted(set(self.prompted) - set(names)))
+        return [{
+            'name': name,
+            'prompts': self.prompted.get(name, 0),
+            'unlocked': name in self.unlocked,
+        } for name in names]
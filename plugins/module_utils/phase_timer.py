@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+
+class PhaseTimer:
+    """Records the duration of consecutive phases, e.g of a reboot.
+
+    Each phase starts where the previous phase ended, so the durations add up
+    to the total time.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._attempts = {}
+        self._last_mark = time.monotonic()
+
+    def attempt(self, name: str):
+        """Counts one attempt of the given phase, e.g one retry, and returns
+        the number of attempts so far."""
+        self._attempts[name] = self._attempts.get(name, 0) + 1
+        return self._attempts[name]
+
+    def mark(self, name: str, attempts: int = None, at: float = None):
+        """Ends the current phase, naming it and recording its attempts.
+
+        If attempts is not set, then the number of attempt() calls for this
+        phase is used, or 1 if there were none.
+
+        The at argument is a time.monotonic() value for when the phase
+        actually ended, if that was before now.
+        """
+        if at is None:
+            at = time.monotonic()
+        if attempts is None:
+            attempts = self._attempts.get(name, 1)
+        self.phases[name] = {
+            'elapsed': round(max(0.0, at - self._last_mark), 3),
+            'attempts': attempts,
+        }
+        self._last_mark = at
+
+    def total(self, *names: str):
+        """Returns the summed elapsed time of the given phases that were
+        recorded, or None if none of them were."""
+        recorded = [self.phases[name]['elapsed'] for name in names if name in self.phases]
+        if not recorded:
+            return None
+        return sum(recorded)
+
+    def as_dict(self):
+        return {name: dict(phase) for name, phase in self.phases.items()}
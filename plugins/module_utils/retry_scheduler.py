@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Decides how long the unlock and reconnect retry loops sleep between
+# attempts.
+#
+# The loops start once the probes and delays before them expect the host to
+# answer, so the first retries poll at a short interval. If the host still
+# does not answer, e.g while waiting for a manual unlock, the sleeps back off
+# exponentially. No sleep runs past the loop's deadline, and every decision
+# is recorded, so it can be reported in the task result.
+
+import random
+import time
+
+# Polling at the short interval, as the host is expected to answer soon
+REASON_FAST = "fast"
+# Exponential backoff, after the fast window
+REASON_BACKOFF = "backoff"
+# Shortened to end at the loop's deadline
+REASON_DEADLINE = "deadline"
+
+DEFAULT_FAST_INTERVAL = 0.5
+DEFAULT_FAST_WINDOW = 20.0
+DEFAULT_MAX_INTERVAL = 12.0
+# Sleeps are spread by up to this fraction, so hosts don't retry in lockstep
+DEFAULT_JITTER = 0.25
+
+# Decisions kept per loop, older ones are only counted
+MAX_DECISIONS = 20
+
+
+def validate_retry_intervals(fast_interval: float, fast_window: float, max_interval: float):
+    """Raises ValueError if the intervals cannot be used together."""
+    if fast_interval <= 0:
+        raise ValueError("luks_retry_fast_interval must be positive")
+    if fast_window < 0:
+        raise ValueError("luks_retry_fast_window must not be negative")
+    if max_interval < fast_interval:
+        raise ValueError("luks_retry_max_interval must not be less than luks_retry_fast_interval")
+
+
+class RetryScheduler:
+    """Returns the sleep before each retry of one retry loop.
+
+    Sleeps are fast_interval during the first fast_window seconds of the
+    loop, and then double with each retry, starting from twice the
+    fast_interval, up to max_interval. Call next_sleep() after each failed
+    attempt.
+    """
+
+    def __init__(self, name: str, timeout: float,
+                 fast_interval: float = DEFAULT_FAST_INTERVAL,
+                 fast_window: float = DEFAULT_FAST_WINDOW,
+                 max_interval: float = DEFAULT_MAX_INTERVAL,
+                 jitter: float = DEFAULT_JITTER,
+                 clock=time.monotonic):
+        self.name = name
+        self.timeout = timeout
+        self.fast_interval = fast_interval
+        self.fast_window = fast_window
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self._clock = clock
+        self.start = clock()
+        self.deadline = self.start + timeout
+        self.retries = 0
+        self.slept = 0.0
+        self.reasons = {}
+        self.decisions = []
+        self._backoffs = 0
+
+    def remaining(self):
+        """Returns the seconds left until the deadline."""
+        return max(0.0, self.deadline - self._clock())
+
+    def expired(self):
+        return self._clock() >= self.deadline
+
+    def next_sleep(self, error=None):
+        """Returns how long to sleep before the next attempt.
+
+        The error is what the last attempt failed with, e.g as classified by
+        ssh_errors.classify_error, and is only recorded."""
+        now = self._clock()
+        elapsed = now - self.start
+        if elapsed < self.fast_window:
+            reason = REASON_FAST
+            interval = self.fast_interval
+        else:
+            reason = REASON_BACKOFF
+            self._backoffs += 1
+            interval = min(self.fast_interval * 2 ** self._backoffs, self.max_interval)
+        sleep = interval * (1 + random.uniform(-self.jitter, self.jitter))
+        remaining = self.deadline - now
+        if sleep >= remaining:
+            reason = REASON_DEADLINE
+            sleep = max(0.0, remaining)
+
+        self.retries += 1
+        self.slept += sleep
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        self.decisions.append({
+            'retry': self.retries,
+            'at': round(elapsed, 3),
+            'sleep': round(sleep, 3),
+            'reason': reason,
+            'error': error,
+        })
+        del self.decisions[:-MAX_DECISIONS]
+        return sleep
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'timeout': self.timeout,
+            'retries': self.retries,
+            'slept': round(self.slept, 3),
+            'reasons': dict(self.reasons),
+            'decisions': [dict(decision) for decision in self.decisions],
+        }
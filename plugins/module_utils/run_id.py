@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Identifies the ansible-playbook run that an Ansible fork belongs to, e.g to
+# share state between all forks of a run on the control-node.
+
+import os
+
+
+def default_run_id():
+    """Returns an ID shared by all forks of the same ansible-playbook run.
+
+    The forks are all children of the ansible-playbook process, so its PID,
+    together with its start time against PID reuse, identifies the run."""
+    return process_run_id(os.getppid())
+
+
+def process_run_id(pid: int):
+    """Returns the run ID of the run whose ansible-playbook process is pid.
+
+    Once the process is gone, the ID no longer matches the ID returned
+    while it was running, unless its start time cannot be read at all."""
+    try:
+        with open("/proc/%d/stat" % pid, encoding="ascii") as f:
+            # Field 22 is the start time. Skip past the command name, as it
+            # may contain spaces.
+            start_time = f.read().rsplit(")", 1)[1].split()[19]
+        return "%d-%s" % (pid, start_time)
+    except (OSError, IndexError):
+        return str(pid)
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but owned by someone else
+        return True
+    return True
+
+
+def is_run_alive(run_id: str, pid: int) -> bool:
+    """Tells if the run is still going, i.e its ansible-playbook process pid
+    exists, and is not a later process that reused the PID."""
+    return is_process_alive(pid) and process_run_id(pid) == run_id
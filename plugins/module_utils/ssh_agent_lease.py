@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Shares one ssh-agent key between all Ansible forks on the control-node.
+#
+# The lease on the key is held by the ansible-playbook run, identified by
+# the run ID of run_id.default_run_id, and not by the forks, as a run
+# starts new forks for every batch of hosts. The key is only added to the
+# agent by the first run, and only removed once the ansible-playbook process
+# of the last run that holds the lease is gone, so one host cannot remove the
+# key while another host is still unlocking.
+#
+# The first fork of a run that releases the lease starts a watcher process,
+# which waits for the run's ansible-playbook process to exit, and then
+# releases the run's lease. Leases of runs whose process is gone are also
+# discarded whenever the lease is read, in case the watcher was killed.
+#
+# The lease state is kept in a small JSON file per key and agent, and all
+# access is done while holding an exclusive lock on that file.
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from ansible_collections.riskident.luks.plugins.module_utils.run_id import (
+    is_process_alive,
+    is_run_alive,
+)
+
+# Seconds between the watcher's checks if the run is still going
+WATCH_INTERVAL = 2.0
+
+
+class SSHAgentKeyLease:
+    def __init__(self, private_key: str, key_lifetime: int, run_id: str, run_pid: int, lease_dir: str = None):
+        if lease_dir is None:
+            lease_dir = os.path.join(tempfile.gettempdir(), "riskident-luks-%d" % os.getuid())
+        agent = os.environ.get("SSH_AUTH_SOCK", "")
+        # Only a hash of the key is used in the file name, never the key itself
+        lease_id = hashlib.sha256((agent + "\0" + private_key).encode()).hexdigest()
+        self.lease_dir = lease_dir
+        self.path = os.path.join(lease_dir, "ssh-agent-%s.json" % lease_id)
+        self.key_lifetime = key_lifetime
+        # The run holding the lease, and the PID of its ansible-playbook
+        # process
+        self.run_id = run_id
+        self.run_pid = run_pid
+
+    def _open_locked(self):
+        os.makedirs(self.lease_dir, mode=0o700, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        f = os.fdopen(fd, "r+", encoding="utf-8")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    @staticmethod
+    def _read(f):
+        f.seek(0)
+        content = f.read()
+        state = json.loads(content) if content.strip() else {}
+        runs = state.get("runs") or {}
+        state["runs"] = {run_id: run for run_id, run in runs.items() if is_run_alive(run_id, run["pid"])}
+        return state
+
+    @staticmethod
+    def _write(f, state):
+        f.seek(0)
+        f.truncate()
+        json.dump(state, f)
+
+    def acquire(self, add_key):
+        """Takes a lease on the key for the run, calling add_key() if it is
+        not already added to the agent by another lease holder."""
+        with self._open_locked() as f:
+            state = self._read(f)
+            added_at = state.get("added_at") or 0
+            # Re-add when half the agent's key lifetime has passed, in case
+            # the agent is about to drop the key.
+            expired = time.time() - added_at > self.key_lifetime / 2
+            if not state["runs"] or expired:
+                add_key()
+                state["added_at"] = time.time()
+            state["runs"].setdefault(self.run_id, {"pid": self.run_pid, "watcher": None})
+            self._write(f, state)
+
+    def public_key(self, derive_public_key):
+        """Returns the public key of the leased key, only calling
+        derive_public_key() if no lease holder did so before."""
+        with self._open_locked() as f:
+            state = self._read(f)
+            if not state.get("public_key"):
+                state["public_key"] = derive_public_key()
+                self._write(f, state)
+            return state["public_key"]
+
+    def release(self, remove_key, derive_public_key):
+        """Releases the run's lease once the run is over, calling
+        remove_key(public_key) if it was the last lease holder.
+
+        Called by each fork when it is done with the key. The lease is
+        released by a watcher process, which is started by the first fork
+        and waits for the run's ansible-playbook process to exit, so
+        remove_key must not use Ansible's Display.
+
+        The public key is only derived by calling derive_public_key() the
+        first time. It is not secret, so it is kept in the lease file for
+        later tasks."""
+        with self._open_locked() as f:
+            state = self._read(f)
+            if not state.get("public_key"):
+                state["public_key"] = derive_public_key()
+            run = state["runs"].get(self.run_id)
+            if run is None:
+                # The run is already gone
+                self._remove_if_unheld(f, state, remove_key)
+                return
+            if run["watcher"] is None or not is_process_alive(run["watcher"]):
+                run["watcher"] = self.start_watcher(remove_key)
+            self._write(f, state)
+
+    def release_run(self, remove_key):
+        """Discards the leases of runs that are gone, calling
+        remove_key(public_key) if no run holds the lease anymore."""
+        with self._open_locked() as f:
+            self._remove_if_unheld(f, self._read(f), remove_key)
+
+    def _remove_if_unheld(self, f, state, remove_key):
+        # Without a public key, no fork released the key, and it is left to
+        # the agent to drop it after the key lifetime
+        if state["runs"] or not state.get("added_at") or not state.get("public_key"):
+            self._write(f, state)
+            return
+        state["added_at"] = None
+        # Save before removing, so a failing removal does not leave
+        # a stale lease behind
+        self._write(f, state)
+        remove_key(state["public_key"])
+
+    def start_watcher(self, remove_key):
+        """Starts a detached process that calls release_run(remove_key)
+        once the run is gone, and returns its PID.
+
+        The watcher closes all files it inherits, including the locked
+        lease file."""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid != 0:
+            os.close(write_fd)
+            os.waitpid(pid, 0)
+            with os.fdopen(read_fd, "rb") as r:
+                return int(r.read() or 0) or None
+
+        # Forked twice, so the watcher is not a child of the Ansible fork,
+        # and does not keep any of its files open
+        os.close(read_fd)
+        try:
+            os.setsid()
+            watcher_pid = os.fork()
+            if watcher_pid != 0:
+                os.write(write_fd, str(watcher_pid).encode())
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+            while is_run_alive(self.run_id, self.run_pid):
+                time.sleep(WATCH_INTERVAL)
+            self.release_run(remove_key)
+        except BaseException:
+            pass
+        finally:
+            # Never return into the Ansible fork's code
+            os._exit(0)
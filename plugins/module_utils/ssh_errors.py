@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import socket
+import subprocess
+
+# Failure reasons reported when unlocking LUKS via SSH.
+REASON_REFUSED = "refused"
+REASON_TIMEOUT = "timeout"
+REASON_UNREACHABLE = "unreachable"
+REASON_RESOLUTION = "resolution"
+REASON_AUTH = "auth"
+REASON_HOSTKEY = "hostkey"
+REASON_CONFIG = "config"
+REASON_PROTOCOL = "protocol"
+REASON_EXIT_STATUS = "exit_status"
+REASON_STOP_KEYWORD = "stop_keyword"
+# The OpenSSH client exited with 255, which it does for all of its own errors
+REASON_SSH_CLIENT = "ssh_client"
+
+# Reasons that retrying will not fix, such as a rejected key, as opposed to
+# e.g a refused connection while Dropbear is still starting.
+PERMANENT_REASONS = frozenset((
+    REASON_AUTH,
+    REASON_HOSTKEY,
+    REASON_CONFIG,
+    REASON_RESOLUTION,
+))
+
+# Messages of the OpenSSH client, checked in order. The connection errors
+# come first, as e.g a missing identity file is only warned about before
+# connecting.
+_OPENSSH_PATTERNS = [(reason, re.compile(pattern, re.IGNORECASE | re.MULTILINE)) for reason, pattern in (
+    (REASON_REFUSED, r"Connection refused|Connection (reset|closed) by|kex_exchange_identification"),
+    (REASON_TIMEOUT, r"(Connection|Operation) timed out"),
+    (REASON_UNREACHABLE, r"No route to host|Network is unreachable|Host is down"),
+    (REASON_RESOLUTION, r"Could not resolve hostname|Name or service not known|name resolution"),
+    (REASON_CONFIG, (
+        r"Bad configuration option|Unsupported option|^command-line|"
+        r"Identity file .* not accessible|Load key .*:|UNPROTECTED PRIVATE KEY FILE|"
+        r"Unable to negotiate")),
+    (REASON_HOSTKEY, r"Host key verification failed"),
+    (REASON_HOSTKEY, r"REMOTE HOST IDENTIFICATION HAS CHANGED|Host key for .* has changed"),
+    (REASON_AUTH, r"Permission denied|Too many authentication failures|no mutual signature"),
+)]
+
+
+# Other messages of the OpenSSH client itself, e.g when a server stops
+# answering keepalives, or when the session ends
+_OPENSSH_MESSAGES = re.compile(
+    r"^(ssh|ssh-keysign|ssh_askpass): |^Timeout, server .* not responding|^client_loop: |"
+    r"^(Shared connection|Connection) to .* closed|^Received disconnect from|^Disconnected from|"
+    r"^Warning: Permanently added|^Authenticated to ", re.IGNORECASE)
+
+
+def is_openssh_client_message(line: str) -> bool:
+    """Returns true if the output line was written by the OpenSSH client,
+    and not by the remote session."""
+    line = line.strip()
+    if _OPENSSH_MESSAGES.search(line):
+        return True
+    return any(pattern.search(line) for _, pattern in _OPENSSH_PATTERNS)
+
+
+def classify_openssh_output(output: str):
+    """Returns (reason, message) of a failed OpenSSH client, from its output.
+
+    The reason is REASON_SSH_CLIENT if the output is not recognized, and the
+    message is the line that the reason was found in."""
+    for reason, pattern in _OPENSSH_PATTERNS:
+        match = pattern.search(output)
+        if match:
+            start = output.rfind("\n", 0, match.start()) + 1
+            end = output.find("\n", match.end())
+            return reason, output[start:end if end >= 0 else None].strip()
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    return REASON_SSH_CLIENT, lines[-1] if lines else "exited with 255"
+
+
+def is_permanent(reason: str) -> bool:
+    return reason in PERMANENT_REASONS
+
+
+class LuksSSHError(Exception):
+    """Structured error of a failed LUKS SSH unlock attempt.
+
+    The reason is one of the REASON_* constants. The exit_status is only set
+    when the remote command (cryptroot-unlock) ran but did not succeed.
+    """
+
+    def __init__(self, reason: str, message: str, output: str = "", exit_status: int = None):
+        self.reason = reason
+        self.output = output
+        self.exit_status = exit_status
+        super().__init__("%s: %s" % (reason, message))
+
+
+def classify_error(error: Exception):
+    """Returns (error class, exit code) of a failed attempt. The exit code is
+    None if no process exited."""
+    if isinstance(error, LuksSSHError):
+        return error.reason, error.exit_status
+    if isinstance(error, subprocess.TimeoutExpired):
+        return REASON_TIMEOUT, None
+    if isinstance(error, subprocess.CalledProcessError):
+        if error.returncode == 255:
+            # The OpenSSH client does not tell why it failed
+            return REASON_SSH_CLIENT, error.returncode
+        return REASON_EXIT_STATUS, error.returncode
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return REASON_TIMEOUT, None
+    if isinstance(error, OSError):
+        return REASON_UNREACHABLE, None
+    # E.g AnsibleConnectionFailure
+    return type(error).__name__, None
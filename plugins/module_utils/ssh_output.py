@@ -0,0 +1,250 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Reads the output of an SSH unlock session as it arrives, so the session can
+# be aborted as soon as cryptroot-unlock reports a failure, instead of
+# waiting for it to exit.
+
+import codecs
+import os
+import re
+import selectors
+import subprocess
+import time
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_STOP_KEYWORD,
+    LuksSSHError,
+    is_openssh_client_message,
+)
+
+# Seconds a session may take to exit by itself after a stop keyword was
+# found, before it is killed. Its exit code still decides, e.g a session that
+# exits with 0 was successful.
+STOP_KEYWORD_GRACE = 1.0
+
+
+class StopKeywordMatcher:
+    """Finds any of the stop keywords (case insensitive) in output that is
+    fed in chunks.
+
+    All keywords are compiled into a single pattern, and the output is
+    checked line by line, once each line is complete. If client_output is
+    true, then the output also contains the messages of the OpenSSH client,
+    such as "Timeout, server not responding", and those lines are skipped,
+    so only the output of the remote session is matched.
+    """
+
+    def __init__(self, keywords, client_output: bool = True):
+        keywords = [k for k in keywords if k]
+        self.pattern = None
+        self.client_output = client_output
+        if keywords:
+            # Longest first, so the reported keyword is the most specific one
+            keywords = sorted(keywords, key=len, reverse=True)
+            self.pattern = re.compile("|".join(re.escape(k) for k in keywords), re.IGNORECASE)
+        self._line = ""
+
+    def feed(self, text: str):
+        """Returns the first stop keyword found in the lines completed by
+        text, or None."""
+        if self.pattern is None or not text:
+            return None
+        lines = (self._line + text).split("\n")
+        self._line = lines.pop()
+        return self._search(lines)
+
+    def flush(self):
+        """Returns the first stop keyword found in the last line, if the
+        output did not end with a newline, or None."""
+        line, self._line = self._line, ""
+        if self.pattern is None:
+            return None
+        return self._search([line])
+
+    def _search(self, lines):
+        for line in lines:
+            if self.client_output and is_openssh_client_message(line):
+                continue
+            match = self.pattern.search(line)
+            if match:
+                return match.group(0)
+        return None
+
+
+class UnlockSession:
+    """Decides the outcome of one SSH unlock session from its output, the
+    same way for all SSH transports.
+
+    The transport feeds each chunk of output as it arrives, b"" at the end
+    of the output, writes the returned reply to the session's STDIN, and
+    closes STDIN once a stop keyword was found. It waits at most time_left()
+    seconds for more output, or for the session to exit, and then calls
+    finish() with the exit status, or None if the session did not exit in
+    time.
+
+    After a stop keyword, no more replies are returned, and the session
+    gets STOP_KEYWORD_GRACE seconds to exit by itself. Its exit status still
+    decides, e.g a session that exits with 0 was successful. The
+    client_error_status is the exit status of errors of the SSH client
+    itself, such as 255 for OpenSSH, which also take precedence over a stop
+    keyword.
+    """
+
+    def __init__(self, matcher: StopKeywordMatcher = None, responder=None, timeout: float = None,
+                 client_error_status: int = None, clock=time.monotonic):
+        self.matcher = matcher
+        self.responder = responder
+        self.timeout = timeout
+        self.client_error_status = client_error_status
+        self._clock = clock
+        self.deadline = clock() + timeout if timeout is not None else None
+        self.stop_deadline = None
+        self.keyword = None
+        self.output = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def time_left(self):
+        """Returns the seconds until the session must end, or None if it may
+        run forever."""
+        deadlines = [d for d in (self.deadline, self.stop_deadline) if d is not None]
+        if not deadlines:
+            return None
+        return min(deadlines) - self._clock()
+
+    def expired(self):
+        remaining = self.time_left()
+        return remaining is not None and remaining <= 0
+
+    def feed(self, chunk: bytes) -> str:
+        """Adds a chunk of output, and returns the reply to write to STDIN,
+        which may be empty."""
+        text = self._decoder.decode(chunk, final=not chunk)
+        self.output += text
+        if self.keyword is None and self.matcher is not None:
+            self.keyword = self.matcher.feed(text) if chunk else self.matcher.flush()
+            if self.keyword is not None:
+                self.stop_deadline = self._clock() + STOP_KEYWORD_GRACE
+        if self.keyword is None and self.responder is not None and text:
+            return self.responder.feed(text)
+        return ""
+
+    def finish(self, exit_status: int = None):
+        """Returns the stop keyword that failed the session, or None if the
+        exit status decides, i.e the session succeeded with 0, the SSH
+        client failed, or no stop keyword was found. The exit status is
+        None if the session did not exit in time."""
+        if exit_status is not None and exit_status in (0, self.client_error_status):
+            return None
+        return self.keyword
+
+    def stop_keyword_error(self, exit_status: int = None):
+        return LuksSSHError(
+            REASON_STOP_KEYWORD, "found stop keyword %r in output" % self.keyword,
+            output=self.output, exit_status=exit_status)
+
+
+def _kill(proc: subprocess.Popen):
+    proc.kill()
+    proc.wait()
+
+
+def _close_stdin(proc: subprocess.Popen):
+    if proc.stdin.closed:
+        return
+    try:
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+
+
+def _write_reply(proc: subprocess.Popen, reply: str):
+    if not reply or proc.stdin.closed:
+        return
+    try:
+        proc.stdin.write(reply.encode())
+    except BrokenPipeError:
+        # Exited while answering, the exit code tells why
+        pass
+
+
+def run_ssh_process(args, input_data: str, matcher: StopKeywordMatcher, timeout: float = None,
+                    responder=None) -> str:
+    """Runs the SSH client, writes input_data to its STDIN, and returns its
+    combined STDOUT and STDERR.
+
+    If responder (a VolumePromptResponder) is set, then STDIN is kept open,
+    and the responder's answers to the output are written to it.
+
+    Once the matcher finds a stop keyword, no more answers are written, and
+    the process gets STOP_KEYWORD_GRACE seconds to exit. If it then exits
+    with 0, the output is returned, and on 255 (an error of the SSH client)
+    subprocess.CalledProcessError is raised. Otherwise, LuksSSHError with
+    REASON_STOP_KEYWORD is raised.
+
+    Raises subprocess.TimeoutExpired if the process takes longer than
+    timeout, and subprocess.CalledProcessError on a non-zero exit code.
+    The process is killed if it does not exit by itself.
+    """
+    session = UnlockSession(matcher, responder, timeout, client_error_status=255)
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,  # capture STDOUT
+        stderr=subprocess.STDOUT,  # redirect STDERR to STDOUT
+        bufsize=0)
+    try:
+        try:
+            proc.stdin.write(input_data.encode())
+            if responder is None:
+                proc.stdin.close()
+        except BrokenPipeError:
+            # Exited before reading STDIN, e.g on connection errors
+            pass
+
+        returncode = None
+        fd = proc.stdout.fileno()
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            while not session.expired():
+                if not sel.select(session.time_left()):
+                    continue
+                chunk = os.read(fd, 4096)
+                reply = session.feed(chunk)
+                if session.keyword is not None:
+                    _close_stdin(proc)
+                _write_reply(proc, reply)
+                if not chunk:
+                    remaining = session.time_left()
+                    try:
+                        returncode = proc.wait(max(0, remaining) if remaining is not None else None)
+                    except subprocess.TimeoutExpired:
+                        pass
+                    break
+
+        if returncode == 0:
+            return session.output
+        if session.finish(returncode) is not None:
+            raise session.stop_keyword_error(returncode)
+        if returncode is None:
+            raise subprocess.TimeoutExpired(args, timeout, output=session.output)
+        raise subprocess.CalledProcessError(returncode, args, output=session.output)
+    finally:
+        if proc.poll() is None:
+            _kill(proc)
+        proc.stdout.close()
+        _close_stdin(proc)
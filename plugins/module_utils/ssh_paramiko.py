@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# In-process SSH client used to unlock LUKS, as an alternative to spawning
+# the OpenSSH client for every attempt. Requires the paramiko package.
+
+import errno
+import io
+import os
+import socket
+import traceback
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_AUTH,
+    REASON_CONFIG,
+    REASON_EXIT_STATUS,
+    REASON_HOSTKEY,
+    REASON_PROTOCOL,
+    REASON_REFUSED,
+    REASON_RESOLUTION,
+    REASON_TIMEOUT,
+    REASON_UNREACHABLE,
+    LuksSSHError,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_output import UnlockSession
+
+try:
+    import paramiko
+    HAS_PARAMIKO = True
+    PARAMIKO_IMPORT_ERROR = None
+except Exception:
+    # paramiko can raise other errors than ImportError, e.g when used
+    # together with gssapi, or in FIPS mode.
+    HAS_PARAMIKO = False
+    PARAMIKO_IMPORT_ERROR = traceback.format_exc()
+
+UNREACHABLE_ERRNOS = (errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN)
+
+
+def parse_ssh_options(options):
+    """Parses OpenSSH "-o" style options, e.g "Key=Value" or "Key Value".
+
+    Returns a dict with lowercased keys, as OpenSSH options are case
+    insensitive.
+    """
+    parsed = {}
+    for opt in options:
+        opt = opt.strip()
+        if not opt:
+            continue
+        if "=" in opt:
+            key, value = opt.split("=", 1)
+        else:
+            key, _, value = opt.partition(" ")
+        parsed[key.strip().lower()] = value.strip()
+    return parsed
+
+
+def load_private_key(private_key: str = None, private_key_file: str = None):
+    """Loads an SSH private key of any type that paramiko supports."""
+    key_classes = [paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key]
+    last_error = None
+    for key_class in key_classes:
+        try:
+            if private_key is not None:
+                return key_class.from_private_key(io.StringIO(private_key))
+            return key_class.from_private_key_file(os.path.expanduser(private_key_file))
+        except paramiko.SSHException as e:
+            last_error = e
+        except OSError as e:
+            raise LuksSSHError(
+                REASON_CONFIG, "cannot read private key file %s: %s" % (private_key_file, e)) from e
+    raise LuksSSHError(
+        REASON_CONFIG, "unsupported or invalid private key: %s" % last_error) from last_error
+
+
+class ParamikoUnlockClient:
+    """Connects to the LUKS boot SSH server and sends the password.
+
+    The key material, the parsed SSH config, and the known hosts are loaded
+    once and then reused for every attempt.
+    """
+
+    def __init__(self, host: str, port: int, user: str, private_key: str = None,
+                 private_key_file: str = None, connect_timeout: int = None, ssh_options=()):
+        self.options = parse_ssh_options(ssh_options)
+        if "proxyjump" in self.options:
+            raise LuksSSHError(
+                REASON_CONFIG, "ProxyJump is not supported by the paramiko backend, use ProxyCommand instead")
+
+        ssh_config = paramiko.SSHConfig()
+        ssh_config_path = os.path.expanduser("~/.ssh/config")
+        if os.path.exists(ssh_config_path):
+            ssh_config = paramiko.SSHConfig.from_path(ssh_config_path)
+        host_config = ssh_config.lookup(host)
+        # Options given to the task take precedence over ~/.ssh/config,
+        # same as when passing them via "ssh -o"
+        host_config.update(self.options)
+        if isinstance(host_config.get("identityfile"), str):
+            host_config["identityfile"] = [host_config["identityfile"]]
+
+        self.host = host_config.get("hostname", host)
+        self.port = port
+        self.user = user
+        self.connect_timeout = connect_timeout
+        self.proxy_command = host_config.get("proxycommand")
+
+        if private_key is not None or private_key_file is not None:
+            self.pkey = load_private_key(private_key, private_key_file)
+        else:
+            self.pkey = None
+        self.key_filenames = [os.path.expanduser(f) for f in host_config.get("identityfile", [])]
+
+        self.host_keys = paramiko.HostKeys()
+        known_hosts_files = host_config.get("userknownhostsfile", "~/.ssh/known_hosts")
+        for known_hosts_file in known_hosts_files.split():
+            known_hosts_file = os.path.expanduser(known_hosts_file)
+            if os.path.isfile(known_hosts_file):
+                self.host_keys.load(known_hosts_file)
+
+        strict = host_config.get("stricthostkeychecking", "yes").lower()
+        if strict in ("no", "off", "accept-new"):
+            # Changed keys are still rejected, as paramiko checks the known
+            # hosts before calling the policy
+            self.missing_host_key_policy = paramiko.AutoAddPolicy()
+        else:
+            self.missing_host_key_policy = paramiko.RejectPolicy()
+
+    def _new_client(self):
+        client = paramiko.SSHClient()
+        for hostname, keys in self.host_keys.items():
+            for key_type, key in keys.items():
+                client.get_host_keys().add(hostname, key_type, key)
+        client.set_missing_host_key_policy(self.missing_host_key_policy)
+        return client
+
+    def _connect(self, client):
+        sock = None
+        if self.proxy_command:
+            sock = paramiko.ProxyCommand(self.proxy_command)
+        try:
+            client.connect(
+                self.host,
+                port=self.port,
+                username=self.user,
+                pkey=self.pkey,
+                key_filename=self.key_filenames or None,
+                timeout=self.connect_timeout,
+                banner_timeout=self.connect_timeout,
+                auth_timeout=self.connect_timeout,
+                # Only fall back to the agent if we don't have a key
+                allow_agent=self.pkey is None,
+                look_for_keys=False,
+                sock=sock)
+        except socket.gaierror as e:
+            raise LuksSSHError(REASON_RESOLUTION, "could not resolve hostname %s: %s" % (self.host, e)) from e
+        except paramiko.BadHostKeyException as e:
+            raise LuksSSHError(REASON_HOSTKEY, str(e)) from e
+        except paramiko.AuthenticationException as e:
+            raise LuksSSHError(REASON_AUTH, str(e)) from e
+        except paramiko.ssh_exception.NoValidConnectionsError as e:
+            reason = REASON_REFUSED
+            for error in e.errors.values():
+                if error.errno in UNREACHABLE_ERRNOS:
+                    reason = REASON_UNREACHABLE
+            raise LuksSSHError(reason, str(e)) from e
+        except paramiko.SSHException as e:
+            if "known_hosts" in str(e):
+                # Raised by the RejectPolicy
+                raise LuksSSHError(REASON_HOSTKEY, str(e)) from e
+            raise LuksSSHError(REASON_PROTOCOL, str(e)) from e
+        except socket.timeout as e:
+            raise LuksSSHError(REASON_TIMEOUT, "connection timed out") from e
+        except ConnectionRefusedError as e:
+            raise LuksSSHError(REASON_REFUSED, str(e)) from e
+        except OSError as e:
+            if e.errno in UNREACHABLE_ERRNOS:
+                raise LuksSSHError(REASON_UNREACHABLE, str(e)) from e
+            raise LuksSSHError(REASON_PROTOCOL, str(e)) from e
+
+    def run(self, stdin_data: str, matcher=None, timeout: float = None, responder=None) -> str:
+        """Opens a session, writes stdin_data, and returns the output.
+
+        Raises LuksSSHError on failure, with the reason set to
+        REASON_EXIT_STATUS if the remote command exited with non-zero.
+
+        The output is fed to the matcher (a StopKeywordMatcher) as it
+        arrives. Once it finds a stop keyword, the session gets
+        STOP_KEYWORD_GRACE seconds to exit, and unless it exits with 0, it
+        is closed with REASON_STOP_KEYWORD. If timeout is set, then the
+        session is closed with REASON_TIMEOUT after that many seconds.
+
+        If responder (a VolumePromptResponder) is set, then the session's
+        STDIN is kept open, and the responder's answers to the output are
+        written to it.
+        """
+        session = UnlockSession(matcher, responder, timeout)
+        client = self._new_client()
+        try:
+            self._connect(client)
+            try:
+                chan = client.get_transport().open_session(timeout=self.connect_timeout)
+                chan.set_combine_stderr(True)
+                # Same as the OpenSSH client without a command and no TTY,
+                # so Dropbear runs the forced command (cryptroot-unlock)
+                chan.invoke_shell()
+                chan.sendall(stdin_data.encode())
+                if responder is None:
+                    chan.shutdown_write()
+                exit_status = None
+                while not session.expired():
+                    chan.settimeout(session.time_left())
+                    try:
+                        chunk = chan.recv(4096)
+                    except socket.timeout:
+                        continue
+                    reply = session.feed(chunk)
+                    if session.keyword is not None:
+                        chan.shutdown_write()
+                    if reply:
+                        chan.sendall(reply.encode())
+                    if not chunk:
+                        remaining = session.time_left()
+                        if chan.status_event.wait(max(0, remaining) if remaining is not None else None):
+                            exit_status = chan.recv_exit_status()
+                        break
+            except (paramiko.SSHException, OSError) as e:
+                raise LuksSSHError(REASON_PROTOCOL, str(e)) from e
+            if exit_status == 0:
+                return session.output
+            if session.finish(exit_status) is not None:
+                raise session.stop_keyword_error(exit_status)
+            if exit_status is None:
+                raise LuksSSHError(
+                    REASON_TIMEOUT, "session timed out after %s seconds" % timeout,
+                    output=session.output)
+            raise LuksSSHError(
+                REASON_EXIT_STATUS, "remote command exited with %d" % exit_status,
+                output=session.output, exit_status=exit_status)
+        finally:
+            client.close()
@@ -0,0 +1,354 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Cheap readiness checks for SSH servers (Dropbear in the initramfs, or the
+# regular sshd after unlocking), done with plain non-blocking TCP connects
+# instead of spawning a full SSH client for each attempt.
+
+import asyncio
+import errno
+import os
+import selectors
+import socket
+import time
+
+# RFC 4253, section 4.2: the server may send other lines of data before the
+# version string. The version string itself is at most 255 characters.
+MAX_BANNER_BYTES = 8192
+
+
+# States of a host, as seen by probe_host_state
+HOST_UP = "up"
+HOST_WAITING = "waiting"
+HOST_UNREACHABLE = "unreachable"
+
+
+class SSHProbeResult:
+    def __init__(self, banner: str, attempts: int, down_at: float = None):
+        self.banner = banner
+        self.attempts = attempts
+        # Value of time.monotonic() when the host was first seen down,
+        # or None if it was never seen down.
+        self.down_at = down_at
+
+
+class SSHProbeTimeout(Exception):
+    def __init__(self, message: str, attempts: int, last_error: Exception = None):
+        self.attempts = attempts
+        self.last_error = last_error
+        super().__init__(message)
+
+
+def parse_ssh_config(output: str) -> dict:
+    """Parses the output of "ssh -G" into a dict of lowercase option names
+    and their values. Only the first value of each option is kept."""
+    config = {}
+    for line in output.splitlines():
+        name, _, value = line.strip().partition(" ")
+        if name:
+            config.setdefault(name.casefold(), value.strip())
+    return config
+
+
+def ssh_config_proxied(config: dict) -> bool:
+    """Tells if the SSH client connects through a ProxyJump or
+    ProxyCommand, which a TCP probe cannot follow."""
+    return any(config.get(option, "none").casefold() not in ("", "none")
+               for option in ("proxyjump", "proxycommand"))
+
+
+def _wait_for(sock: socket.socket, events: int, deadline: float):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise socket.timeout("timed out")
+    with selectors.DefaultSelector() as sel:
+        sel.register(sock, events)
+        if not sel.select(remaining):
+            raise socket.timeout("timed out")
+
+
+def _read_banner(sock: socket.socket, deadline: float) -> str:
+    data = b""
+    while len(data) < MAX_BANNER_BYTES:
+        _wait_for(sock, selectors.EVENT_READ, deadline)
+        chunk = sock.recv(1024)
+        if not chunk:
+            raise ConnectionResetError(
+                errno.ECONNRESET, "connection closed before SSH banner was received")
+        data += chunk
+        while b"\n" in data:
+            line, data = data.split(b"\n", 1)
+            if line.startswith(b"SSH-"):
+                return line.rstrip(b"\r").decode("ascii", errors="replace")
+    raise ConnectionResetError(
+        errno.EPROTO, "no SSH banner found in the first %d bytes" % MAX_BANNER_BYTES)
+
+
+def probe_ssh_banner(host: str, port: int, timeout: float) -> str:
+    """Connects to host:port once and returns the SSH version banner.
+
+    Raises OSError (including socket.timeout and socket.gaierror) if the
+    server is not reachable or does not speak SSH.
+    """
+    deadline = time.monotonic() + timeout
+    last_error = None
+    for family, socktype, proto, _, addr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setblocking(False)
+            err = sock.connect_ex(addr)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                raise OSError(err, os.strerror(err))
+            _wait_for(sock, selectors.EVENT_WRITE, deadline)
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                raise OSError(err, os.strerror(err))
+            return _read_banner(sock, deadline)
+        except OSError as e:
+            last_error = e
+        finally:
+            sock.close()
+    if last_error is None:
+        last_error = OSError(errno.EADDRNOTAVAIL, "no addresses found for %s" % host)
+    raise last_error
+
+
+def classify_host_state(sshd_banner: str, luks_banner: str, same_port: bool) -> str:
+    """Tells from the SSH banners of the regular SSH port and the LUKS SSH
+    port (Dropbear) if the host is up, waiting in the initramfs to be
+    unlocked, or unreachable. A banner is None if its port did not answer.
+    """
+    if same_port:
+        banner = sshd_banner or luks_banner
+        if banner is None:
+            return HOST_UNREACHABLE
+        # Only one server can listen on the port, so tell them apart by the
+        # banner, e.g "SSH-2.0-dropbear_2022.83"
+        if "dropbear" in banner.casefold():
+            return HOST_WAITING
+        return HOST_UP
+    if sshd_banner is not None:
+        return HOST_UP
+    if luks_banner is not None:
+        return HOST_WAITING
+    return HOST_UNREACHABLE
+
+
+def _probe_or_none(host: str, port: int, timeout: float):
+    try:
+        return probe_ssh_banner(host, port, timeout)
+    except OSError:
+        return None
+
+
+def probe_host_state(host: str, port: int, luks_port: int, timeout: float) -> str:
+    """Probes the regular SSH port and the LUKS SSH port once each, and
+    returns one of HOST_UP, HOST_WAITING, or HOST_UNREACHABLE."""
+    sshd_banner = _probe_or_none(host, port, timeout)
+    luks_banner = None
+    if luks_port != port:
+        luks_banner = _probe_or_none(host, luks_port, timeout)
+    return classify_host_state(sshd_banner, luks_banner, luks_port == port)
+
+
+def _unresolvable(host: str, port: int, attempts: int, error: socket.gaierror):
+    # Retrying until the timeout would not help, e.g for a Host alias that
+    # only the SSH config knows
+    return SSHProbeTimeout(
+        "Cannot resolve {host} to probe for the SSH banner on port {port} (attempts={attempts}): {error}".format(
+            host=host, port=port, attempts=attempts, error=error),
+        attempts=attempts, last_error=error)
+
+
+class _BannerWait:
+    """Bookkeeping of one wait_for_ssh_banner loop, so the sync and the async
+    version only differ in how they probe and sleep."""
+
+    def __init__(self, host: str, port: int, timeout: float, interval: float, probe_timeout: float,
+                 previous_banner: str, watch_down_port: int):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.previous_banner = previous_banner
+        self.watch_down_port = watch_down_port
+        self.deadline = time.monotonic() + timeout
+        self.seen_down = previous_banner is None
+        self.down_at = None
+        self.attempts = 0
+        self.last_error = None
+        self.attempt_start = None
+
+    def next_attempt(self) -> bool:
+        """Starts the next attempt, or returns false once timed out."""
+        self.attempt_start = time.monotonic()
+        if self.attempt_start >= self.deadline:
+            return False
+        self.attempts += 1
+        return True
+
+    def watch_down_timeout(self):
+        """Returns the timeout of the probe of watch_down_port, or None if
+        it is not probed in this attempt."""
+        if self.down_at is None and self.watch_down_port is not None and self.watch_down_port != self.port:
+            return min(self.probe_timeout, self.deadline - self.attempt_start)
+        return None
+
+    def watched_down(self):
+        self.down_at = time.monotonic()
+
+    def banner_timeout(self):
+        return min(self.probe_timeout, self.deadline - time.monotonic())
+
+    def answered(self, banner: str):
+        """Returns the SSHProbeResult if the banner is accepted, or None."""
+        if self.seen_down or banner != self.previous_banner:
+            return SSHProbeResult(banner, self.attempts, self.down_at)
+        return None
+
+    def failed(self, error: OSError):
+        """Records a failed probe. Raises SSHProbeTimeout at once if the host
+        name cannot be resolved."""
+        if isinstance(error, socket.gaierror):
+            raise _unresolvable(self.host, self.port, self.attempts, error)
+        self.last_error = error
+        self.seen_down = True
+        if self.down_at is None and self.watch_down_port == self.port:
+            self.down_at = time.monotonic()
+
+    def sleep_time(self):
+        # Refused connections return immediately, so pace the attempts
+        return min(self.interval - (time.monotonic() - self.attempt_start),
+                   self.deadline - time.monotonic())
+
+    def timeout_error(self):
+        return SSHProbeTimeout(
+            "Timed out waiting for SSH banner on {host}:{port} (timeout={timeout}, attempts={attempts}, last error: {error})".format(
+                host=self.host, port=self.port, timeout=self.timeout, attempts=self.attempts, error=self.last_error),
+            attempts=self.attempts, last_error=self.last_error)
+
+
+def wait_for_ssh_banner(host: str, port: int, timeout: float, interval: float = 0.5,
+                        probe_timeout: float = 2, previous_banner: str = None,
+                        watch_down_port: int = None) -> SSHProbeResult:
+    """Polls host:port until an SSH server answers, or until timeout.
+
+    If previous_banner is set (the banner seen on this port before the
+    reboot), then a banner is only accepted once the port has been seen down
+    at least once, or when the banner differs from the previous one. This
+    prevents mistaking a still running sshd for Dropbear when both use the
+    same port.
+
+    If watch_down_port is set, then that port is also probed until it stops
+    answering, to record when the host went down.
+
+    Gives up at once if the host name cannot be resolved.
+    """
+    wait = _BannerWait(host, port, timeout, interval, probe_timeout, previous_banner, watch_down_port)
+    while wait.next_attempt():
+        watch_timeout = wait.watch_down_timeout()
+        if watch_timeout is not None:
+            try:
+                probe_ssh_banner(host, watch_down_port, watch_timeout)
+            except OSError:
+                wait.watched_down()
+        try:
+            result = wait.answered(probe_ssh_banner(host, port, wait.banner_timeout()))
+            if result is not None:
+                return result
+        except OSError as e:
+            wait.failed(e)
+        sleep = wait.sleep_time()
+        if sleep > 0:
+            time.sleep(sleep)
+    raise wait.timeout_error()
+
+
+async def _async_read_banner(reader, deadline: float) -> str:
+    read_bytes = 0
+    while read_bytes < MAX_BANNER_BYTES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("timed out")
+        try:
+            line = await asyncio.wait_for(reader.readline(), remaining)
+        except asyncio.TimeoutError:
+            raise socket.timeout("timed out")
+        if not line:
+            raise ConnectionResetError(
+                errno.ECONNRESET, "connection closed before SSH banner was received")
+        read_bytes += len(line)
+        if line.startswith(b"SSH-"):
+            return line.rstrip(b"\r\n").decode("ascii", errors="replace")
+    raise ConnectionResetError(
+        errno.EPROTO, "no SSH banner found in the first %d bytes" % MAX_BANNER_BYTES)
+
+
+async def async_probe_ssh_banner(host: str, port: int, timeout: float) -> str:
+    """Same as probe_ssh_banner, but for use in an asyncio event loop."""
+    deadline = time.monotonic() + timeout
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        raise socket.timeout("timed out")
+    try:
+        return await _async_read_banner(reader, deadline)
+    finally:
+        writer.close()
+
+
+async def _async_probe_or_none(host: str, port: int, timeout: float):
+    try:
+        return await async_probe_ssh_banner(host, port, timeout)
+    except OSError:
+        return None
+
+
+async def async_probe_host_state(host: str, port: int, luks_port: int, timeout: float) -> str:
+    """Same as probe_host_state, but for use in an asyncio event loop."""
+    if luks_port == port:
+        sshd_banner = await _async_probe_or_none(host, port, timeout)
+        return classify_host_state(sshd_banner, None, True)
+    sshd_banner, luks_banner = await asyncio.gather(
+        _async_probe_or_none(host, port, timeout),
+        _async_probe_or_none(host, luks_port, timeout))
+    return classify_host_state(sshd_banner, luks_banner, False)
+
+
+async def async_wait_for_ssh_banner(host: str, port: int, timeout: float, interval: float = 0.5,
+                                    probe_timeout: float = 2, previous_banner: str = None,
+                                    watch_down_port: int = None) -> SSHProbeResult:
+    """Same as wait_for_ssh_banner, but for use in an asyncio event loop."""
+    wait = _BannerWait(host, port, timeout, interval, probe_timeout, previous_banner, watch_down_port)
+    while wait.next_attempt():
+        watch_timeout = wait.watch_down_timeout()
+        if watch_timeout is not None:
+            try:
+                await async_probe_ssh_banner(host, watch_down_port, watch_timeout)
+            except OSError:
+                wait.watched_down()
+        try:
+            result = wait.answered(await async_probe_ssh_banner(host, port, wait.banner_timeout()))
+            if result is not None:
+                return result
+        except OSError as e:
+            wait.failed(e)
+        sleep = wait.sleep_time()
+        if sleep > 0:
+            await asyncio.sleep(sleep)
+    raise wait.timeout_error()
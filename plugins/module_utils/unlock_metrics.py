@@ -0,0 +1,359 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Controller-side metrics of reboots and unlocks, to compare the behavior of
+# many hosts within a run, and between runs.
+#
+# Every attempt, phase, and host result is appended as one JSON object per
+# line to an events file, which is shared by all Ansible forks. The events are
+# aggregated per run into a summary file next to it, each event only once,
+# and the summary of the current run can be rendered in the Prometheus
+# textfile format, e.g for node_exporter's textfile collector.
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+import time
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import classify_error
+
+EVENT_ATTEMPT = "attempt"
+EVENT_PHASE = "phase"
+EVENT_RESULT = "result"
+
+# Error class of a boot time check that found the boot from before the reboot
+ERROR_BOOT_TIME_UNCHANGED = "boot_time_unchanged"
+
+RESULT_UNLOCKED = "unlocked"
+RESULT_FAILED = "failed"
+RESULT_SKIPPED = "skipped"
+
+# Histogram buckets, in seconds
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+METRIC_PREFIX = "riskident_luks_"
+
+# Appended to the events file's path for the file of the aggregated events
+SUMMARY_SUFFIX = ".summary.json"
+# Runs kept in the summary file, the most recent ones first
+MAX_SUMMARY_RUNS = 10
+
+_LABEL_NAME_PATTERN = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+# Labels set by the metrics themselves
+_RESERVED_LABELS = ("host", "phase", "outcome", "error", "result", "le", "run_id")
+
+
+def result_outcome(result: dict) -> str:
+    """Returns the RESULT_* of an action plugin's result."""
+    if result.get('failed'):
+        return RESULT_FAILED
+    if result.get('unlocked'):
+        return RESULT_UNLOCKED
+    return RESULT_SKIPPED
+
+
+def validate_labels(labels):
+    """Raises ValueError if labels is not a dict of valid, non-reserved
+    Prometheus label names."""
+    if not isinstance(labels, dict):
+        raise ValueError("labels must be a dict")
+    for name in labels:
+        if not isinstance(name, str) or not _LABEL_NAME_PATTERN.match(name) or name.startswith("__"):
+            raise ValueError("invalid label name: %r" % name)
+        if name in _RESERVED_LABELS:
+            raise ValueError("label name %r is reserved" % name)
+
+
+class UnlockMetrics:
+    def __init__(self, path: str, run_id: str, host: str, labels: dict = None):
+        self.path = os.path.expanduser(path)
+        self.run_id = run_id
+        self.host = host
+        self.labels = {str(k): str(v) for k, v in (labels or {}).items()}
+
+    def _append(self, event: dict):
+        event = dict(event, time=round(time.time(), 3), run_id=self.run_id, host=self.host)
+        if self.labels:
+            event['labels'] = self.labels
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(event, sort_keys=True) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write(line)
+
+    def attempt(self, phase: str, attempt: int, duration: float, error=None, exit_code: int = None):
+        """Records one attempt of a phase, e.g one SSH unlock session.
+
+        The error is None on success, and otherwise either the exception the
+        attempt failed with, or an already classified error, such as one of
+        the REASON_* constants."""
+        error_class = error
+        if isinstance(error, Exception):
+            error_class, error_exit_code = classify_error(error)
+            if exit_code is None:
+                exit_code = error_exit_code
+        self._append({
+            'event': EVENT_ATTEMPT,
+            'phase': phase,
+            'attempt': attempt,
+            'success': error is None,
+            'exit_code': exit_code,
+            'error': error_class,
+            'duration': round(duration, 3),
+        })
+
+    def phases(self, phases: dict):
+        """Records the phases of a PhaseTimer."""
+        for name, phase in phases.items():
+            self._append({
+                'event': EVENT_PHASE,
+                'phase': name,
+                'attempts': phase['attempts'],
+                'duration': phase['elapsed'],
+            })
+
+    def result(self, result: str, duration: float, rebooted: bool):
+        self._append({
+            'event': EVENT_RESULT,
+            'result': result,
+            'rebooted': rebooted,
+            'duration': round(duration, 3),
+        })
+
+    @property
+    def summary_path(self):
+        return self.path + SUMMARY_SUFFIX
+
+    def read_run_summary(self):
+        """Returns the RunSummary of this run.
+
+        The events appended since the last call, by any run, are added to the
+        summaries in summary_path, so the events file is only read once."""
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            stat = os.fstat(f.fileno())
+            state = _read_json(self.summary_path) or {}
+            offset = state.get('offset', 0)
+            if state.get('inode') != stat.st_ino or offset > stat.st_size:
+                # The events file was rotated or truncated
+                state = {}
+                offset = 0
+            runs = {run_id: RunSummary(data) for run_id, data in (state.get('runs') or {}).items()}
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Not written completely yet
+                    break
+                offset += len(line)
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # E.g a line cut short by a full disk
+                    continue
+                runs.setdefault(str(event.get('run_id')), RunSummary()).add(event)
+            # Keep the summaries of the most recent runs only
+            kept = sorted(runs, key=lambda run_id: runs[run_id].time, reverse=True)[:MAX_SUMMARY_RUNS]
+            _write_atomic(self.summary_path, json.dumps({
+                'inode': stat.st_ino,
+                'offset': offset,
+                'runs': {run_id: runs[run_id].as_dict() for run_id in kept},
+            }, sort_keys=True), prefix=".riskident-luks-", suffix=".json.tmp")
+        return runs.get(self.run_id) or RunSummary()
+
+    def write_textfile(self, path: str):
+        """Renders the summary of this run into a Prometheus textfile.
+
+        The file is replaced atomically, as node_exporter may read it at any
+        time. Each fork rewrites it when done, so the last one to finish
+        leaves the summary of the whole run."""
+        content = self.read_run_summary().render(self.run_id)
+        _write_atomic(os.path.expanduser(path), content, mode=0o644, prefix=".riskident-luks-", suffix=".prom.tmp")
+
+
+def _read_json(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # Rebuilt from the whole events file
+        return None
+
+
+def _write_atomic(path: str, content: str, mode: int = None, prefix: str = "", suffix: str = ""):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels.items())
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 3))
+    return str(value)
+
+
+def _series_key(labels: dict) -> str:
+    return json.dumps(labels, sort_keys=True)
+
+
+def _observe(histogram: dict, value: float):
+    counts = histogram.setdefault('counts', [0] * len(DURATION_BUCKETS))
+    histogram['count'] = histogram.get('count', 0) + 1
+    histogram['sum'] = histogram.get('sum', 0.0) + value
+    for i, bucket in enumerate(DURATION_BUCKETS):
+        if value <= bucket:
+            counts[i] += 1
+
+
+def _histogram_lines(name: str, labels: dict, histogram: dict):
+    for bucket, count in zip(DURATION_BUCKETS, histogram['counts']):
+        yield "%s_bucket%s %d" % (name, _labels(dict(labels, le=_format_value(float(bucket)))), count)
+    yield "%s_bucket%s %d" % (name, _labels(dict(labels, le="+Inf")), histogram['count'])
+    yield "%s_sum%s %s" % (name, _labels(labels), _format_value(float(histogram['sum'])))
+    yield "%s_count%s %d" % (name, _labels(labels), histogram['count'])
+
+
+class RunSummary:
+    """Aggregated events of one run, that the textfile is rendered from.
+
+    Every series is keyed by all of its labels, including the
+    luks_metrics_labels of the events, so hosts with different labels are
+    kept apart."""
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        self.phase_durations = data.get('phase_durations', {})
+        self.attempts = data.get('attempts', {})
+        self.failures = data.get('failures', {})
+        self.results = data.get('results', {})
+        # Only the last result of a host counts, if it ran more than once
+        self.host_durations = data.get('host_durations', {})
+        # Labels that all events of the run have in common, or None before
+        # the first event
+        self.labels = data.get('labels')
+        self.time = data.get('time', 0)
+
+    def as_dict(self):
+        return {
+            'phase_durations': self.phase_durations,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'results': self.results,
+            'host_durations': self.host_durations,
+            'labels': self.labels,
+            'time': self.time,
+        }
+
+    def add(self, event: dict):
+        labels = event.get('labels') or {}
+        if self.labels is None:
+            self.labels = dict(labels)
+        else:
+            self.labels = {k: v for k, v in self.labels.items() if labels.get(k) == v}
+        self.time = max(self.time, event.get('time', 0))
+
+        kind = event.get('event')
+        if kind == EVENT_PHASE:
+            key = _series_key(dict(labels, phase=event['phase']))
+            _observe(self.phase_durations.setdefault(key, {}), event['duration'])
+        elif kind == EVENT_ATTEMPT:
+            outcome = "success" if event['success'] else "failure"
+            key = _series_key(dict(labels, phase=event['phase'], outcome=outcome))
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if not event['success']:
+                key = _series_key(dict(labels, phase=event['phase'], error=str(event['error'])))
+                self.failures[key] = self.failures.get(key, 0) + 1
+        elif kind == EVENT_RESULT:
+            key = _series_key(dict(labels, result=event['result']))
+            self.results[key] = self.results.get(key, 0) + 1
+            self.host_durations[event['host']] = [event['duration'], labels]
+
+    def render(self, run_id: str) -> str:
+        """Returns the Prometheus textfile of the run."""
+        common = self.labels or {}
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE %s%s %s" % (METRIC_PREFIX, name, kind))
+            return METRIC_PREFIX + name
+
+        name = metric("phase_duration_seconds", "histogram", "Time spent in each phase of the reboot and unlock.")
+        for key in sorted(self.phase_durations):
+            lines.extend(_histogram_lines(name, json.loads(key), self.phase_durations[key]))
+
+        name = metric("attempts_total", "counter", "Attempts of each phase, such as SSH unlock sessions and boot time checks.")
+        for key in sorted(self.attempts):
+            lines.append("%s%s %d" % (name, _labels(json.loads(key)), self.attempts[key]))
+
+        name = metric("attempt_failures_total", "counter", "Failed attempts of each phase, by error class.")
+        for key in sorted(self.failures):
+            lines.append("%s%s %d" % (name, _labels(json.loads(key)), self.failures[key]))
+
+        name = metric("hosts_total", "counter", "Hosts by result.")
+        results = dict(self.results)
+        seen = {json.loads(key)['result'] for key in results}
+        for result in (RESULT_UNLOCKED, RESULT_FAILED, RESULT_SKIPPED):
+            if result not in seen:
+                # Each result is always written, with the labels of the whole run
+                results[_series_key(dict(common, result=result))] = 0
+        for key in sorted(results):
+            lines.append("%s%s %d" % (name, _labels(json.loads(key)), results[key]))
+
+        name = metric("host_duration_seconds", "gauge", "Total time of the reboot and unlock of each host.")
+        for host in sorted(self.host_durations):
+            duration, labels = self.host_durations[host]
+            lines.append("%s%s %s" % (name, _labels(dict(labels, host=host)), _format_value(float(duration))))
+
+        name = metric("run_info", "gauge", "Run that the other metrics are about.")
+        lines.append("%s%s 1" % (name, _labels(dict(common, run_id=run_id))))
+
+        name = metric("run_timestamp_seconds", "gauge", "Time of the last event of the run.")
+        lines.append("%s%s %s" % (name, _labels(common), _format_value(float(self.time))))
+        return "\n".join(lines) + "\n"
+
+
+def render_textfile(events, run_id: str) -> str:
+    """Returns the Prometheus textfile summary of the events of one run."""
+    summary = RunSummary()
+    for event in events:
+        summary.add(event)
+    return summary.render(run_id)
@@ -0,0 +1,363 @@
+#!/usr/bin/python
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = r'''
+---
+module: initramfs_inspect
+short_description: Checks that the initramfs image can be unlocked via Dropbear
+description:
+  - Reads the file list of an initramfs image, like C(lsinitramfs), and the
+    contents of the files needed to unlock via SSH, without unpacking the
+    image to disk.
+  - Checks that the image contains Dropbear, C(cryptroot-unlock), and an
+    C(authorized_keys) file, and optionally that Dropbear listens on the
+    expected port, that the expected keys are authorized, and that the network
+    config of the C(initramfs_network) role is included.
+  - Fails when any check fails, listing all problems, so a reboot can be
+    skipped before it leaves the host waiting for a manual unlock.
+options:
+  image:
+    description:
+      - Initramfs image to inspect.
+      - Defaults to C(/boot/initrd.img), the image of the newest kernel
+        that the next boot uses, or to the image of the running kernel,
+        C(/boot/initrd.img-<kernel release>), if there is no such link.
+      - Use the image that C(kexec) loads when rebooting via kexec.
+    type: path
+  dropbear_port:
+    description:
+      - Port Dropbear must listen on, as set with C(-p) in C(DROPBEAR_OPTIONS).
+    type: int
+  authorized_keys:
+    description:
+      - Public keys, e.g C(ssh-ed25519 AAAA...), that must be in Dropbear's
+        C(authorized_keys). Options and comments are ignored.
+    type: list
+    elements: str
+    default: []
+  network:
+    description:
+      - Whether the network config of the C(initramfs_network) role must be
+        included.
+    type: bool
+    default: false
+  files:
+    description:
+      - Additional paths that must be in the image, relative to its root,
+        e.g C(usr/lib/modules).
+    type: list
+    elements: str
+    default: []
+'''
+
+EXAMPLES = r'''
+- name: Check the initramfs before rebooting
+  riskident.luks.initramfs_inspect:
+    dropbear_port: 1024
+    authorized_keys:
+      - "{{ lookup('file', '~/.ssh/id_ed25519.pub') }}"
+    network: true
+'''
+
+RETURN = r'''
+image:
+  description: Path of the inspected image.
+  type: str
+  returned: always
+compression:
+  description: Compression of the main archive of the image, e.g C(zstd).
+  type: str
+  returned: when the image could be read
+file_count:
+  description: Number of files, directories and links in the image.
+  type: int
+  returned: when the image could be read
+checks:
+  description: Result of each check, keyed by name.
+  type: dict
+  returned: when the image could be read
+  sample: {"dropbear": true, "cryptroot_unlock": true, "authorized_keys": true, "dropbear_port": false}
+dropbear_ports:
+  description: Ports Dropbear listens on, according to its config in the image.
+  type: list
+  elements: int
+  returned: when the image could be read
+problems:
+  description: Failed checks, as messages.
+  type: list
+  elements: str
+  returned: always
+elapsed:
+  description: Time (in seconds) reading the image took.
+  type: float
+  returned: always
+'''
+
+import os
+import re
+import subprocess
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+
+_CPIO_MAGICS = (b"070701", b"070702")
+_CPIO_HEADER_SIZE = 110
+_CPIO_TRAILER = "TRAILER!!!"
+
+# Magic bytes of the compressed main archive, and the command to decompress it
+_COMPRESSIONS = (
+    (b"\x1f\x8b", "gzip", ["gzip", "-dc"]),
+    (b"\x28\xb5\x2f\xfd", "zstd", ["zstd", "-dcq"]),
+    (b"\xfd7zXZ\x00", "xz", ["xz", "-dc"]),
+    (b"\x02\x21\x4c\x18", "lz4", ["lz4", "-dcq"]),
+    (b"\x04\x22\x4d\x18", "lz4", ["lz4", "-dcq"]),
+    (b"BZh", "bzip2", ["bzip2", "-dc"]),
+    (b"\x89LZO", "lzop", ["lzop", "-dc"]),
+    (b"\x5d\x00\x00", "lzma", ["xz", "--format=lzma", "-dc"]),
+)
+
+_BIN_DIRS = ("bin", "sbin", "usr/bin", "usr/sbin")
+DROPBEAR_CONFIG = "etc/dropbear/config"
+# Dropbear runs as root, whose home is a random directory in the image
+_AUTHORIZED_KEYS_PATTERN = re.compile(r"^root[^/]*/\.ssh/authorized_keys$")
+NETWORK_FILES = ("conf/conf.d/ri-bond-and-vlan.conf", "scripts/local-top/ipaddr")
+_PORT_PATTERN = re.compile(r"-[A-Za-z]*p\s*(?:\S*:)?(\d+)")
+# Key type and base64 blob, after any options of an authorized_keys line
+_PUBLIC_KEY_PATTERN = re.compile(r"((?:sk-)?(?:ssh|ecdsa)-[a-z0-9@.-]+)\s+([A-Za-z0-9+/]+=*)")
+
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("unexpected end of cpio archive")
+        data += chunk
+    return data
+
+
+def _skip(stream, size):
+    while size > 0:
+        chunk = stream.read(min(size, 1 << 20))
+        if not chunk:
+            raise ValueError("unexpected end of cpio archive")
+        size -= len(chunk)
+
+
+def read_cpio(stream, names: set, wanted):
+    """Reads one newc cpio archive up to its trailer, adding all paths to
+    names, and returning {path: content} of the paths that wanted(path) is
+    true for. Returns the number of bytes read."""
+    contents = {}
+    read = 0
+    while True:
+        header = _read_exact(stream, _CPIO_HEADER_SIZE)
+        if header[:6] not in _CPIO_MAGICS:
+            raise ValueError("invalid cpio header")
+        file_size = int(header[54:62], 16)
+        name_size = int(header[94:102], 16)
+        # The name and the data are each padded to 4 bytes
+        name_padded = (_CPIO_HEADER_SIZE + name_size + 3) // 4 * 4 - _CPIO_HEADER_SIZE
+        name = _read_exact(stream, name_padded)[:name_size - 1].decode("utf-8", "replace")
+        data_padded = (file_size + 3) // 4 * 4
+        read += _CPIO_HEADER_SIZE + name_padded + data_padded
+        if name == _CPIO_TRAILER:
+            return contents, read
+        name = name[2:] if name.startswith("./") else name
+        names.add(name)
+        if file_size and wanted(name):
+            contents[name] = _read_exact(stream, data_padded)[:file_size]
+        else:
+            _skip(stream, data_padded)
+
+
+def read_initramfs(path, wanted):
+    """Returns (set of paths, {path: content} of wanted paths, compression)
+    of an initramfs image, which is any number of uncompressed cpio archives,
+    such as CPU microcode, followed by an optionally compressed one."""
+    names = set()
+    contents = {}
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            f.seek(offset)
+            head = f.read(512)
+            if not head:
+                return names, contents, None
+            stripped = head.lstrip(b"\0")
+            if not stripped:
+                # Padding between archives
+                offset += len(head)
+                continue
+            offset += len(head) - len(stripped)
+            f.seek(offset)
+            if stripped[:6] in _CPIO_MAGICS:
+                archive_contents, size = read_cpio(f, names, wanted)
+                contents.update(archive_contents)
+                offset += size
+                continue
+            for magic, compression, command in _COMPRESSIONS:
+                if stripped.startswith(magic):
+                    break
+            else:
+                raise ValueError("unknown compression at offset %d" % offset)
+            # The child reads from the offset of the file descriptor, which
+            # seeking the buffered file does not always move
+            os.lseek(f.fileno(), offset, os.SEEK_SET)
+            process = subprocess.Popen(command, stdin=f, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                archive_contents, _ = read_cpio(process.stdout, names, wanted)
+            finally:
+                process.stdout.close()
+                process.kill()
+                process.wait()
+            contents.update(archive_contents)
+            return names, contents, compression
+
+
+def dropbear_ports(config: str):
+    """Returns the ports set with -p in DROPBEAR_OPTIONS, or [22]."""
+    ports = []
+    for line in config.splitlines():
+        line = line.strip()
+        if line.startswith("DROPBEAR_OPTIONS="):
+            ports = [int(port) for port in _PORT_PATTERN.findall(line.split("=", 1)[1])]
+    return ports or [22]
+
+
+def public_keys(text: str):
+    """Returns the set of (key type, base64 blob) in authorized_keys lines,
+    or of public keys."""
+    keys = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            continue
+        match = _PUBLIC_KEY_PATTERN.search(line)
+        if match:
+            keys.add((match.group(1), match.group(2)))
+    return keys
+
+
+def _wanted(name):
+    return name == DROPBEAR_CONFIG or bool(_AUTHORIZED_KEYS_PATTERN.match(name))
+
+
+def _has_binary(names, binary):
+    return any("%s/%s" % (directory, binary) in names for directory in _BIN_DIRS)
+
+
+def inspect_initramfs(image, dropbear_port=None, authorized_keys=(), network=False, files=()):
+    """Returns the result of all checks of the image, as returned by the
+    module."""
+    start = time.monotonic()
+    result = dict(image=image, problems=[])
+    try:
+        names, contents, compression = read_initramfs(image, _wanted)
+    except (OSError, ValueError) as e:
+        result['problems'].append("cannot read %s: %s" % (image, e))
+        result['elapsed'] = round(time.monotonic() - start, 3)
+        return result
+
+    checks = {}
+    problems = result['problems']
+    checks['dropbear'] = _has_binary(names, "dropbear")
+    if not checks['dropbear']:
+        problems.append("Dropbear is missing")
+    checks['cryptroot_unlock'] = _has_binary(names, "cryptroot-unlock")
+    if not checks['cryptroot_unlock']:
+        problems.append("cryptroot-unlock is missing")
+
+    found_keys = set()
+    for name, content in contents.items():
+        if _AUTHORIZED_KEYS_PATTERN.match(name):
+            found_keys |= public_keys(content.decode("utf-8", "replace"))
+    checks['authorized_keys'] = bool(found_keys)
+    if not found_keys:
+        problems.append("Dropbear's authorized_keys is missing or has no keys")
+    elif authorized_keys:
+        missing = [key for key in authorized_keys if not public_keys(key) <= found_keys]
+        checks['authorized_keys'] = not missing
+        for key in missing:
+            problems.append("key is not in Dropbear's authorized_keys: %s" % " ".join(key.split()[:2]))
+
+    ports = dropbear_ports(contents.get(DROPBEAR_CONFIG, b"").decode("utf-8", "replace"))
+    if dropbear_port is not None:
+        checks['dropbear_port'] = dropbear_port in ports
+        if not checks['dropbear_port']:
+            problems.append("Dropbear listens on port %s, not %d" % (
+                ", ".join(str(port) for port in ports), dropbear_port))
+
+    required = list(files)
+    if network:
+        required.extend(NETWORK_FILES)
+    for path in required:
+        path = path.lstrip("/")
+        checks[path] = path in names
+        if not checks[path]:
+            problems.append("%s is missing" % path)
+
+    result.update(
+        compression=compression,
+        file_count=len(names),
+        checks=checks,
+        dropbear_ports=ports,
+        elapsed=round(time.monotonic() - start, 3),
+    )
+    return result
+
+
+def default_image():
+    # Debian and Ubuntu link the image of the newest installed kernel here,
+    # which is what the boot loader boots by default
+    if os.path.exists("/boot/initrd.img"):
+        return "/boot/initrd.img"
+    return "/boot/initrd.img-%s" % os.uname().release
+
+
+def failure_msg(image, problems):
+    return "initramfs %s cannot be unlocked via SSH: %s" % (image, "; ".join(problems))
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            image=dict(type='path'),
+            dropbear_port=dict(type='int'),
+            authorized_keys=dict(type='list', elements='str', default=[], no_log=False),
+            network=dict(type='bool', default=False),
+            files=dict(type='list', elements='str', default=[]),
+        ),
+        supports_check_mode=True,
+    )
+    image = module.params['image'] or default_image()
+    result = inspect_initramfs(
+        image,
+        dropbear_port=module.params['dropbear_port'],
+        authorized_keys=module.params['authorized_keys'],
+        network=module.params['network'],
+        files=module.params['files'],
+    )
+    if result['problems']:
+        module.fail_json(msg=failure_msg(image, result['problems']), **result)
+    result['msg'] = "initramfs %s has everything to unlock via SSH" % image
+    module.exit_json(changed=False, **result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = r'''
+---
+module: initramfs_update
+short_description: Rebuilds the initramfs only when its inputs have changed
+description:
+  - Fingerprints the files that the initramfs is built from, such as the
+    initramfs-tools config, hooks and scripts, and the Dropbear config and
+    authorized_keys.
+  - Runs C(update-initramfs -u) only when the fingerprint differs from the
+    one recorded at the last successful build, and reports which inputs
+    changed.
+  - Running it several times in a play, e.g from the handlers of multiple
+    roles, only rebuilds the initramfs once.
+options:
+  paths:
+    description:
+      - Files and directories to fingerprint. Directories are read
+        recursively. Paths that do not exist are skipped.
+    type: list
+    elements: path
+    default:
+      - /etc/initramfs-tools
+      - /etc/dropbear/initramfs
+      - /etc/dropbear-initramfs
+      - /etc/crypttab
+  state_file:
+    description:
+      - Where the fingerprint of the last successful build is recorded.
+    type: path
+    default: /var/lib/riskident-luks/initramfs-fingerprint.json
+  command:
+    description:
+      - Command that rebuilds the initramfs.
+    type: str
+    default: update-initramfs -u
+  force:
+    description:
+      - Rebuild even if no inputs have changed.
+    type: bool
+    default: false
+  image:
+    description:
+      - Initramfs image whose size is reported before and after the
+        rebuild.
+      - Defaults to the image of the running kernel,
+        C(/boot/initrd.img-<kernel release>).
+    type: path
+'''
+
+EXAMPLES = r'''
+- name: Update initramfs
+  riskident.luks.initramfs_update:
+
+- name: Update initramfs, also watching a custom hook
+  riskident.luks.initramfs_update:
+    paths:
+      - /etc/initramfs-tools
+      - /etc/dropbear/initramfs
+      - /usr/local/share/my-initramfs-hook
+'''
+
+RETURN = r'''
+rebuilt:
+  description: Whether the initramfs was rebuilt, or would have been in check mode.
+  type: bool
+  returned: always
+changed_inputs:
+  description:
+    - Inputs that differ from the last build, and how they changed.
+    - Lists all inputs as C(added) when there is no recorded build.
+  type: list
+  elements: dict
+  returned: always
+  sample: [{"path": "/etc/initramfs-tools/conf.d/ri-bond-and-vlan.conf", "change": "modified"}]
+fingerprint:
+  description: SHA-256 fingerprint of all inputs.
+  type: str
+  returned: always
+elapsed:
+  description: Time (in seconds) the rebuild took.
+  type: float
+  returned: when rebuilt
+previous_elapsed:
+  description: Time (in seconds) the last recorded rebuild took.
+  type: float
+  returned: when a rebuild was recorded
+image:
+  description: Path of the initramfs image whose size is reported.
+  type: str
+  returned: always
+image_size:
+  description: Size (in bytes) of the image, after the rebuild if rebuilt.
+  type: int
+  returned: when the image exists
+image_size_before:
+  description: Size (in bytes) of the image before the rebuild.
+  type: int
+  returned: when rebuilt and the image existed before
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+
+STATE_VERSION = 1
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_fingerprint(path):
+    # The mode is included, as initramfs-tools skips hooks and scripts that
+    # are not executable
+    if os.path.islink(path):
+        return "link:%s" % os.readlink(path)
+    st = os.stat(path)
+    return "%o:%s" % (st.st_mode & 0o7777, hash_file(path))
+
+
+def collect_inputs(paths):
+    """Returns a dict of {path: fingerprint} of all files in paths."""
+    inputs = {}
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    inputs[file_path] = file_fingerprint(file_path)
+        elif os.path.lexists(path):
+            inputs[path] = file_fingerprint(path)
+    return inputs
+
+
+def combined_fingerprint(inputs):
+    sha256 = hashlib.sha256()
+    for path in sorted(inputs):
+        sha256.update(("%s\0%s\n" % (path, inputs[path])).encode())
+    return sha256.hexdigest()
+
+
+def diff_inputs(previous, current):
+    changes = []
+    for path in sorted(set(previous) | set(current)):
+        if path not in previous:
+            changes.append({"path": path, "change": "added"})
+        elif path not in current:
+            changes.append({"path": path, "change": "removed"})
+        elif previous[path] != current[path]:
+            changes.append({"path": path, "change": "modified"})
+    return changes
+
+
+def read_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def image_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def write_state(module, path, inputs, fingerprint, elapsed, size):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o755, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".initramfs-fingerprint-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "fingerprint": fingerprint,
+            "inputs": inputs,
+            "elapsed": elapsed,
+            "image_size": size,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+    module.atomic_move(tmp_path, path)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            paths=dict(type='list', elements='path', default=[
+                '/etc/initramfs-tools',
+                '/etc/dropbear/initramfs',
+                '/etc/dropbear-initramfs',
+                '/etc/crypttab',
+            ]),
+            state_file=dict(type='path', default='/var/lib/riskident-luks/initramfs-fingerprint.json'),
+            command=dict(type='str', default='update-initramfs -u'),
+            force=dict(type='bool', default=False),
+            image=dict(type='path'),
+        ),
+        supports_check_mode=True,
+    )
+
+    try:
+        inputs = collect_inputs(module.params['paths'])
+    except OSError as e:
+        module.fail_json(msg="Failed reading initramfs inputs: %s" % e)
+    fingerprint = combined_fingerprint(inputs)
+
+    state = read_state(module.params['state_file'])
+    previous_inputs = state["inputs"] if state else {}
+    changed_inputs = diff_inputs(previous_inputs, inputs)
+    rebuild = module.params['force'] or state is None or state.get("fingerprint") != fingerprint
+
+    image = module.params['image'] or "/boot/initrd.img-%s" % os.uname().release
+    size = image_size(image)
+    result = dict(
+        changed=rebuild,
+        rebuilt=rebuild,
+        changed_inputs=changed_inputs,
+        fingerprint=fingerprint,
+        image=image,
+    )
+    if size is not None:
+        result['image_size'] = size
+    if state and state.get("elapsed") is not None:
+        result['previous_elapsed'] = state["elapsed"]
+    if not rebuild:
+        result['msg'] = "initramfs inputs unchanged, skipped rebuild"
+        module.exit_json(**result)
+    if module.check_mode:
+        module.exit_json(**result)
+
+    start = time.monotonic()
+    rc, stdout, stderr = module.run_command(module.params['command'], use_unsafe_shell=False)
+    result['elapsed'] = round(time.monotonic() - start, 3)
+    result['stdout'] = stdout
+    result['stderr'] = stderr
+    if size is not None:
+        result['image_size_before'] = size
+    result.pop('image_size', None)
+    size = image_size(image)
+    if size is not None:
+        result['image_size'] = size
+    if rc != 0:
+        result['rc'] = rc
+        module.fail_json(msg="Failed rebuilding initramfs", **result)
+
+    write_state(module, module.params['state_file'], inputs, fingerprint, result['elapsed'], size)
+    if state is None:
+        result['msg'] = "Rebuilt initramfs, no previous build was recorded"
+    elif not changed_inputs:
+        result['msg'] = "Rebuilt initramfs, forced"
+    else:
+        result['msg'] = "Rebuilt initramfs because of changes in: %s" % ", ".join(
+            change["path"] for change in changed_inputs)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
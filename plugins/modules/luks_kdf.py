@@ -0,0 +1,408 @@
+#!/usr/bin/python
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+DOCUMENTATION = r'''
+---
+module: luks_kdf
+short_description: Measures and tunes how long unlocking a LUKS device takes
+description:
+  - Reads the key slots of a LUKS device with C(cryptsetup luksDump), and
+    benchmarks the key derivation function (PBKDF) on the host with
+    C(cryptsetup benchmark).
+  - Measures how long unlocking takes with the given passphrase, using
+    C(cryptsetup open --test-passphrase), which runs the same key derivation
+    as C(cryptroot-unlock) during boot, without activating the device.
+  - When I(target_time) is set and the measured time is off by more than
+    I(tolerance), re-tunes the PBKDF memory and iteration cost of the key slot
+    that the passphrase opens with C(cryptsetup luksConvertKey), for this
+    host's hardware, and measures again.
+options:
+  device:
+    description:
+      - The encrypted block device, e.g C(/dev/sda3).
+    type: path
+    required: true
+  password:
+    description:
+      - Passphrase of one of the key slots.
+    type: str
+    required: true
+  key_slot:
+    description:
+      - Key slot to measure and tune.
+      - By default all key slots are tried in order, as during boot, and the
+        one that the passphrase opens is tuned.
+    type: int
+  target_time:
+    description:
+      - Time (in seconds) unlocking should take. Passed to cryptsetup as
+        C(--iter-time), which benchmarks the PBKDF to find the costs.
+      - When not set, the device is only inspected and measured.
+    type: float
+  tolerance:
+    description:
+      - How far (in percent) the measured time may be off the I(target_time)
+        before the key slot is re-tuned.
+    type: int
+    default: 25
+  pbkdf:
+    description:
+      - PBKDF to use when re-tuning, e.g C(argon2id). Defaults to the one the
+        key slot already uses.
+    type: str
+  pbkdf_memory:
+    description:
+      - Maximum memory cost (in KiB) when re-tuning, passed as
+        C(--pbkdf-memory). Keep it well below the memory available in the
+        initramfs.
+    type: int
+  pbkdf_parallel:
+    description:
+      - Maximum number of threads when re-tuning, passed as
+        C(--pbkdf-parallel).
+    type: int
+  benchmark:
+    description:
+      - Whether to run C(cryptsetup benchmark) for the PBKDF.
+    type: bool
+    default: true
+  header_backup:
+    description:
+      - File to back up the LUKS header to before re-tuning. Not overwritten
+        if it exists. The backup contains the key slots, so keep it as safe
+        as the device's passphrases.
+    type: path
+  cryptsetup:
+    description:
+      - The cryptsetup executable.
+    type: path
+    default: cryptsetup
+notes:
+  - Re-tuning requires LUKS2.
+  - Supports check mode, which measures but does not re-tune.
+'''
+
+EXAMPLES = r'''
+- name: Measure how long unlocking takes
+  riskident.luks.luks_kdf:
+    device: /dev/sda3
+    password: "{{ luks_password }}"
+
+- name: Re-tune the key slot to unlock in about 1 second
+  riskident.luks.luks_kdf:
+    device: /dev/sda3
+    password: "{{ luks_password }}"
+    target_time: 1
+    pbkdf_memory: 262144
+    header_backup: /var/backups/riskident-luks/sda3.img
+'''
+
+RETURN = r'''
+luks_version:
+  description: LUKS version of the device.
+  type: int
+  returned: always
+keyslots:
+  description:
+    - Enabled key slots, as read before re-tuning.
+    - The costs are C(time), C(memory) (KiB) and C(parallel) for Argon2, and
+      C(iterations) for PBKDF2.
+  type: list
+  elements: dict
+  returned: always
+  sample: [{"slot": 0, "pbkdf": "argon2id", "time": 4, "memory": 1048576, "parallel": 4}]
+benchmark:
+  description:
+    - Result of C(cryptsetup benchmark) for the PBKDF. For Argon2, the costs
+      that cryptsetup would pick for C(requested_time) (in seconds). For
+      PBKDF2, the C(iterations_per_second).
+  type: dict
+  returned: when benchmark is true
+  sample: {"pbkdf": "argon2id", "time": 4, "memory": 1048576, "parallel": 4, "requested_time": 2.0}
+unlocked_slot:
+  description: Key slot that the passphrase opened.
+  type: int
+  returned: always
+unlock_time:
+  description: Time (in seconds) unlocking took, before re-tuning.
+  type: float
+  returned: always
+tuned:
+  description: Whether the key slot was re-tuned, or would have been in check mode.
+  type: bool
+  returned: always
+tuned_keyslot:
+  description: The re-tuned key slot, with the same keys as in I(keyslots).
+  type: dict
+  returned: when re-tuned
+unlock_time_after:
+  description: Time (in seconds) unlocking took after re-tuning.
+  type: float
+  returned: when re-tuned
+'''
+
+import os
+import re
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+
+# E.g "  0: luks2" in the "Keyslots:" section of a LUKS2 dump
+_LUKS2_SLOT_PATTERN = re.compile(r"^\s+(\d+): (\S+)$")
+# E.g "Key Slot 0: ENABLED" in a LUKS1 dump
+_LUKS1_SLOT_PATTERN = re.compile(r"^Key Slot (\d+): ENABLED$")
+_FIELD_PATTERN = re.compile(r"^\s+([A-Za-z ]+):\s+(\S+)")
+# Fields of a key slot, and the key they are returned as
+_FIELDS = {
+    "PBKDF": "pbkdf",
+    "Hash": "hash",
+    "Time cost": "time",
+    "Memory": "memory",
+    "Threads": "parallel",
+    "Iterations": "iterations",
+    "Priority": "priority",
+}
+_INT_FIELDS = ("time", "memory", "parallel", "iterations")
+
+# E.g "argon2id      4 iterations, 1048576 memory, 4 parallel threads (CPUs)
+# for 256-bit key (requested 2000 ms time)"
+_ARGON2_BENCHMARK_PATTERN = re.compile(
+    r"^(argon2i|argon2id)\s+(\d+) iterations, (\d+) memory, (\d+) parallel threads"
+    r".*\(requested (\d+) ms time\)")
+# E.g "PBKDF2-sha256    2438770 iterations per second for 256-bit key"
+_PBKDF2_BENCHMARK_PATTERN = re.compile(r"^PBKDF2-(\S+)\s+(\d+) iterations per second")
+# E.g "Key slot 0 unlocked."
+_UNLOCKED_PATTERN = re.compile(r"Key slot (\d+) unlocked")
+
+
+def parse_luks_dump(output):
+    """Returns (LUKS version, list of enabled key slots) of the output of
+    cryptsetup luksDump."""
+    version = None
+    hash_spec = None
+    slots = []
+    slot = None
+    in_keyslots = False
+    for line in output.splitlines():
+        if line.startswith("Version:"):
+            version = int(line.split(":", 1)[1])
+            continue
+        if line.startswith("Hash spec:"):
+            # LUKS1 uses the header's hash for PBKDF2
+            hash_spec = line.split(":", 1)[1].strip()
+            continue
+        match = _LUKS1_SLOT_PATTERN.match(line)
+        if match:
+            slot = {"slot": int(match.group(1)), "pbkdf": "pbkdf2", "hash": hash_spec}
+            slots.append(slot)
+            continue
+        if line and not line[0].isspace():
+            # A new section, or a disabled LUKS1 key slot
+            in_keyslots = line.startswith("Keyslots:")
+            slot = None
+            continue
+        match = _LUKS2_SLOT_PATTERN.match(line)
+        if in_keyslots and match:
+            slot = {"slot": int(match.group(1)), "type": match.group(2)}
+            slots.append(slot)
+            continue
+        match = _FIELD_PATTERN.match(line)
+        if slot is not None and match and match.group(1) in _FIELDS:
+            key = _FIELDS[match.group(1)]
+            value = match.group(2)
+            slot[key] = int(value) if key in _INT_FIELDS else value
+    if version is None:
+        raise ValueError("no LUKS version in the output of luksDump")
+    return version, slots
+
+
+def parse_benchmark(output):
+    """Returns the PBKDF result of the output of cryptsetup benchmark, or
+    None if there is none."""
+    for line in output.splitlines():
+        match = _ARGON2_BENCHMARK_PATTERN.match(line)
+        if match:
+            return {
+                "pbkdf": match.group(1),
+                "time": int(match.group(2)),
+                "memory": int(match.group(3)),
+                "parallel": int(match.group(4)),
+                "requested_time": int(match.group(5)) / 1000,
+            }
+        match = _PBKDF2_BENCHMARK_PATTERN.match(line)
+        if match:
+            return {
+                "pbkdf": "pbkdf2",
+                "hash": match.group(1),
+                "iterations_per_second": int(match.group(2)),
+            }
+    return None
+
+
+def needs_tuning(unlock_time, target_time, tolerance):
+    return abs(unlock_time - target_time) > target_time * tolerance / 100
+
+
+class LuksKdf:
+    def __init__(self, module):
+        self.module = module
+        self.params = module.params
+        self.device = self.params['device']
+        self.cryptsetup = self.params['cryptsetup']
+
+    def run(self, args, password=None):
+        data = None
+        if password is not None:
+            # cryptsetup reads the whole key file, so no newline is added
+            data = password.encode()
+        rc, stdout, stderr = self.module.run_command(
+            [self.cryptsetup] + args, data=data, binary_data=True)
+        return rc, stdout + stderr
+
+    def run_or_fail(self, args, msg, password=None):
+        rc, output = self.run(args, password)
+        if rc != 0:
+            self.module.fail_json(msg="%s: %s" % (msg, output.strip()), rc=rc)
+        return output
+
+    def keyslots(self):
+        output = self.run_or_fail(["luksDump", self.device], "Failed reading LUKS header")
+        try:
+            return parse_luks_dump(output)
+        except ValueError as e:
+            self.module.fail_json(msg="Failed reading LUKS header: %s" % e)
+
+    def benchmark(self, pbkdf):
+        args = ["benchmark", "--pbkdf", pbkdf]
+        if self.params['target_time']:
+            args += ["--iter-time", str(int(self.params['target_time'] * 1000))]
+        if self.params['pbkdf_memory']:
+            args += ["--pbkdf-memory", str(self.params['pbkdf_memory'])]
+        if self.params['pbkdf_parallel']:
+            args += ["--pbkdf-parallel", str(self.params['pbkdf_parallel'])]
+        return parse_benchmark(self.run_or_fail(args, "Failed benchmarking %s" % pbkdf))
+
+    def measure_unlock(self, key_slot):
+        """Returns (seconds, key slot) of unlocking with the password."""
+        args = ["open", "--test-passphrase", "--verbose", "--key-file=-", self.device]
+        if key_slot is not None:
+            args += ["--key-slot", str(key_slot)]
+        start = time.monotonic()
+        rc, output = self.run(args, self.params['password'])
+        elapsed = round(time.monotonic() - start, 3)
+        if rc != 0:
+            self.module.fail_json(msg="Failed unlocking %s with the password: %s" % (self.device, output.strip()), rc=rc)
+        match = _UNLOCKED_PATTERN.search(output)
+        if match:
+            key_slot = int(match.group(1))
+        return elapsed, key_slot
+
+    def backup_header(self):
+        path = self.params['header_backup']
+        if not path or os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.run_or_fail(["luksHeaderBackup", self.device, "--header-backup-file", path],
+                         "Failed backing up LUKS header")
+        os.chmod(path, 0o600)
+
+    def tune(self, key_slot, pbkdf):
+        args = [
+            "luksConvertKey", self.device,
+            "--key-slot", str(key_slot),
+            "--key-file=-",
+            "--pbkdf", pbkdf,
+            "--iter-time", str(int(self.params['target_time'] * 1000)),
+        ]
+        if self.params['pbkdf_memory']:
+            args += ["--pbkdf-memory", str(self.params['pbkdf_memory'])]
+        if self.params['pbkdf_parallel']:
+            args += ["--pbkdf-parallel", str(self.params['pbkdf_parallel'])]
+        self.run_or_fail(args, "Failed re-tuning key slot %d" % key_slot, self.params['password'])
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            device=dict(type='path', required=True),
+            password=dict(type='str', required=True, no_log=True),
+            key_slot=dict(type='int'),
+            target_time=dict(type='float'),
+            tolerance=dict(type='int', default=25),
+            pbkdf=dict(type='str'),
+            pbkdf_memory=dict(type='int'),
+            pbkdf_parallel=dict(type='int'),
+            benchmark=dict(type='bool', default=True),
+            header_backup=dict(type='path'),
+            cryptsetup=dict(type='path', default='cryptsetup'),
+        ),
+        supports_check_mode=True,
+    )
+    target_time = module.params['target_time']
+    if target_time is not None and target_time <= 0:
+        module.fail_json(msg="target_time must be greater than 0")
+    if module.params['tolerance'] < 0:
+        module.fail_json(msg="tolerance must not be negative")
+
+    kdf = LuksKdf(module)
+    luks_version, keyslots = kdf.keyslots()
+    unlock_time, unlocked_slot = kdf.measure_unlock(module.params['key_slot'])
+    slot = next((s for s in keyslots if s['slot'] == unlocked_slot), {})
+    pbkdf = module.params['pbkdf'] or slot.get('pbkdf') or 'argon2id'
+
+    result = dict(
+        changed=False,
+        luks_version=luks_version,
+        keyslots=keyslots,
+        unlocked_slot=unlocked_slot,
+        unlock_time=unlock_time,
+        tuned=False,
+    )
+    if module.params['benchmark']:
+        result['benchmark'] = kdf.benchmark(pbkdf)
+
+    # A different PBKDF is only converted to when re-tuning
+    if not target_time or not needs_tuning(unlock_time, target_time, module.params['tolerance']):
+        result['msg'] = "Unlocking takes %.2fs" % unlock_time
+        module.exit_json(**result)
+    if luks_version < 2:
+        module.fail_json(msg="Re-tuning requires LUKS2, %s uses LUKS%d" % (kdf.device, luks_version), **result)
+    if unlocked_slot is None:
+        module.fail_json(msg="Cannot tell which key slot the password opened, set key_slot", **result)
+
+    result['changed'] = True
+    result['tuned'] = True
+    if module.check_mode:
+        result['msg'] = "Unlocking takes %.2fs, would re-tune key slot %d for %.2fs" % (
+            unlock_time, unlocked_slot, target_time)
+        module.exit_json(**result)
+
+    kdf.backup_header()
+    kdf.tune(unlocked_slot, pbkdf)
+    _, tuned_keyslots = kdf.keyslots()
+    result['tuned_keyslot'] = next((s for s in tuned_keyslots if s['slot'] == unlocked_slot), None)
+    result['unlock_time_after'], _ = kdf.measure_unlock(module.params['key_slot'])
+    result['msg'] = "Re-tuned key slot %d, unlocking took %.2fs and now takes %.2fs" % (
+        unlocked_slot, unlock_time, result['unlock_time_after'])
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
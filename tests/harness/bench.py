@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmarks reboot_luks_ssh and reboot_luks_ssh_batch against simulated
+# hosts, and reports the time to unlock and the number of attempts for each
+# scenario. Exits with 1 if a run does not match the scenario's expected
+# results.
+#
+# Usage: python3 tests/harness/bench.py [-s SCENARIO]... [-n REPEAT] [--json] [-v]
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+from harness import check_run, run_scenario, run_status
+from scenarios import SCENARIOS, get_scenario
+
+from ansible.utils.display import Display
+
+COLUMNS = [
+    # (header, key, format)
+    ("scenario", "scenario", "{}"),
+    ("result", "status", "{}"),
+    ("total", "total", "{:.1f}s"),
+    ("to unlock", "time_to_unlock", "{:.1f}s"),
+    ("unlock lag", "unlock_lag", "{:.1f}s"),
+    ("ready lag", "ready_lag", "{:.1f}s"),
+    ("ssh", "ssh_sessions", "{:.0f}"),
+    ("refused", "ssh_refused", "{:.0f}"),
+    ("conn fail", "connection_failures", "{:.0f}"),
+    ("check", "check", "{}"),
+]
+
+
+def summarize(runs: list):
+    """Combines repeated runs of one scenario, using the median of each
+    measurement."""
+    summary = {"scenario": runs[0]["scenario"]}
+    statuses = sorted({run_status(run["result"]) for run in runs})
+    summary["status"] = "/".join(statuses)
+    for _, key, _ in COLUMNS[2:-1]:
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = statistics.median(values) if values else None
+    summary["check"] = "FAIL" if any(run["mismatches"] for run in runs) else "ok"
+    return summary
+
+
+def format_table(summaries: list):
+    rows = [[header for header, _, _ in COLUMNS]]
+    for summary in summaries:
+        rows.append([
+            "-" if summary[key] is None else fmt.format(summary[key])
+            for _, key, fmt in COLUMNS])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    lines = []
+    for row in rows:
+        lines.append("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks reboot_luks_ssh against simulated hosts.")
+    parser.add_argument("-s", "--scenario", action="append",
+                        help="Scenario to run, can be repeated (default: all)")
+    parser.add_argument("-n", "--repeat", type=int, default=1,
+                        help="Number of runs per scenario (default: 1)")
+    parser.add_argument("--json", action="store_true",
+                        help="Print every run as JSON instead of a table")
+    parser.add_argument("--list", action="store_true",
+                        help="List the scenarios and exit")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="Show the action plugin's output, use -vvv for details")
+    options = parser.parse_args()
+
+    if options.list:
+        for scenario in SCENARIOS:
+            print("{name}: {description}".format(name=scenario.name, description=scenario.description))
+        return 0
+
+    scenarios = SCENARIOS
+    if options.scenario:
+        scenarios = [get_scenario(name) for name in options.scenario]
+
+    Display().verbosity = options.verbose
+    all_runs = []
+    summaries = []
+    with tempfile.TemporaryDirectory(prefix="riskident-luks-bench-") as workdir:
+        for scenario in scenarios:
+            runs = []
+            for i in range(options.repeat):
+                print("Running {name} ({i}/{n}): {description}".format(
+                    name=scenario.name, i=i + 1, n=options.repeat,
+                    description=scenario.description), file=sys.stderr)
+                with _quiet(options.verbose == 0):
+                    run = run_scenario(scenario, workdir)
+                run["mismatches"] = check_run(scenario, run)
+                for mismatch in run["mismatches"]:
+                    print("FAIL {name}: {mismatch}".format(name=scenario.name, mismatch=mismatch), file=sys.stderr)
+                runs.append(run)
+            all_runs.extend(runs)
+            summaries.append(summarize(runs))
+
+    if options.json:
+        for run in all_runs:
+            print(json.dumps(run, default=str, sort_keys=True))
+    else:
+        print(format_table(summaries))
+    if any(run["mismatches"] for run in all_runs):
+        return 1
+    return 0
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    """Hides the action plugin's warnings and output."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+if __name__ == "__main__":
+    sys.exit(main())
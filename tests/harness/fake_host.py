@@ -0,0 +1,308 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Simulated host with LUKS encrypted disks, used by the reboot_luks_ssh
+# harness instead of rebooting a real machine.
+#
+# The host follows a timeline that starts when the reboot command is run:
+#
+#   up (old boot) -> down -> initramfs (Dropbear) -> booting -> up (new boot)
+#
+# The timeline is kept in a JSON state file, as it is shared between the
+# harness process (fake Ansible connection and fake SSH servers) and the fake
+# luks_ssh_executable, which runs as a subprocess of the action plugin.
+
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+
+DROPBEAR_BANNER = "SSH-2.0-dropbear_2022.83"
+SSHD_BANNER = "SSH-2.0-OpenSSH_9.2p1 Debian-2+deb12u3"
+
+STATE_UP = "up"
+STATE_DOWN = "down"
+STATE_INITRAMFS = "initramfs"
+STATE_BOOTING = "booting"
+
+LUKS_DEVICE = "sda3_crypt"
+
+
+class Scenario:
+    """Describes how a simulated host behaves when rebooted, and which task
+    args the action plugin is run with.
+
+    All delays are in seconds.
+    """
+
+    def __init__(self, name: str, description: str, args: dict = None,
+                 shutdown_delay: float = 0.5, dropbear_delay: float = 3,
+                 sshd_delay: float = 1, refusals: int = 0,
+                 password: str = "hunter2", wrong_password: bool = False,
+                 manual_unlock_delay: float = None, same_port: bool = False,
+                 connect_fail_delay: float = 0.1, hang: float = 0,
+                 hang_sessions: int = 0, volumes: dict = None,
+                 kdf_delay: float = 0, waiting: bool = False,
+                 rejected_key: bool = False, clevis: bool = False,
+                 tang_down: bool = False, initramfs_missing: list = None,
+                 ssh_config_alias: str = None, ssh_config_proxy: bool = False,
+                 client_timeouts: int = 0, batch_hosts: int = 0, batch_host_vars: list = None,
+                 expect: dict = None):
+        self.name = name
+        self.description = description
+        self.args = args or {}
+        # Time sshd keeps answering after the reboot command
+        self.shutdown_delay = shutdown_delay
+        # Time from the reboot command until Dropbear answers
+        self.dropbear_delay = dropbear_delay
+        # Time from a successful unlock until sshd answers
+        self.sshd_delay = sshd_delay
+        # Number of SSH sessions refused after Dropbear started answering
+        self.refusals = refusals
+        self.password = password
+        # Send a wrong luks_password, which cryptroot-unlock rejects
+        self.wrong_password = wrong_password
+        # Time after Dropbear started answering until a human unlocks the
+        # host by hand, or None to never do so
+        self.manual_unlock_delay = manual_unlock_delay
+        # Run Dropbear on the same port as sshd
+        self.same_port = same_port
+        # Time a failed Ansible connection takes to fail
+        self.connect_fail_delay = connect_fail_delay
+        # Time an SSH session stays open after a wrong password, or in the
+        # hang_sessions
+        self.hang = hang
+        # Number of SSH sessions where cryptroot-unlock never answers
+        self.hang_sessions = hang_sessions
+        # Passwords of several LUKS volumes, keyed by name, which are
+        # prompted for one after another. Uses LUKS_DEVICE and password
+        # when not set
+        self.volumes = volumes
+        # Time cryptsetup takes to derive the key of each of the volumes
+        self.kdf_delay = kdf_delay
+        # Start in the initramfs, waiting to be unlocked, as if the host
+        # was rebooted before the run, e.g by a power outage
+        self.waiting = waiting
+        # Dropbear does not accept the SSH key, e.g an ed25519 key on an old
+        # Dropbear that only supports RSA
+        self.rejected_key = rejected_key
+        # The initramfs unlocks by itself once a Tang server answers, see
+        # fake_tang.py
+        self.clevis = clevis
+        # The Tang server does not answer, so the host waits for an SSH
+        # unlock despite clevis
+        self.tang_down = tang_down
+        # Paths left out of the initramfs image, see fake_initramfs.py
+        self.initramfs_missing = initramfs_missing or []
+        # Host name that only the SSH config of the LUKS SSH client knows,
+        # used as the host's address. Other clients cannot resolve it
+        self.ssh_config_alias = ssh_config_alias
+        # The SSH config of the LUKS SSH client has a ProxyJump, which the
+        # fake client ignores
+        self.ssh_config_proxy = ssh_config_proxy
+        # Number of SSH sessions that the SSH client aborts after the
+        # prompt, as the server stopped answering keepalives
+        self.client_timeouts = client_timeouts
+        # Number of hosts, all behaving like this scenario, rebooted with
+        # the reboot_luks_ssh_batch action plugin instead of reboot_luks_ssh
+        self.batch_hosts = batch_hosts
+        # Extra hostvars of each of the batch_hosts, in order
+        self.batch_host_vars = batch_host_vars or []
+        # Expected measurements of a run, see harness.check_run. The
+        # run is expected to unlock the host when not set
+        self.expect = expect or {"status": "unlocked"}
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+
+class FakeHost:
+    """State of one simulated host, stored in a JSON file.
+
+    All reads and writes are done while holding an exclusive lock on the
+    file, so the state is consistent between processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def create(self, scenario: Scenario):
+        reboot_at = None
+        if scenario.waiting:
+            # Dropbear has just started answering
+            reboot_at = time.time() - scenario.dropbear_delay
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "scenario": scenario.to_dict(),
+                "boot_id": str(uuid.uuid4()),
+                "next_boot_id": str(uuid.uuid4()),
+                "reboot_at": reboot_at,
+                "unlock_at": None,
+                "ssh_sessions": 0,
+                "ssh_refused": 0,
+                "injected_refusals": 0,
+                "hung_sessions": 0,
+                "client_timeouts": 0,
+                "ssh_wrong_password": 0,
+            }, f)
+
+    @contextlib.contextmanager
+    def locked(self):
+        """Yields the state, and writes it back when done."""
+        with open(self.path, "r+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            state = json.load(f)
+            yield state
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+
+    def load(self):
+        with self.locked() as state:
+            return state
+
+    @staticmethod
+    def dropbear_at(state: dict):
+        if state["reboot_at"] is None:
+            return None
+        return state["reboot_at"] + state["scenario"]["dropbear_delay"]
+
+    @staticmethod
+    def effective_unlock_at(state: dict):
+        """Returns when the disk was unlocked, either via SSH or by hand."""
+        unlock_at = state["unlock_at"]
+        manual_delay = state["scenario"]["manual_unlock_delay"]
+        if manual_delay is not None and state["reboot_at"] is not None:
+            manual_at = FakeHost.dropbear_at(state) + manual_delay
+            if unlock_at is None or manual_at < unlock_at:
+                return manual_at
+        return unlock_at
+
+    @staticmethod
+    def status(state: dict, now: float = None):
+        """Returns the state of the host at the time now (time.time())."""
+        if now is None:
+            now = time.time()
+        scenario = state["scenario"]
+        reboot_at = state["reboot_at"]
+        if reboot_at is None or now < reboot_at + scenario["shutdown_delay"]:
+            return STATE_UP
+        unlock_at = FakeHost.effective_unlock_at(state)
+        if unlock_at is not None and now >= unlock_at:
+            if now >= unlock_at + scenario["sshd_delay"]:
+                return STATE_UP
+            return STATE_BOOTING
+        if now >= FakeHost.dropbear_at(state):
+            return STATE_INITRAMFS
+        return STATE_DOWN
+
+    @staticmethod
+    def boot_id(state: dict):
+        if state["reboot_at"] is not None and FakeHost.effective_unlock_at(state) is not None:
+            return state["next_boot_id"]
+        return state["boot_id"]
+
+    def reboot(self):
+        with self.locked() as state:
+            state["reboot_at"] = time.time()
+
+
+class FakeSSHServer:
+    """TCP server that sends an SSH banner while the host is in one of the
+    given states, and resets the connection otherwise.
+
+    Resetting is how a stopped server looks to a TCP probe, while the
+    listening socket can stay open for the whole run.
+    """
+
+    def __init__(self, host: FakeHost, banners: dict, addr: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        # Banner to send, keyed by host state
+        self.banners = banners
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((addr, port))
+        self._sock.listen(16)
+        # So the server thread notices when it is stopped
+        self._sock.settimeout(0.2)
+        self.port = self._sock.getsockname()[1]
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        self._sock.close()
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            with conn:
+                banner = self.banners.get(FakeHost.status(self.host.load()))
+                if banner is None:
+                    # Close with RST instead of FIN
+                    conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    continue
+                try:
+                    conn.sendall((banner + "\r\n").encode("ascii"))
+                except OSError:
+                    pass
+
+
+def start_servers(host: FakeHost, scenario: Scenario, addr: str = "127.0.0.1", dropbear_port: int = 0):
+    """Starts the fake sshd and Dropbear servers on addr. Dropbear listens
+    on dropbear_port, or on any free port if 0.
+
+    Returns (sshd, dropbear), which are the same server if the scenario uses
+    the same port for both."""
+    if scenario.same_port:
+        server = FakeSSHServer(host, {
+            STATE_UP: SSHD_BANNER,
+            STATE_INITRAMFS: DROPBEAR_BANNER,
+        }, addr, dropbear_port).start()
+        return server, server
+    sshd = FakeSSHServer(host, {STATE_UP: SSHD_BANNER}, addr).start()
+    dropbear = FakeSSHServer(host, {STATE_INITRAMFS: DROPBEAR_BANNER}, addr, dropbear_port).start()
+    return sshd, dropbear
+
+
+def state_file_from_env(host_addr: str):
+    """Returns the state file of the host at host_addr. $LUKS_HARNESS_STATE
+    is either the state file of the only host, or a directory with one
+    state file per host address, when several hosts are simulated."""
+    path = os.environ["LUKS_HARNESS_STATE"]
+    if os.path.isdir(path):
+        return os.path.join(path, "%s.json" % host_addr)
+    return path
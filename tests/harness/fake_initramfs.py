@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Builds initramfs images for the initramfs_inspect module, laid out like the
+# ones of initramfs-tools: an uncompressed early archive with CPU microcode,
+# followed by the compressed main archive.
+
+import gzip
+
+# Files of an image with Dropbear, as built by dropbear-initramfs and the
+# initramfs_network role
+DROPBEAR_FILES = {
+    "usr/sbin/dropbear": b"\x7fELF",
+    "usr/bin/cryptroot-unlock": b"#!/bin/sh\n",
+    "etc/dropbear/config": b'DROPBEAR_OPTIONS="-p 1024 -jks"\n',
+    "root-Xp3mUq2Lzd/.ssh/authorized_keys": (
+        b'command="/usr/bin/cryptroot-unlock",no-pty ssh-ed25519 '
+        b'AAAAC3NzaC1lZDI1NTE5AAAAIHarnessHarnessHarnessHarnessHarness unlock\n'),
+    "conf/conf.d/ri-bond-and-vlan.conf": b'BOND_MODE="mode=802.3ad"\n',
+    "scripts/local-top/ipaddr": b"#!/bin/sh\n",
+}
+EARLY_FILES = {
+    "kernel/x86/microcode/GenuineIntel.bin": b"\0" * 1000,
+}
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 4)
+
+
+def cpio(files: dict) -> bytes:
+    """Returns a newc cpio archive of {path: content}, including the
+    directories of the paths."""
+    entries = []
+    directories = set()
+    for path in sorted(files):
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            directories.add("/".join(parts[:i]))
+    for directory in sorted(directories):
+        entries.append((directory, 0o040755, b""))
+    for path in sorted(files):
+        entries.append((path, 0o100644, files[path]))
+    entries.append(("TRAILER!!!", 0, b""))
+
+    archive = b""
+    for ino, (name, mode, data) in enumerate(entries, 1):
+        encoded = name.encode() + b"\0"
+        fields = (ino, mode, 0, 0, 1, 0, len(data), 0, 0, 0, 0, len(encoded), 0)
+        header = b"070701" + b"".join(b"%08X" % field for field in fields)
+        archive += _pad(header + encoded) + _pad(data)
+    return archive
+
+
+def build_image(path: str, files: dict):
+    """Writes an image with the early microcode archive, followed by a gzip
+    compressed archive of files."""
+    with open(path, "wb") as f:
+        f.write(cpio(EARLY_FILES))
+        f.write(gzip.compress(cpio(files)))
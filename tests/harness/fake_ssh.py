@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Fake luks_ssh_executable, standing in for "ssh" connecting to Dropbear and
+# running cryptroot-unlock. Reads the passphrase from STDIN, and answers like
+# the real thing depending on the state of the simulated host.
+#
+# When given a command, it stands in for "ssh" connecting to the host's
+# regular sshd instead, as used by reboot_luks_ssh_batch to reboot the host
+# and to read its boot time.
+#
+# The path of the host's state file is read from $LUKS_HARNESS_STATE, see
+# fake_host.state_file_from_env.
+
+import sys
+import time
+
+from fake_host import (
+    LUKS_DEVICE,
+    STATE_INITRAMFS,
+    STATE_UP,
+    FakeHost,
+    state_file_from_env,
+)
+
+# Exit code of the OpenSSH client on connection errors
+EXIT_SSH_ERROR = 255
+
+# Flags of the OpenSSH client that take a value
+FLAGS_WITH_VALUE = set("BbcDEeFIiJLlmOoPpQRSWw")
+
+# Same as ActionModule.DEFAULT_BOOT_TIME_COMMAND, which is not imported, as
+# that would make every fake SSH session import Ansible
+BOOT_TIME_COMMAND = "cat /proc/sys/kernel/random/boot_id"
+REBOOT_COMMANDS = ("shutdown ", "kexec ")
+
+
+def parse_args(argv):
+    """Returns (host, port, command) of the SSH client's args, where command
+    is None if there is none."""
+    port = "22"
+    positional = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if positional or not arg.startswith("-"):
+            positional.append(arg)
+        elif arg[1:2] in FLAGS_WITH_VALUE:
+            value = arg[2:]
+            if not value and i + 1 < len(argv):
+                i += 1
+                value = argv[i]
+            if arg[1] == "p":
+                port = value
+        i += 1
+    command = " ".join(positional[1:]) or None
+    return positional[0], port, command
+
+
+def print_config(scenario: dict, host_addr: str, port: str):
+    """Like "ssh -G", which prints the config instead of connecting."""
+    hostname = host_addr
+    if host_addr == scenario["ssh_config_alias"]:
+        hostname = "127.0.0.1"
+    write("host {host}\nhostname {hostname}\nport {port}\n".format(host=host_addr, hostname=hostname, port=port))
+    if scenario["ssh_config_proxy"]:
+        write("proxyjump jump.example.com\n")
+    return 0
+
+
+def refuse(state: dict, host_addr: str, port: str):
+    """Returns (output, exit code, 0) if the session is refused, or None if
+    it reaches cryptroot-unlock, and updates the state."""
+    scenario = state["scenario"]
+    status = FakeHost.status(state)
+    state["ssh_sessions"] += 1
+
+    if status == STATE_UP and scenario["same_port"]:
+        # Reached the regular sshd, which does not accept Dropbear's key
+        state["ssh_refused"] += 1
+        return "root@{host}: Permission denied (publickey).\n".format(host=host_addr), EXIT_SSH_ERROR, 0
+
+    if status != STATE_INITRAMFS or state["injected_refusals"] < scenario["refusals"]:
+        if status == STATE_INITRAMFS:
+            # Dropbear answers TCP, but is not accepting sessions yet
+            state["injected_refusals"] += 1
+        state["ssh_refused"] += 1
+        return "ssh: connect to host {host} port {port}: Connection refused\n".format(
+            host=host_addr, port=port), EXIT_SSH_ERROR, 0
+
+    if scenario["rejected_key"]:
+        state["ssh_refused"] += 1
+        return "root@{host}: Permission denied (publickey).\n".format(host=host_addr), EXIT_SSH_ERROR, 0
+    return None
+
+
+def answer(state: dict, host_addr: str, port: str, passphrase: str):
+    """Returns (output, exit code, seconds to keep the session open before
+    exiting) of one session, and updates the state."""
+    scenario = state["scenario"]
+    refused = refuse(state, host_addr, port)
+    if refused is not None:
+        return refused
+
+    prompt = "Please unlock disk {device}: ".format(device=LUKS_DEVICE)
+    if state["hung_sessions"] < scenario["hang_sessions"]:
+        # cryptroot-unlock never answers, e.g while cryptsetup is not yet
+        # waiting for a passphrase
+        state["hung_sessions"] += 1
+        return prompt, EXIT_SSH_ERROR, scenario["hang"]
+
+    if state["client_timeouts"] < scenario["client_timeouts"]:
+        # The SSH client gives up on the session, which is no reason to
+        # stop retrying, despite the "timeout" stop keyword
+        state["client_timeouts"] += 1
+        return prompt + "Timeout, server {host} not responding.\n".format(host=host_addr), EXIT_SSH_ERROR, 0
+
+    if passphrase.rstrip("\n") != scenario["password"]:
+        state["ssh_wrong_password"] += 1
+        # cryptroot-unlock may keep the session open after a wrong password
+        return prompt + "cryptsetup: ERROR: {device}: cryptsetup failed, bad password or options?\n".format(
+            device=LUKS_DEVICE), 1, scenario["hang"]
+
+    state["unlock_at"] = time.time()
+    return prompt + "cryptsetup: {device} set up successfully\nConnection to {host} closed.\n".format(
+        device=LUKS_DEVICE, host=host_addr), 0, 0
+
+
+def run_command(host: FakeHost, host_addr: str, port: str, command: str):
+    """Like sshd running command, e.g the reboot command. Returns the exit
+    code."""
+    state = host.load()
+    if FakeHost.status(state) != STATE_UP:
+        time.sleep(state["scenario"]["connect_fail_delay"])
+        write("ssh: connect to host {host} port {port}: Connection refused\n".format(host=host_addr, port=port))
+        return EXIT_SSH_ERROR
+    # Also when wrapped by sudo for become
+    if BOOT_TIME_COMMAND in command:
+        write(FakeHost.boot_id(state) + "\n")
+        return 0
+    if any(reboot in command for reboot in REBOOT_COMMANDS):
+        host.reboot()
+        return 0
+    # Any test_command
+    write("root\n")
+    return 0
+
+
+def write(text: str):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def unlock_volumes(host: FakeHost, host_addr: str, port: str):
+    """Like cryptroot-unlock with several volumes in crypttab: prompts for
+    one volume at a time, reading a line from STDIN for each, as the
+    initramfs unlocks them one after another."""
+    with host.locked() as state:
+        refused = refuse(state, host_addr, port)
+    scenario = state["scenario"]
+    if refused is not None:
+        write(refused[0])
+        return refused[1]
+
+    for name, password in scenario["volumes"].items():
+        write("Please unlock disk {name}: ".format(name=name))
+        passphrase = sys.stdin.readline()
+        if not passphrase:
+            write("\nError: no passphrase given\n")
+            return 1
+        if passphrase.rstrip("\n") != password:
+            with host.locked() as state:
+                state["ssh_wrong_password"] += 1
+            write("cryptsetup: ERROR: {name}: cryptsetup failed, bad password or options?\n".format(name=name))
+            time.sleep(scenario["hang"])
+            return 1
+        time.sleep(scenario["kdf_delay"])
+        write("cryptsetup: {name}: set up successfully\n".format(name=name))
+
+    with host.locked() as state:
+        state["unlock_at"] = time.time()
+    write("Connection to {host} closed.\n".format(host=host_addr))
+    return 0
+
+
+def main():
+    host_addr, port, command = parse_args(sys.argv[1:])
+    host = FakeHost(state_file_from_env(host_addr))
+    if "-G" in sys.argv[1:]:
+        return print_config(host.load()["scenario"], host_addr, port)
+    if command is not None:
+        return run_command(host, host_addr, port, command)
+    if host.load()["scenario"]["volumes"]:
+        return unlock_volumes(host, host_addr, port)
+    passphrase = sys.stdin.read()
+
+    with host.locked() as state:
+        output, exit_code, hang = answer(state, host_addr, port, passphrase)
+
+    sys.stdout.write(output)
+    sys.stdout.flush()
+    time.sleep(hang)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
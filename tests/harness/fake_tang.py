@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local stand-in for a Tang server, and for the Clevis client in the
+# initramfs of a simulated host, used to test waiting for an auto unlock.
+#
+# Only the HTTP exchange is simulated: the client fetches the advertisement
+# and posts a recovery request, and the host is unlocked when both succeed.
+# No keys are exchanged, as the action plugin only sees whether the host
+# came up by itself.
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_host import STATE_INITRAMFS, FakeHost
+
+# Key ID of the fake advertisement
+KEY_ID = "fake-tang-key"
+
+
+class _TangHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/adv" and self.path != "/adv/":
+            self.send_error(404)
+            return
+        self.server.advertisements += 1
+        self._send_json({
+            "payload": json.dumps({"keys": [{"kid": KEY_ID, "key_ops": ["deriveKey"]}]}),
+            "signatures": [],
+        })
+
+    def do_POST(self):
+        if self.path != "/rec/%s" % KEY_ID:
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self.server.recoveries += 1
+        # A real Tang server answers with the recovered key
+        self._send_json(json.loads(body or b"{}"))
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/jose+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTangServer:
+    """HTTP server answering the advertisement and recovery requests of a
+    Tang server."""
+
+    def __init__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _TangHandler)
+        self._server.advertisements = 0
+        self._server.recoveries = 0
+        self.url = "http://127.0.0.1:%d" % self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def recoveries(self):
+        return self._server.recoveries
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=2)
+
+
+class FakeClevis:
+    """Unlocks the simulated host while it waits in the initramfs, once the
+    Tang server answered, like clevis-initramfs does.
+
+    Retries every interval while the Tang server is unreachable, and gives
+    up once the host was unlocked some other way."""
+
+    def __init__(self, host: FakeHost, tang_url: str, interval: float = 0.5):
+        self.host = host
+        self.tang_url = tang_url
+        self.interval = interval
+        self.attempts = 0
+        self.unlocked = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+
+    def _recover(self):
+        self.attempts += 1
+        try:
+            with urllib.request.urlopen(self.tang_url + "/adv", timeout=1) as response:
+                advertisement = json.load(response)
+            key_id = json.loads(advertisement["payload"])["keys"][0]["kid"]
+            request = urllib.request.Request(
+                "%s/rec/%s" % (self.tang_url, key_id), data=b"{}", method="POST",
+                headers={"Content-Type": "application/jwk+json"})
+            with urllib.request.urlopen(request, timeout=1):
+                return True
+        except (OSError, urllib.error.URLError, ValueError, KeyError, IndexError):
+            return False
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            state = self.host.load()
+            if state["unlock_at"] is not None:
+                return
+            if FakeHost.status(state) != STATE_INITRAMFS or not self._recover():
+                continue
+            # Deriving the key from the recovered one takes as long as with
+            # a password
+            time.sleep(state["scenario"]["kdf_delay"])
+            with self.host.locked() as state:
+                if state["unlock_at"] is None:
+                    state["unlock_at"] = time.time()
+                    self.unlocked = True
+            return
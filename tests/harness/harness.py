@@ -0,0 +1,403 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Runs the reboot_luks_ssh action plugin against a simulated host (see
+# fake_host.py), or the reboot_luks_ssh_batch action plugin against several,
+# without Ansible's task executor and without rebooting anything.
+#
+# Only the parts of the action plugin that talk to the managed host through
+# Ansible are replaced: the connection, the setup module used to get the
+# distribution, the find module used to locate the shutdown command, and the
+# initramfs_inspect module, which is run in-process on a generated image.
+# Everything else, such as the retry loops, probes and delays, is the real
+# code.
+
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+HARNESS_DIR = os.path.dirname(os.path.abspath(__file__))
+COLLECTION_DIR = os.path.dirname(os.path.dirname(HARNESS_DIR))
+FAKE_SSH = os.path.join(HARNESS_DIR, "fake_ssh.py")
+
+
+def ensure_collection_importable():
+    """Makes this checkout importable as ansible_collections.riskident.luks,
+    unless the collection is already installed."""
+    try:
+        import ansible_collections.riskident.luks.plugins.action.reboot_luks_ssh  # noqa: F401
+        return
+    except ImportError:
+        pass
+    root = tempfile.mkdtemp(prefix="riskident-luks-harness-")
+    namespace_dir = os.path.join(root, "ansible_collections", "riskident")
+    os.makedirs(namespace_dir)
+    os.symlink(COLLECTION_DIR, os.path.join(namespace_dir, "luks"))
+    sys.path.insert(0, root)
+
+
+ensure_collection_importable()
+
+from ansible.errors import AnsibleConnectionFailure, AnsibleError  # noqa: E402
+from ansible.playbook.play_context import PlayContext  # noqa: E402
+from ansible_collections.riskident.luks.plugins.action.reboot_luks_ssh import (  # noqa: E402
+    ActionModule,
+)
+from ansible_collections.riskident.luks.plugins.action.reboot_luks_ssh_batch import (  # noqa: E402
+    ActionModule as BatchActionModule,
+)
+from ansible_collections.riskident.luks.plugins.modules.initramfs_inspect import (  # noqa: E402
+    failure_msg,
+    inspect_initramfs,
+)
+
+from fake_host import STATE_UP, FakeHost, Scenario, start_servers  # noqa: E402
+from fake_initramfs import DROPBEAR_FILES, build_image  # noqa: E402
+from fake_tang import FakeClevis, FakeTangServer  # noqa: E402
+
+SHUTDOWN_COMMAND = "/sbin/shutdown"
+KEXEC_COMMAND = "kexec "
+
+
+class FakeConnection:
+    """Stand-in for Ansible's ssh connection plugin, running commands on the
+    simulated host."""
+
+    transport = "ssh"
+
+    def __init__(self, host: FakeHost, remote_addr: str, port: int):
+        self.host = host
+        self._shell = SimpleNamespace(tmpdir=None)
+        self._options = {
+            "remote_addr": remote_addr,
+            "port": port,
+            "connection_timeout": 10,
+            "ssh_args": "",
+            "ssh_common_args": "",
+            "ssh_extra_args": "",
+        }
+        self.commands = 0
+        self.failures = 0
+        self.resets = 0
+
+    def get_option(self, option):
+        return self._options[option]
+
+    def set_option(self, option, value):
+        if option not in self._options:
+            raise AnsibleError("Requested option %s was not defined in configuration" % option)
+        self._options[option] = value
+
+    def reset(self):
+        self.resets += 1
+
+    def exec_command(self, cmd, in_data=None, sudoable=True):
+        self.commands += 1
+        state = self.host.load()
+        if FakeHost.status(state) != STATE_UP:
+            self.failures += 1
+            time.sleep(state["scenario"]["connect_fail_delay"])
+            raise AnsibleConnectionFailure(
+                "Failed to connect to the host via ssh: ssh: connect to host {host} port {port}: Connection refused".format(
+                    host=self._options["remote_addr"], port=self._options["port"]))
+        if cmd.startswith((SHUTDOWN_COMMAND, KEXEC_COMMAND)):
+            self.host.reboot()
+            return 0, "", ""
+        if cmd == ActionModule.DEFAULT_BOOT_TIME_COMMAND:
+            return 0, FakeHost.boot_id(state) + "\n", ""
+        # Any test_command
+        return 0, "root\n", ""
+
+
+class HarnessTask:
+    """Stand-in for the parts of ansible.playbook.task.Task that action
+    plugins use."""
+
+    async_val = 0
+    check_mode = False
+
+    def __init__(self, args: dict, action: str = "riskident.luks.reboot_luks_ssh"):
+        self.args = args
+        self.action = action
+
+
+class HarnessActionModule(ActionModule):
+    # Set by run_scenario
+    initramfs_image = None
+
+    def get_distribution(self, task_vars):
+        # Would otherwise run the setup module on the host
+        return {"name": "debian", "version": "12", "family": "debian"}
+
+    def get_shutdown_command(self, task_vars, distribution):
+        if self.reboot_method != "reboot":
+            return super(HarnessActionModule, self).get_shutdown_command(task_vars, distribution)
+        # Would otherwise run the find module on the host
+        return SHUTDOWN_COMMAND
+
+    def _execute_module(self, module_name=None, module_args=None, task_vars=None, **kwargs):
+        if module_name != "riskident.luks.initramfs_inspect":
+            return super(HarnessActionModule, self)._execute_module(
+                module_name=module_name, module_args=module_args, task_vars=task_vars, **kwargs)
+        # Would otherwise run the module on the host, against its /boot
+        module_args = dict(module_args)
+        image = module_args.pop('image', self.initramfs_image)
+        result = inspect_initramfs(image, **module_args)
+        if result['problems']:
+            result['failed'] = True
+            result['msg'] = failure_msg(image, result['problems'])
+        return result
+
+    def _low_level_execute_command(self, cmd, sudoable=True, in_data=None, executable=None,
+                                   encoding_errors='surrogate_then_replace', chdir=None):
+        rc, stdout, stderr = self._connection.exec_command(cmd, in_data=in_data, sudoable=sudoable)
+        return {
+            "rc": rc,
+            "stdout": stdout,
+            "stdout_lines": stdout.splitlines(),
+            "stderr": stderr,
+            "stderr_lines": stderr.splitlines(),
+        }
+
+
+class SimulatedHost:
+    """A simulated host with its fake SSH servers, and the Tang server and
+    clevis of the scenario."""
+
+    def __init__(self, scenario: Scenario, state_file: str, addr: str = "127.0.0.1", dropbear_port: int = 0):
+        self.scenario = scenario
+        self.addr = addr
+        self.host = FakeHost(state_file)
+        self.host.create(scenario)
+        self.sshd, self.dropbear = start_servers(self.host, scenario, addr, dropbear_port)
+        self.tang = None
+        self.clevis = None
+        if scenario.clevis:
+            self.tang = FakeTangServer().start()
+            if scenario.tang_down:
+                # Keeps the URL, but nothing answers on it anymore
+                self.tang.stop()
+            self.clevis = FakeClevis(self.host, self.tang.url).start()
+
+    def stop(self):
+        self.sshd.stop()
+        if self.dropbear is not self.sshd:
+            self.dropbear.stop()
+        if self.clevis is not None:
+            self.clevis.stop()
+        if self.tang is not None and not self.scenario.tang_down:
+            self.tang.stop()
+
+    def measure(self, start: float, end: float):
+        """Returns the measurements of the simulated host, for a run from
+        start until end."""
+        state = self.host.load()
+        dropbear_at = FakeHost.dropbear_at(state)
+        unlock_at = FakeHost.effective_unlock_at(state)
+        sshd_at = None
+        if unlock_at is not None:
+            sshd_at = unlock_at + self.scenario.sshd_delay
+        # A waiting host was not rebooted by the run, its reboot_at is made
+        # up to put it in the initramfs from the start
+        reboot_at = start if self.scenario.waiting else state["reboot_at"]
+        return {
+            # Time from the reboot command, or from the start of the run if
+            # the host was not rebooted, until the disk was unlocked
+            "time_to_unlock": _diff(unlock_at, reboot_at),
+            # How much later than possible the disk was unlocked, and the
+            # task noticed sshd being back; the overhead of the plugin's
+            # delays and retries
+            "unlock_lag": _diff(unlock_at, dropbear_at),
+            "ready_lag": _diff(end, sshd_at),
+            "ssh_sessions": state["ssh_sessions"],
+            "ssh_refused": state["ssh_refused"],
+            "ssh_wrong_password": state["ssh_wrong_password"],
+            "tang_recoveries": self.tang.recoveries if self.tang is not None else None,
+        }
+
+
+def get_task_args(scenario: Scenario, dropbear_port: int):
+    args = {
+        "luks_password": "wrong" if scenario.wrong_password else scenario.password,
+        "luks_ssh_executable": FAKE_SSH,
+        "luks_ssh_port": dropbear_port,
+        "reboot_timeout": 60,
+        "connect_timeout": 2,
+    }
+    args.update(scenario.args)
+    return args
+
+
+def run_scenario(scenario: Scenario, workdir: str):
+    """Reboots and unlocks a simulated host once, or all hosts of a batch
+    scenario.
+
+    Returns a dict with the action plugin's result and measurements of the
+    simulated host."""
+    if scenario.batch_hosts:
+        return run_batch_scenario(scenario, workdir)
+    state_file = os.path.join(workdir, "%s.json" % scenario.name)
+    remote_addr = scenario.ssh_config_alias or "127.0.0.1"
+    sim = SimulatedHost(scenario, state_file)
+
+    os.environ["LUKS_HARNESS_STATE"] = state_file
+    connection = FakeConnection(sim.host, remote_addr, sim.sshd.port)
+    play_context = PlayContext()
+    play_context.remote_addr = remote_addr
+    play_context.port = sim.sshd.port
+
+    action = HarnessActionModule(
+        HarnessTask(get_task_args(scenario, sim.dropbear.port)), connection, play_context,
+        loader=None, templar=None, shared_loader_obj=None)
+    files = dict(DROPBEAR_FILES)
+    files["etc/dropbear/config"] = b'DROPBEAR_OPTIONS="-p %d -jks"\n' % sim.dropbear.port
+    for path in scenario.initramfs_missing:
+        del files[path]
+    action.initramfs_image = os.path.join(workdir, "%s.initrd.img" % scenario.name)
+    build_image(action.initramfs_image, files)
+    task_vars = {"inventory_hostname": scenario.name, "ansible_host": remote_addr}
+
+    start = time.time()
+    try:
+        result = action.run(task_vars=task_vars)
+    finally:
+        action.cleanup()
+        sim.stop()
+    end = time.time()
+
+    run = {
+        "scenario": scenario.name,
+        "result": result,
+        "total": end - start,
+        "connection_commands": connection.commands,
+        "connection_failures": connection.failures,
+    }
+    run.update(sim.measure(start, end))
+    return run
+
+
+def run_batch_scenario(scenario: Scenario, workdir: str):
+    """Reboots and unlocks the hosts of a batch scenario at once, with the
+    reboot_luks_ssh_batch action plugin.
+
+    Each host gets its own loopback address, as luks_ssh_port is the same
+    for all hosts. The measurements of the hosts are in "hosts", and the top
+    level has the slowest time and lag, and the sum of the counts."""
+    state_dir = os.path.join(workdir, scenario.name)
+    os.makedirs(state_dir, exist_ok=True)
+    os.environ["LUKS_HARNESS_STATE"] = state_dir
+    sims = {}
+    dropbear_port = 0
+    try:
+        for i in range(scenario.batch_hosts):
+            addr = "127.0.0.%d" % (i + 1)
+            sim = SimulatedHost(scenario, os.path.join(state_dir, "%s.json" % addr), addr, dropbear_port)
+            dropbear_port = sim.dropbear.port
+            sims["%s%d" % (scenario.name, i + 1)] = sim
+
+        batch_host_vars = scenario.batch_host_vars + [{}] * (len(sims) - len(scenario.batch_host_vars))
+        first = next(iter(sims.values()))
+        connection = FakeConnection(first.host, first.addr, first.sshd.port)
+        play_context = PlayContext()
+        play_context.remote_addr = first.addr
+        play_context.port = first.sshd.port
+        action = BatchActionModule(
+            HarnessTask(get_task_args(scenario, dropbear_port), action="riskident.luks.reboot_luks_ssh_batch"),
+            connection, play_context, loader=None, templar=None, shared_loader_obj=None)
+        task_vars = {
+            "ansible_play_batch": list(sims),
+            "hostvars": {
+                name: dict({"ansible_host": sim.addr, "ansible_port": sim.sshd.port}, **host_vars)
+                for (name, sim), host_vars in zip(sims.items(), batch_host_vars)
+            },
+        }
+
+        start = time.time()
+        try:
+            result = action.run(task_vars=task_vars)
+        finally:
+            action.cleanup()
+        end = time.time()
+    finally:
+        for sim in sims.values():
+            sim.stop()
+
+    hosts = {name: sim.measure(start, end) for name, sim in sims.items()}
+    run = {
+        "scenario": scenario.name,
+        "result": result,
+        "total": end - start,
+        "hosts": hosts,
+        "connection_commands": connection.commands,
+        "connection_failures": connection.failures,
+    }
+    for key in ("time_to_unlock", "unlock_lag", "ready_lag"):
+        values = [host[key] for host in hosts.values() if host[key] is not None]
+        run[key] = max(values) if values else None
+    for key in ("ssh_sessions", "ssh_refused", "ssh_wrong_password"):
+        run[key] = sum(host[key] for host in hosts.values())
+    run["tang_recoveries"] = None
+    return run
+
+
+def run_status(result: dict):
+    """Returns "failed", "unlocked" or "ok" for the result of either action
+    plugin."""
+    if result.get("failed"):
+        return "failed"
+    if "hosts" in result:
+        if result["hosts"] and all(host.get("unlocked") for host in result["hosts"].values()):
+            return "unlocked"
+        return "ok"
+    if result.get("unlocked"):
+        return "unlocked"
+    return "ok"
+
+
+def check_run(scenario: Scenario, run: dict):
+    """Returns the mismatches between the run and scenario.expect, as
+    strings, or an empty list if the run went as expected.
+
+    The "status" key is compared with run_status, "max_" keys are upper
+    bounds, e.g "max_total", and other keys are compared with the
+    measurements, or else with the action plugin's result."""
+    mismatches = []
+    for key, expected in scenario.expect.items():
+        if key == "status":
+            actual = run_status(run["result"])
+        elif key.startswith("max_"):
+            actual = run.get(key[len("max_"):])
+            if actual is None or actual > expected:
+                mismatches.append("{key}: expected at most {expected}, got {actual}".format(
+                    key=key[len("max_"):], expected=expected, actual=actual))
+            continue
+        elif key in run:
+            actual = run[key]
+        else:
+            actual = run["result"].get(key)
+        if actual != expected:
+            mismatches.append("{key}: expected {expected!r}, got {actual!r}".format(
+                key=key, expected=expected, actual=actual))
+    return mismatches
+
+
+def _diff(a, b):
+    if a is None or b is None:
+        return None
+    return a - b
@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from fake_host import Scenario
+
+SCENARIOS = [
+    Scenario(
+        "probe",
+        "Default settings: probes for Dropbear and sshd",
+        expect={"status": "unlocked", "ssh_sessions": 1, "ssh_refused": 0}),
+    Scenario(
+        "slow_boot",
+        "Dropbear takes 8s to come up, e.g slow firmware",
+        dropbear_delay=8,
+        expect={"status": "unlocked", "ssh_sessions": 1, "ssh_refused": 0}),
+    Scenario(
+        "kexec",
+        "reboot_method: kexec, which skips the 2s of firmware of the probe scenario",
+        dropbear_delay=1,
+        args={"reboot_method": "kexec"},
+        expect={"status": "unlocked", "ssh_sessions": 1, "max_unlock_lag": 1}),
+    Scenario(
+        "shared_port",
+        "Dropbear and sshd listen on the same port",
+        same_port=True,
+        expect={"status": "unlocked", "ssh_sessions": 1}),
+    Scenario(
+        "refusals",
+        "Dropbear answers, but refuses the first 3 SSH sessions",
+        refusals=3,
+        expect={"status": "unlocked", "ssh_sessions": 4, "ssh_refused": 3}),
+    Scenario(
+        "retry_backoff",
+        "No probes and no delays, only the unlock retry loop's backoff",
+        args={
+            "luks_ssh_probe": False,
+            "luks_sshd_probe": False,
+            "post_reboot_delay": 0,
+            "post_unlock_delay": 0,
+        },
+        expect={"status": "unlocked", "max_unlock_lag": 2}),
+    Scenario(
+        "fixed_delays",
+        "No probes, with the fixed post_reboot_delay and post_unlock_delay",
+        args={
+            "luks_ssh_probe": False,
+            "luks_sshd_probe": False,
+        },
+        expect={"status": "unlocked", "ssh_sessions": 1, "ssh_refused": 0}),
+    Scenario(
+        "wrong_password",
+        "cryptroot-unlock rejects the password, no manual unlock",
+        wrong_password=True,
+        args={"luks_manual_unlock_on_fail": False},
+        expect={"status": "failed", "ssh_sessions": 1, "ssh_wrong_password": 1}),
+    Scenario(
+        "wrong_password_hang",
+        "cryptroot-unlock rejects the password, but keeps the session open for 30s",
+        wrong_password=True,
+        hang=30,
+        args={"luks_manual_unlock_on_fail": False},
+        expect={"status": "failed", "ssh_wrong_password": 1, "max_total": 15}),
+    Scenario(
+        "attempt_timeout",
+        "The first SSH session never gets an answer, aborted by luks_ssh_attempt_timeout",
+        hang_sessions=1,
+        hang=30,
+        args={"luks_ssh_attempt_timeout": 3},
+        expect={"status": "unlocked", "ssh_sessions": 2}),
+    Scenario(
+        "client_timeout",
+        "The SSH client times out the first 2 sessions, which the \"timeout\" stop keyword must not stop",
+        client_timeouts=2,
+        expect={"status": "unlocked", "ssh_sessions": 3}),
+    Scenario(
+        "manual_unlock",
+        "cryptroot-unlock rejects the password, a human unlocks after 3s",
+        wrong_password=True,
+        manual_unlock_delay=3,
+        args={"luks_ssh_reconnect_timeout": 30},
+        expect={"status": "unlocked", "ssh_sessions": 1, "ssh_wrong_password": 1}),
+    Scenario(
+        "rejected_key",
+        "Dropbear rejects the SSH key, which fails at once instead of waiting for a manual unlock",
+        rejected_key=True,
+        expect={"status": "failed", "ssh_sessions": 1, "ssh_refused": 1, "max_total": 15}),
+    Scenario(
+        "waiting",
+        "The host already waits in the initramfs, unlocked without rebooting it",
+        waiting=True,
+        args={"luks_unlock_waiting": "auto"},
+        expect={"status": "unlocked", "rebooted": False, "ssh_sessions": 1, "max_time_to_unlock": 2}),
+    Scenario(
+        "multi_volume",
+        "Root and two data volumes, each taking 0.5s to derive the key, unlocked in one session",
+        volumes={"sda3_crypt": "hunter2", "sdb1_crypt": "data-b", "sdc1_crypt": "data-c"},
+        kdf_delay=0.5,
+        args={"luks_volumes": [
+            {"name": "sdb1_crypt", "password": "data-b"},
+            {"name": "sdc1_crypt", "password": "data-c"},
+        ]},
+        expect={"status": "unlocked", "ssh_sessions": 1, "ssh_wrong_password": 0}),
+    Scenario(
+        "clevis",
+        "The initramfs unlocks by itself via a Tang server, no SSH unlock",
+        clevis=True,
+        args={"luks_auto_unlock_timeout": 30},
+        expect={"status": "unlocked", "auto_unlocked": True, "ssh_sessions": 0}),
+    Scenario(
+        "clevis_tang_down",
+        "The Tang server is down, unlocked via SSH after luks_auto_unlock_timeout",
+        clevis=True,
+        tang_down=True,
+        args={"luks_auto_unlock_timeout": 5},
+        expect={"status": "unlocked", "auto_unlocked": False, "ssh_sessions": 1}),
+    Scenario(
+        "initramfs_preflight",
+        "The initramfs image is inspected before rebooting",
+        args={"luks_initramfs_preflight": True},
+        expect={"status": "unlocked", "ssh_sessions": 1}),
+    Scenario(
+        "initramfs_missing_dropbear",
+        "Dropbear is missing from the initramfs image, so the host is not rebooted",
+        initramfs_missing=["usr/sbin/dropbear"],
+        args={"luks_initramfs_preflight": True},
+        expect={"status": "failed", "ssh_sessions": 0, "connection_commands": 0}),
+    Scenario(
+        "ssh_config_alias",
+        "Only the SSH config resolves the host's name, so sshd is not probed",
+        ssh_config_alias="luks-harness.invalid",
+        expect={"status": "unlocked", "ssh_sessions": 1}),
+    Scenario(
+        "ssh_config_proxy",
+        "The SSH config reaches Dropbear via ProxyJump, so Dropbear is not probed",
+        ssh_config_proxy=True,
+        expect={"status": "unlocked", "ssh_sessions": 1}),
+    Scenario(
+        "batch",
+        "reboot_luks_ssh_batch with 3 hosts of the probe scenario",
+        batch_hosts=3,
+        expect={"status": "unlocked", "ssh_sessions": 3, "ssh_refused": 0}),
+    Scenario(
+        "batch_wrong_password",
+        "reboot_luks_ssh_batch with 3 hosts, which all reject the password",
+        batch_hosts=3,
+        wrong_password=True,
+        args={"luks_manual_unlock_on_fail": False},
+        expect={"status": "failed", "ssh_sessions": 3, "ssh_wrong_password": 3}),
+    Scenario(
+        "batch_waiting",
+        "reboot_luks_ssh_batch with 2 hosts already waiting in the initramfs",
+        batch_hosts=2,
+        waiting=True,
+        args={"luks_unlock_waiting": "only"},
+        expect={"status": "unlocked", "ssh_sessions": 2, "max_time_to_unlock": 2}),
+    Scenario(
+        "batch_password_var",
+        "reboot_luks_ssh_batch with luks_password_var, which the last of 3 hosts does not set",
+        batch_hosts=3,
+        args={"luks_password": None, "luks_password_var": "disk_password"},
+        batch_host_vars=[{"disk_password": "hunter2"}, {"disk_password": "hunter2"}],
+        expect={"status": "failed", "ssh_sessions": 2, "ssh_wrong_password": 0}),
+    Scenario(
+        "batch_unknown_host",
+        "reboot_luks_ssh_batch with a host that is not in the inventory, so no host is rebooted",
+        batch_hosts=2,
+        args={"hosts": ["batch_unknown_host1", "batch_unknown_host2", "missing"]},
+        expect={"status": "failed", "ssh_sessions": 0}),
+]
+
+
+def get_scenario(name: str):
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise KeyError(name)
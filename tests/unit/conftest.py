@@ -0,0 +1,42 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Makes this checkout importable as ansible_collections.riskident.luks when
+# running pytest directly, e.g "python3 -m pytest tests/unit", unless the
+# collection is already installed, such as with "ansible-test units".
+
+import os
+import sys
+import tempfile
+
+COLLECTION_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _ensure_collection_importable():
+    try:
+        import ansible_collections.riskident.luks.plugins.module_utils  # noqa: F401
+        return
+    except ImportError:
+        pass
+    root = tempfile.mkdtemp(prefix="riskident-luks-units-")
+    namespace_dir = os.path.join(root, "ansible_collections", "riskident")
+    os.makedirs(namespace_dir)
+    os.symlink(COLLECTION_DIR, os.path.join(namespace_dir, "luks"))
+    sys.path.insert(0, root)
+
+
+_ensure_collection_importable()
@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from ansible_collections.riskident.luks.plugins.module_utils.boot_profile import (
+    SAMPLE_DROPBEAR,
+    SAMPLE_SSHD,
+    BootProfileCache,
+)
+
+
+def test_get_without_cache(tmp_path):
+    assert BootProfileCache(str(tmp_path / "missing.json")).get("web1") is None
+
+
+def test_record_and_get(tmp_path):
+    cache = BootProfileCache(str(tmp_path / "profiles" / "boot.json"), max_samples=3)
+    for value in (30.0, 28.0, 31.0, 29.0):
+        cache.record("web1", {SAMPLE_DROPBEAR: value, SAMPLE_SSHD: None})
+    profile = cache.get("web1")
+    assert profile.samples(SAMPLE_DROPBEAR) == [28.0, 31.0, 29.0]
+    assert profile.samples(SAMPLE_SSHD) == []
+    assert cache.get("web2") is None
+
+
+def test_expected_delay(tmp_path):
+    cache = BootProfileCache(str(tmp_path / "boot.json"))
+    cache.record("web1", {SAMPLE_DROPBEAR: 30.0})
+    cache.record("web1", {SAMPLE_DROPBEAR: 25.0})
+    profile = cache.get("web1")
+    assert profile.expected_delay(SAMPLE_DROPBEAR, 5.0) == 20.0
+    assert profile.expected_delay(SAMPLE_DROPBEAR, 40.0) == 0.0
+    assert profile.expected_delay(SAMPLE_SSHD, 5.0) is None
+
+
+def test_unknown_version_starts_over(tmp_path):
+    path = tmp_path / "boot.json"
+    path.write_text(json.dumps({"version": 0, "hosts": {"web1": {SAMPLE_DROPBEAR: [30.0]}}}))
+    cache = BootProfileCache(str(path))
+    assert cache.get("web1") is None
+    cache.record("web1", {SAMPLE_DROPBEAR: 20.0})
+    assert cache.get("web1").samples(SAMPLE_DROPBEAR) == [20.0]
@@ -0,0 +1,87 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from ansible_collections.riskident.luks.plugins.module_utils.luks_volumes import (
+    VolumePromptResponder,
+    parse_luks_volumes,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_CONFIG,
+    LuksSSHError,
+)
+
+
+def test_parse_luks_volumes():
+    assert parse_luks_volumes([
+        {"name": "sdb1_crypt", "password": "data-b"},
+        {"name": "sdc1_crypt"},
+        "sdd1_crypt",
+    ], "hunter2") == [("sdb1_crypt", "data-b"), ("sdc1_crypt", "hunter2"), ("sdd1_crypt", "hunter2")]
+
+
+@pytest.mark.parametrize("volumes", [
+    "sdb1_crypt",
+    [{"password": "data-b"}],
+    [{"name": "sdb1_crypt", "keyfile": "/root/key"}],
+    [{"name": "sdb1_crypt"}],
+])
+def test_parse_luks_volumes_invalid(volumes):
+    with pytest.raises(ValueError):
+        parse_luks_volumes(volumes)
+
+
+@pytest.mark.parametrize("prompt", [
+    "Please unlock disk sda3_crypt: ",
+    "Please unlock disk sda3_crypt (/dev/sda3): ",
+])
+def test_responder_answers_prompt(prompt):
+    responder = VolumePromptResponder([("sda3_crypt", "hunter2")])
+    assert responder.feed(prompt) == "hunter2\n"
+
+
+def test_responder_answers_split_prompt():
+    responder = VolumePromptResponder([("sda3_crypt", "hunter2")])
+    assert responder.feed("Please unlock disk sda3") == ""
+    assert responder.feed("_crypt: ") == "hunter2\n"
+
+
+def test_responder_uses_default_password():
+    responder = VolumePromptResponder([("sdb1_crypt", "data-b")], "hunter2")
+    assert responder.feed("Please unlock disk sda3_crypt: ") == "hunter2\n"
+    assert responder.feed("Please unlock disk sdb1_crypt: ") == "data-b\n"
+
+
+def test_responder_fails_without_password():
+    responder = VolumePromptResponder([("sdb1_crypt", "data-b")])
+    with pytest.raises(LuksSSHError) as e:
+        responder.feed("Please unlock disk sda3_crypt: ")
+    assert e.value.reason == REASON_CONFIG
+
+
+def test_responder_results():
+    responder = VolumePromptResponder([("sdb1_crypt", "data-b"), ("sdc1_crypt", "data-c")], "hunter2")
+    responder.feed("Please unlock disk sda3_crypt: cryptsetup: sda3_crypt: set up successfully\n")
+    responder.feed("Please unlock disk sdb1_crypt: cryptsetup: ERROR: sdb1_crypt: cryptsetup failed\n")
+    responder.new_session()
+    responder.feed("Please unlock disk sdb1_crypt: cryptsetup: sdb1_crypt set up successfully\n")
+    assert responder.results() == [
+        {"name": "sdb1_crypt", "prompts": 2, "unlocked": True},
+        {"name": "sdc1_crypt", "prompts": 0, "unlocked": False},
+        {"name": "sda3_crypt", "prompts": 1, "unlocked": True},
+    ]
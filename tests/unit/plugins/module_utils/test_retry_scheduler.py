@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from ansible_collections.riskident.luks.plugins.module_utils.retry_scheduler import (
+    MAX_DECISIONS,
+    REASON_BACKOFF,
+    REASON_DEADLINE,
+    REASON_FAST,
+    RetryScheduler,
+    validate_retry_intervals,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_scheduler(clock, timeout=60.0, **kwargs):
+    kwargs.setdefault("jitter", 0)
+    return RetryScheduler("unlock", timeout, fast_interval=0.5, fast_window=5.0, max_interval=4.0,
+                          clock=clock, **kwargs)
+
+
+def test_fast_then_backoff():
+    clock = FakeClock()
+    scheduler = new_scheduler(clock)
+    assert scheduler.next_sleep() == 0.5
+    clock.now += 5
+    assert [scheduler.next_sleep() for _ in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    assert scheduler.reasons == {REASON_FAST: 1, REASON_BACKOFF: 4}
+
+
+def test_never_sleeps_past_deadline():
+    clock = FakeClock()
+    scheduler = new_scheduler(clock, timeout=10.0)
+    clock.now += 9.5
+    assert scheduler.remaining() == 0.5
+    assert scheduler.next_sleep("refused") == 0.5
+    assert scheduler.decisions[-1]["reason"] == REASON_DEADLINE
+    assert scheduler.decisions[-1]["error"] == "refused"
+    clock.now += 0.5
+    assert scheduler.expired()
+    assert scheduler.remaining() == 0.0
+
+
+def test_jitter_stays_within_bounds():
+    scheduler = new_scheduler(FakeClock(), jitter=0.25)
+    for _ in range(50):
+        assert 0.375 <= scheduler.next_sleep() <= 0.625
+
+
+def test_keeps_last_decisions():
+    scheduler = new_scheduler(FakeClock())
+    for _ in range(MAX_DECISIONS + 5):
+        scheduler.next_sleep()
+    result = scheduler.as_dict()
+    assert result["retries"] == MAX_DECISIONS + 5
+    assert len(result["decisions"]) == MAX_DECISIONS
+    assert result["decisions"][-1]["retry"] == MAX_DECISIONS + 5
+
+
+@pytest.mark.parametrize("fast_interval, fast_window, max_interval", [
+    (0, 20, 12),
+    (0.5, -1, 12),
+    (2, 20, 1),
+])
+def test_validate_retry_intervals(fast_interval, fast_window, max_interval):
+    with pytest.raises(ValueError):
+        validate_retry_intervals(fast_interval, fast_window, max_interval)
+    validate_retry_intervals(0.5, 20, 12)
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+
+from ansible_collections.riskident.luks.plugins.module_utils.run_id import (
+    default_run_id,
+    is_process_alive,
+    is_run_alive,
+    process_run_id,
+)
+
+
+def test_default_run_id_is_the_parent_process():
+    assert default_run_id() == process_run_id(os.getppid())
+
+
+def test_process_run_id_has_start_time():
+    pid, _, start_time = process_run_id(os.getpid()).partition("-")
+    assert pid == str(os.getpid())
+    assert start_time.isdigit()
+
+
+def test_run_is_gone_after_exit():
+    proc = subprocess.Popen(["sleep", "30"])
+    run_id = process_run_id(proc.pid)
+    assert is_process_alive(proc.pid)
+    assert is_run_alive(run_id, proc.pid)
+    proc.kill()
+    proc.wait()
+    assert not is_run_alive(run_id, proc.pid)
+
+
+def test_run_is_gone_after_pid_reuse():
+    # Same PID, but another start time
+    assert not is_run_alive("%d-0" % os.getpid(), os.getpid())
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_agent_lease import SSHAgentKeyLease
+from ansible_collections.riskident.luks.plugins.module_utils.run_id import process_run_id
+
+
+class Lease(SSHAgentKeyLease):
+    """Releases the run right away, instead of starting a watcher process
+    that waits for the run to end."""
+
+    def start_watcher(self, remove_key):
+        return None
+
+
+def new_lease(tmp_path, run_pid):
+    return Lease("private key", 3600, process_run_id(run_pid), run_pid, lease_dir=str(tmp_path))
+
+
+def test_key_is_added_once_per_run(tmp_path):
+    added = []
+    for _ in range(3):
+        # Forks of the same run, e.g in different batches of hosts
+        lease = new_lease(tmp_path, os.getpid())
+        lease.acquire(lambda: added.append(True))
+        lease.release(lambda public_key: None, lambda: "public key")
+    assert len(added) == 1
+
+
+def test_key_is_kept_while_run_is_alive(tmp_path):
+    removed = []
+    lease = new_lease(tmp_path, os.getpid())
+    lease.acquire(lambda: None)
+    lease.release(removed.append, lambda: "public key")
+    lease.release_run(removed.append)
+    assert removed == []
+
+
+def test_key_is_removed_when_run_is_gone(tmp_path):
+    run = subprocess.Popen(["sleep", "30"])
+    lease = new_lease(tmp_path, run.pid)
+    lease.acquire(lambda: None)
+    lease.release(lambda public_key: None, lambda: "public key")
+    run.kill()
+    run.wait()
+    removed = []
+    lease.release_run(removed.append)
+    assert removed == ["public key"]
+    # The next run adds the key again
+    added = []
+    new_lease(tmp_path, os.getpid()).acquire(lambda: added.append(True))
+    assert added == [True]
+
+
+def test_public_key_is_derived_once(tmp_path):
+    derived = []
+
+    def derive():
+        derived.append(True)
+        return "public key"
+
+    lease = new_lease(tmp_path, os.getpid())
+    assert lease.public_key(derive) == "public key"
+    assert lease.public_key(derive) == "public key"
+    assert len(derived) == 1
@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+
+import pytest
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_AUTH,
+    REASON_CONFIG,
+    REASON_EXIT_STATUS,
+    REASON_HOSTKEY,
+    REASON_REFUSED,
+    REASON_RESOLUTION,
+    REASON_SSH_CLIENT,
+    REASON_TIMEOUT,
+    REASON_UNREACHABLE,
+    LuksSSHError,
+    classify_error,
+    classify_openssh_output,
+    is_openssh_client_message,
+    is_permanent,
+)
+
+
+@pytest.mark.parametrize("output, reason", [
+    ("ssh: connect to host 10.0.0.1 port 2222: Connection refused\n", REASON_REFUSED),
+    ("kex_exchange_identification: read: Connection reset by peer\n", REASON_REFUSED),
+    ("ssh: connect to host 10.0.0.1 port 2222: Connection timed out\n", REASON_TIMEOUT),
+    ("ssh: connect to host 10.0.0.1 port 2222: No route to host\n", REASON_UNREACHABLE),
+    ("ssh: Could not resolve hostname web1: Name or service not known\n", REASON_RESOLUTION),
+    ("command-line line 0: Bad configuration option: foo\n", REASON_CONFIG),
+    ("Host key verification failed.\n", REASON_HOSTKEY),
+    ("root@10.0.0.1: Permission denied (publickey).\n", REASON_AUTH),
+    ("something else\n", REASON_SSH_CLIENT),
+])
+def test_classify_openssh_output(output, reason):
+    assert classify_openssh_output(output)[0] == reason
+
+
+def test_classify_openssh_output_prefers_connection_errors():
+    # The missing identity file is only warned about before connecting
+    output = (
+        "Warning: Identity file /root/.ssh/luks not accessible: No such file or directory.\n"
+        "ssh: connect to host 10.0.0.1 port 2222: Connection refused\n")
+    assert classify_openssh_output(output) == (
+        REASON_REFUSED, "ssh: connect to host 10.0.0.1 port 2222: Connection refused")
+
+
+def test_classify_openssh_output_message_is_last_line_if_unknown():
+    assert classify_openssh_output("first\nlast\n\n") == (REASON_SSH_CLIENT, "last")
+    assert classify_openssh_output("") == (REASON_SSH_CLIENT, "exited with 255")
+
+
+def test_is_permanent():
+    assert is_permanent(REASON_AUTH)
+    assert is_permanent(REASON_RESOLUTION)
+    assert not is_permanent(REASON_REFUSED)
+    assert not is_permanent(REASON_TIMEOUT)
+
+
+@pytest.mark.parametrize("line", [
+    "Timeout, server 10.0.0.1 not responding.",
+    "ssh: connect to host 10.0.0.1 port 2222: Connection timed out",
+    "client_loop: send disconnect: Broken pipe",
+    "Connection to 10.0.0.1 closed by remote host.",
+    "Warning: Permanently added '[10.0.0.1]:2222' (ED25519) to the list of known hosts.",
+])
+def test_is_openssh_client_message(line):
+    assert is_openssh_client_message(line)
+
+
+@pytest.mark.parametrize("line", [
+    "Please unlock disk sda3_crypt: ",
+    "cryptsetup: ERROR: sda3_crypt: cryptsetup failed, bad password or options?",
+    "Error: Timeout reached while waiting for askpass.",
+])
+def test_is_not_openssh_client_message(line):
+    assert not is_openssh_client_message(line)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (LuksSSHError(REASON_AUTH, "Permission denied"), (REASON_AUTH, None)),
+    (LuksSSHError(REASON_EXIT_STATUS, "cryptroot-unlock failed", exit_status=1), (REASON_EXIT_STATUS, 1)),
+    (subprocess.TimeoutExpired(["ssh"], 10), (REASON_TIMEOUT, None)),
+    (subprocess.CalledProcessError(255, ["ssh"]), (REASON_SSH_CLIENT, 255)),
+    (subprocess.CalledProcessError(1, ["ssh"]), (REASON_EXIT_STATUS, 1)),
+    (TimeoutError(), (REASON_TIMEOUT, None)),
+    (ConnectionRefusedError(), (REASON_UNREACHABLE, None)),
+    (RuntimeError("boom"), ("RuntimeError", None)),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
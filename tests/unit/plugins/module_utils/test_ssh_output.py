@@ -0,0 +1,179 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+import time
+
+import pytest
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_errors import (
+    REASON_STOP_KEYWORD,
+    LuksSSHError,
+)
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_output import (
+    STOP_KEYWORD_GRACE,
+    StopKeywordMatcher,
+    UnlockSession,
+    run_ssh_process,
+)
+
+KEYWORDS = ["bad password", "error", "timeout"]
+
+
+def test_matcher_finds_keyword_case_insensitive():
+    matcher = StopKeywordMatcher(KEYWORDS)
+    assert matcher.feed("cryptsetup: ERROR: sda3_crypt: cryptsetup failed, bad password or options?\n") == "ERROR"
+
+
+def test_matcher_waits_for_complete_lines():
+    matcher = StopKeywordMatcher(KEYWORDS)
+    assert matcher.feed("cryptsetup: bad pass") is None
+    assert matcher.feed("word\n") == "bad password"
+
+
+def test_matcher_flushes_last_line():
+    matcher = StopKeywordMatcher(KEYWORDS)
+    assert matcher.feed("Error") is None
+    assert matcher.flush() == "Error"
+
+
+def test_matcher_skips_client_messages():
+    matcher = StopKeywordMatcher(KEYWORDS)
+    assert matcher.feed("Timeout, server 10.0.0.1 not responding.\n") is None
+    assert matcher.feed("ssh: connect to host 10.0.0.1 port 22: Connection timed out\n") is None
+
+
+def test_matcher_without_client_output():
+    matcher = StopKeywordMatcher(KEYWORDS, client_output=False)
+    assert matcher.feed("Timeout, server 10.0.0.1 not responding.\n") == "Timeout"
+
+
+def test_matcher_without_keywords():
+    matcher = StopKeywordMatcher(["", None])
+    assert matcher.feed("error\n") is None
+    assert matcher.flush() is None
+
+
+def sh(script):
+    return ["sh", "-c", script]
+
+
+def test_run_ssh_process_returns_output():
+    output = run_ssh_process(sh("cat; echo done"), "hunter2\n", StopKeywordMatcher(KEYWORDS))
+    assert output == "hunter2\ndone\n"
+
+
+def test_run_ssh_process_keeps_successful_session():
+    # A stop keyword does not fail a session that exits with 0
+    output = run_ssh_process(sh("echo 'error: retrying'; exit 0"), "", StopKeywordMatcher(KEYWORDS))
+    assert output == "error: retrying\n"
+
+
+def test_run_ssh_process_ignores_keywords_on_client_error():
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run_ssh_process(sh("echo 'error'; exit 255"), "", StopKeywordMatcher(KEYWORDS))
+    assert e.value.returncode == 255
+
+
+def test_run_ssh_process_stops_on_keyword():
+    with pytest.raises(LuksSSHError) as e:
+        run_ssh_process(sh("echo 'bad password'; exit 1"), "", StopKeywordMatcher(KEYWORDS))
+    assert e.value.reason == REASON_STOP_KEYWORD
+    assert e.value.exit_status == 1
+
+
+def test_run_ssh_process_kills_session_after_keyword():
+    start = time.monotonic()
+    with pytest.raises(LuksSSHError) as e:
+        run_ssh_process(sh("echo 'bad password'; sleep 30"), "", StopKeywordMatcher(KEYWORDS), timeout=20)
+    assert e.value.reason == REASON_STOP_KEYWORD
+    assert time.monotonic() - start < STOP_KEYWORD_GRACE + 5
+
+
+def test_run_ssh_process_timeout():
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_ssh_process(sh("sleep 30"), "", StopKeywordMatcher(KEYWORDS), timeout=0.5)
+
+
+def test_run_ssh_process_answers_responder():
+    class Responder:
+        def feed(self, text):
+            return "hunter2\n" if "Please unlock" in text else ""
+
+    output = run_ssh_process(
+        sh("printf 'Please unlock disk sda3_crypt: '; read p; echo \"got $p\""), "",
+        StopKeywordMatcher(KEYWORDS), timeout=10, responder=Responder())
+    assert output == "Please unlock disk sda3_crypt: got hunter2\n"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_session_stops_replying_after_keyword():
+    class Responder:
+        def feed(self, text):
+            return "hunter2\n"
+
+    clock = FakeClock()
+    session = UnlockSession(StopKeywordMatcher(KEYWORDS), Responder(), timeout=10, clock=clock)
+    assert session.feed(b"Please unlock disk sda3_crypt: ") == "hunter2\n"
+    assert session.feed(b"bad password\n") == ""
+    assert session.keyword == "bad password"
+    assert session.time_left() == STOP_KEYWORD_GRACE
+    clock.now += STOP_KEYWORD_GRACE
+    assert session.expired()
+
+
+def test_session_timeout():
+    clock = FakeClock()
+    session = UnlockSession(StopKeywordMatcher(KEYWORDS), timeout=10, clock=clock)
+    assert not session.expired()
+    clock.now += 10
+    assert session.expired()
+    assert session.finish(None) is None
+
+
+def test_session_without_timeout():
+    session = UnlockSession(StopKeywordMatcher(KEYWORDS))
+    session.feed(b"")
+    assert session.time_left() is None
+    assert not session.expired()
+
+
+@pytest.mark.parametrize("exit_status, keyword", [
+    (0, None),
+    (255, None),
+    (1, "error"),
+    (None, "error"),
+])
+def test_session_finish_after_keyword(exit_status, keyword):
+    session = UnlockSession(StopKeywordMatcher(KEYWORDS), client_error_status=255)
+    session.feed(b"error\n")
+    assert session.finish(exit_status) == keyword
+
+
+def test_session_finish_without_client_error_status():
+    # E.g paramiko, where 255 is the exit status of the remote command
+    session = UnlockSession(StopKeywordMatcher(KEYWORDS))
+    session.feed(b"error\n")
+    assert session.finish(255) == "error"
+    assert session.stop_keyword_error(255).exit_status == 255
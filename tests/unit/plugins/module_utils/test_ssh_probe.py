@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from ansible_collections.riskident.luks.plugins.module_utils.ssh_probe import (
+    SSHProbeTimeout,
+    async_wait_for_ssh_banner,
+    wait_for_ssh_banner,
+)
+
+BANNER = "SSH-2.0-dropbear_2022.83"
+
+
+@pytest.fixture
+def ssh_server():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(5)
+
+    def serve():
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return
+            conn.sendall(BANNER.encode() + b"\r\n")
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def run_sync(*args, **kwargs):
+    return wait_for_ssh_banner(*args, **kwargs)
+
+
+def run_async(*args, **kwargs):
+    return asyncio.run(async_wait_for_ssh_banner(*args, **kwargs))
+
+
+@pytest.fixture(params=[run_sync, run_async], ids=["sync", "async"])
+def wait(request):
+    return request.param
+
+
+def test_wait_returns_banner(wait, ssh_server):
+    result = wait("127.0.0.1", ssh_server, timeout=5)
+    assert result.banner == BANNER
+    assert result.attempts == 1
+    assert result.down_at is None
+
+
+def test_wait_ignores_previous_banner(wait, ssh_server):
+    # The port was never seen down, so it may still be the old server
+    with pytest.raises(SSHProbeTimeout) as e:
+        wait("127.0.0.1", ssh_server, timeout=0.5, interval=0.1, previous_banner=BANNER)
+    assert e.value.attempts > 1
+
+
+def test_wait_accepts_new_banner(wait, ssh_server):
+    result = wait("127.0.0.1", ssh_server, timeout=5, previous_banner="SSH-2.0-OpenSSH_9.2p1")
+    assert result.banner == BANNER
+
+
+def test_wait_records_down_port(wait, ssh_server, closed_port):
+    result = wait("127.0.0.1", ssh_server, timeout=5, watch_down_port=closed_port)
+    assert result.down_at is not None
+
+
+def test_wait_timeout(wait, closed_port):
+    with pytest.raises(SSHProbeTimeout) as e:
+        wait("127.0.0.1", closed_port, timeout=0.5, interval=0.1)
+    assert isinstance(e.value.last_error, ConnectionRefusedError)
+    assert e.value.attempts > 1
+
+
+def test_wait_unresolvable(wait):
+    with pytest.raises(SSHProbeTimeout) as e:
+        wait("luks-test.invalid", 22, timeout=30)
+    assert e.value.attempts == 1
+    assert isinstance(e.value.last_error, socket.gaierror)
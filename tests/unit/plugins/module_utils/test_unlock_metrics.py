@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: 2026 Risk.Ident GmbH <contact@riskident.com>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+
+from ansible_collections.riskident.luks.plugins.module_utils.unlock_metrics import (
+    SUMMARY_SUFFIX,
+    UnlockMetrics,
+    render_textfile,
+)
+
+
+def read_events(path, run_id):
+    with open(path, encoding="utf-8") as f:
+        return [event for event in map(json.loads, f) if event['run_id'] == run_id]
+
+
+def metric_lines(content, name):
+    return [line for line in content.splitlines() if line.startswith("riskident_luks_" + name)]
+
+
+def test_labels_on_every_metric(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    metrics = UnlockMetrics(path, "run1", "host1", {"datacenter": "fra1"})
+    metrics.attempt("unlock", 1, 1.0, "timeout")
+    metrics.attempt("unlock", 2, 0.5)
+    metrics.phases({"unlock": {"attempts": 2, "elapsed": 1.5}})
+    metrics.result("unlocked", 10.0, True)
+    content = metrics.read_run_summary().render("run1")
+
+    for line in content.splitlines():
+        if not line.startswith("#"):
+            assert 'datacenter="fra1"' in line, line
+
+
+def test_labels_keep_hosts_apart(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    UnlockMetrics(path, "run1", "host1", {"datacenter": "fra1", "team": "ops"}).result("unlocked", 1.0, True)
+    UnlockMetrics(path, "run1", "host2", {"datacenter": "ber1", "team": "ops"}).result("failed", 2.0, True)
+    content = UnlockMetrics(path, "run1", None).read_run_summary().render("run1")
+
+    assert metric_lines(content, "hosts_total") == [
+        'riskident_luks_hosts_total{datacenter="ber1",result="failed",team="ops"} 1',
+        'riskident_luks_hosts_total{datacenter="fra1",result="unlocked",team="ops"} 1',
+        'riskident_luks_hosts_total{result="skipped",team="ops"} 0',
+    ]
+    # Only the labels that all hosts have in common
+    assert metric_lines(content, "run_info") == ['riskident_luks_run_info{team="ops",run_id="run1"} 1']
+
+
+def test_summary_reads_each_event_once(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    metrics = UnlockMetrics(path, "run1", "host1")
+    other = UnlockMetrics(path, "run2", "host2")
+    metrics.attempt("unlock", 1, 1.0, "refused")
+    other.attempt("unlock", 1, 1.0)
+    metrics.read_run_summary()
+    with open(path + SUMMARY_SUFFIX, encoding="utf-8") as f:
+        assert json.load(f)['offset'] == os.path.getsize(path)
+
+    metrics.attempt("unlock", 2, 0.5)
+    metrics.result("unlocked", 3.0, True)
+    content = metrics.read_run_summary().render("run1")
+
+    assert content == render_textfile(read_events(path, "run1"), "run1")
+    assert 'riskident_luks_attempt_failures_total{error="refused",phase="unlock"} 1' in content
+    assert other.read_run_summary().attempts == {'{"outcome": "success", "phase": "unlock"}': 1}
+
+
+def test_summary_rebuilt_after_rotation(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    metrics = UnlockMetrics(path, "run1", "host1")
+    metrics.result("failed", 1.0, True)
+    metrics.read_run_summary()
+
+    os.rename(path, path + ".1")
+    metrics.result("unlocked", 2.0, True)
+    summary = metrics.read_run_summary()
+
+    assert summary.results == {'{"result": "unlocked"}': 1}
+
+
+def test_partial_line_is_read_later(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    metrics = UnlockMetrics(path, "run1", "host1")
+    metrics.result("unlocked", 1.0, True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"event": "result", "host": "host2", "run_id": "run1", ')
+    assert metrics.read_run_summary().results == {'{"result": "unlocked"}': 1}
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('"result": "failed", "duration": 2.0, "rebooted": true, "time": 1.0}\n')
+    assert metrics.read_run_summary().results == {'{"result": "unlocked"}': 1, '{"result": "failed"}': 1}